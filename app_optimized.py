@@ -1,14 +1,36 @@
 import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 import pandas as pd
 import numpy as np
 from datetime import datetime, date
 import io
+import json
 import os
-from typing import List, Dict, Optional, Tuple
+import time
+from typing import Callable, Iterable, List, Dict, Optional, Tuple
 from dataclasses import dataclass
 import hashlib
+import operator
+import re
+import unicodedata
+import threading
+import zipfile
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
 from pathlib import Path
 
+from xlsx_stream import SheetSchemaError, read_sheet, sheet_fingerprints, sheet_names, usecols_to_indices
+from telemetry import (
+    REGISTRY, MetricsExporter, cache_stats, count_cache_miss, count_cache_request,
+    rerun_trace, span, timed,
+)
+from profiler import profile_to_dir
+from historico import DIMENSIONES, MEDIDAS, HistoryStore
+from jobs import DONE, ERROR, CANCELLED, JobContext, JobQueue
+from bundle import build_bundle
+from snapshot import SnapshotStore
+from cache_policy import cache_policy_stats, versioned_cache
+
 # =============================================================================
 # CONFIGURACIÓN DE RUTAS Y VARIABLES DE ENTORNO
 # =============================================================================
@@ -16,6 +38,7 @@ from pathlib import Path
 # RUTAS BASE DEL PROYECTO
 BASE_DIR = Path(__file__).resolve().parent  # Directorio donde está el script
 DATA_DIR = BASE_DIR / "data"                # Carpeta de datos
+PERIODOS_DIR = DATA_DIR / "periodos"        # Maestros por mes: periodos/<YYYY-MM>/processed
 ASSETS_DIR = BASE_DIR / "assets"            # Carpeta de recursos (logos, etc.)
 
 # VARIABLES DE ENTORNO
@@ -26,6 +49,152 @@ MAESTROS_FILE = os.getenv('MAESTROS_FILE_PATH', str(DATA_DIR / 'maestros.xlsx'))
 MAX_UPLOAD_SIZE = int(os.getenv('MAX_UPLOAD_SIZE_MB', '200'))  
 # Tamaño máximo de archivos subidos en MB
 # Por defecto: 200MB
+
+MASTER_LRU_SIZE = int(os.getenv('MASTER_LRU_SIZE', '3'))
+# Número de maestros mensuales que se mantienen cargados en memoria
+# Por defecto: 3 (mes actual, anterior y uno de margen)
+
+CACHE_VERSIONS = int(os.getenv('CACHE_VERSIONS', '2'))
+# Versiones del maestro (hash) que conservan las cachés de hojas y lookups;
+# las más antiguas se desalojan. Por defecto: 2 (la actual y la anterior)
+
+MASTER_SNAPSHOT = os.getenv('MASTER_SNAPSHOT', '1') == '1'
+MASTER_SNAPSHOT_DIR = os.getenv(
+    'MASTER_SNAPSHOT_DIR', '/dev/shm/incidencias_maestros' if Path('/dev/shm').is_dir() else '/tmp/incidencias_maestros'
+)
+# Maestros procesados compartidos entre procesos de la app (Arrow IPC mapeado en memoria)
+
+MASTER_SNAPSHOT_FORMAT = "m2"
+# Se antepone al hash en la versión de la instantánea: súbelo si cambia el procesado de los maestros
+
+METRICS_DIR = os.getenv('METRICS_DIR', '')
+# Carpeta donde se vuelcan metrics.<pid>.prom (uno por proceso) y reruns.jsonl (vacío = sin volcado a disco)
+
+METRICS_FLUSH_SECONDS = float(os.getenv('METRICS_FLUSH_SECONDS', '30'))
+# Intervalo mínimo entre reescrituras de metrics.<pid>.prom
+
+METRICS_LOG_MAX_MB = float(os.getenv('METRICS_LOG_MAX_MB', '10'))
+# Tamaño a partir del cual rota reruns.jsonl (se conservan 3 rotados; 0 = sin reruns.jsonl)
+
+DEBUG_PANEL = os.getenv('DEBUG_PANEL', '0') == '1'
+# Muestra siempre el panel de telemetría (si no, solo con ?debug=1 en la URL)
+
+PROFILES_DIR = os.getenv('PROFILES_DIR', str(BASE_DIR / 'profiles'))
+# Carpeta de perfiles de recargas (?profile=1 o ?profile=alloc en la URL)
+
+PROFILES_KEEP = int(os.getenv('PROFILES_KEEP', '50'))
+# Perfiles que se conservan en PROFILES_DIR (se borran los más antiguos)
+
+PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', '5'))
+# Intervalo de muestreo del perfilador en milisegundos
+
+PROFILE_ALLOC_TOP = int(os.getenv('PROFILE_ALLOC_TOP', '25'))
+# Número de líneas del informe de asignaciones (tracemalloc) cuando se activa
+
+PREWARM = os.getenv('PREWARM', '1') == '1'
+# Precalienta maestros y lookups una vez por proceso antes de la primera página
+
+READY_FILE = os.getenv('READY_FILE', '/tmp/incidencias_ready.json')
+# Fichero de disponibilidad (estado y duración del precalentamiento) para el healthcheck
+
+COEF_SEGURIDAD_SOCIAL = 1.3195
+# Coste empresa: importe de incidencias y nocturnidad × coeficiente de Seguridad Social
+
+EXPORT_WORKERS = int(os.getenv('EXPORT_WORKERS', '2'))
+# Exportaciones a Excel simultáneas en segundo plano (el resto espera en cola)
+
+EXPORT_JOB_TTL = float(os.getenv('EXPORT_JOB_TTL', '900'))
+# Segundos que se conserva un Excel generado para descargarlo (y reutilizarlo si los datos no cambian)
+
+HISTORICO_DIR = os.getenv('HISTORICO_DIR', str(DATA_DIR / 'historico'))
+# Histórico de exportaciones (Parquet particionado por periodo y jefe)
+
+BUNDLE_WORKERS = int(os.getenv('BUNDLE_WORKERS', '0'))
+# Procesos para el paquete de nóminas por jefe (0 = uno por núcleo)
+
+BUNDLE_DIR = Path(os.getenv('BUNDLE_DIR', '/tmp/incidencias_paquetes'))
+# ZIPs generados del paquete de nóminas (se borran pasado EXPORT_JOB_TTL)
+
+# VALORES PERMITIDOS EN LA TABLA DE INCIDENCIAS
+MOTIVOS_INCIDENCIA = [
+    "Absentismo", "Refuerzo", "Eventos", "Festivos y Fines de Semana", "Permiso retribuido",
+    "Puesto pendiente de cubrir", "Formación", "Otros", "Nocturnidad",
+]
+FACTURABLE_OPCIONES = ["Sí", "No"]
+
+# COLUMNAS QUE CONSERVAN LOS MAESTROS PROCESADOS (tras el cruce con Centros; el resto se descarta)
+COLUMNAS_TRABAJADORES = (
+    'nombre_empleado', 'cat_empleado', 'servicio', 'cod_reg_convenio',
+    'coste_hora', 'centro_preferente', 'nombre_centro_preferente', 'nombre_jefe_ope',
+    'porcen_contrato', 'cod_empresa',
+)
+COLUMNAS_CENTROS = ('cod_centro_preferente', 'desc_centro_preferente', 'codigo_centro', 'nombre_jefe_ope')
+
+# ESQUEMAS DE LAS HOJAS: columnas que la app lee de cada hoja (solo esas se
+# parsean), con su tipo y los nombres alternativos aceptados en la cabecera.
+# La cabecera se compara sin mayúsculas ni tildes y con espacios y guiones
+# bajos equivalentes ('nombre empleado' = 'nombre_empleado'). Tipos:
+# - 'codigo': texto exacto de la celda, normalizado al cargar (un convenio de
+#   14 dígitos no pasa por float)
+# - 'texto', 'numero' (no numérico → nulo) y 'auto' (se infiere de la hoja)
+@dataclass(frozen=True)
+class ColumnaHoja:
+    """Columna declarada de una hoja: nombre en la app, tipo, alias y si es obligatoria."""
+    nombre: str
+    tipo: str = 'texto'
+    alias: Tuple[str, ...] = ()
+    obligatoria: bool = True
+
+ESQUEMAS_HOJAS: Dict[str, Tuple[ColumnaHoja, ...]] = {
+    'Trabajadores': (
+        ColumnaHoja('nombre_empleado', alias=('nombre',)),
+        ColumnaHoja('cat_empleado'),
+        ColumnaHoja('servicio', obligatoria=False),           # si falta, se deduce de la categoría
+        ColumnaHoja('cod_reg_convenio', 'codigo'),
+        ColumnaHoja('coste_hora', 'numero'),
+        ColumnaHoja('centro_preferente', 'codigo'),
+        ColumnaHoja('porcen_contrato', 'numero', obligatoria=False),
+        ColumnaHoja('cod_empresa', 'auto', obligatoria=False),
+        ColumnaHoja('nombre_jefe_ope', obligatoria=False),    # si falta, el de su centro
+    ),
+    'Centros': (
+        ColumnaHoja('cod_centro_preferente', 'codigo'),
+        ColumnaHoja('desc_centro_preferente'),
+        ColumnaHoja('nombre_jefe_ope'),
+        ColumnaHoja('fecha_baja_centro', 'auto', obligatoria=False),
+    ),
+    'tarifas_incidencias': (
+        ColumnaHoja('Descripción', alias=('categoria',)),
+        ColumnaHoja('cod_convenio', 'codigo'),
+        ColumnaHoja('tarifa_noct', 'numero'),
+    ),
+    'cuenta_motivos': (
+        ColumnaHoja('Motivo'),
+        ColumnaHoja('desc_cuenta'),
+    ),
+}
+
+# Tipo declarado → tipo forzado en el lector (xlsx_stream); None = inferir
+TIPOS_LECTURA = {'codigo': 'str', 'texto': 'str', 'numero': 'float', 'auto': None}
+
+# HOJAS DE LOS MAESTROS Y SU PROCEDENCIA: las HOJAS_TARIFARIO se toman de
+# tarifarios.xlsx si está junto al maestro (y las contiene); el resto, del maestro
+HOJAS_MAESTRO = ('Trabajadores', 'Centros', 'tarifas_incidencias', 'cuenta_motivos')
+HOJAS_TARIFARIO = ('tarifas_incidencias', 'cuenta_motivos')
+FICHERO_TARIFARIO = "tarifarios.xlsx"
+
+# GRAFO DE DEPENDENCIAS: estructura derivada → hojas de las que se construye.
+# Cada hoja tiene su huella; al cambiar una, solo se reconstruye lo que depende de ella
+DEPENDENCIAS: Dict[str, Tuple[str, ...]] = {
+    'centros': ('Centros',),
+    'centros_lookup': ('Centros',),
+    'trabajadores': ('Trabajadores', 'Centros'),
+    'empleado_lookup': ('Trabajadores', 'Centros'),
+    'particiones': ('Trabajadores', 'Centros'),
+    'tarifas': ('tarifas_incidencias',),
+    'motivos': ('cuenta_motivos',),
+}
+
 # =============================================================================
 # FUNCIONES DE ESTILO Y LOGO
 # =============================================================================
@@ -131,29 +300,111 @@ def _add_logo_and_css():
 # FUNCIONES DE CARGA OPTIMIZADAS
 # =============================================================================
 
-@st.cache_data
-def _load_single_sheet(file_path: str, sheet_name: str, file_hash: str, **kwargs) -> pd.DataFrame:
+def _clave_cabecera(nombre: str) -> str:
+    """Cabecera comparable: sin tildes ni mayúsculas, espacios y guiones bajos unificados."""
+    texto = unicodedata.normalize('NFKD', str(nombre)).encode('ascii', 'ignore').decode('ascii')
+    return re.sub(r'[\s_]+', ' ', texto).strip().lower()
+
+def resolve_sheet_schema(sheet_name: str, cabecera: List[str], file_path: str = "") -> Dict[str, str]:
+    """
+    Resuelve el esquema de una hoja contra su cabecera.
+    
+    Parámetros:
+    - sheet_name (str): Hoja de ESQUEMAS_HOJAS
+    - cabecera (List[str]): Nombres de columna de la hoja
+    - file_path (str): Libro (solo para el mensaje de error)
+    
+    Retorna:
+    - Dict[str, str]: Columna de la cabecera → nombre declarado (las opcionales
+      que faltan no aparecen)
+    
+    Lanza SheetSchemaError con cada columna obligatoria que falta, los nombres
+    que se aceptan para ella y la cabecera encontrada.
+    """
+    por_clave: Dict[str, str] = {}
+    for nombre in cabecera:
+        por_clave.setdefault(_clave_cabecera(nombre), nombre)
+
+    proyeccion, faltan = {}, []
+    for columna in ESQUEMAS_HOJAS[sheet_name]:
+        aceptados = (columna.nombre,) + columna.alias
+        encontrada = next((por_clave[k] for k in map(_clave_cabecera, aceptados) if k in por_clave), None)
+        if encontrada is not None:
+            proyeccion[encontrada] = columna.nombre
+        elif columna.obligatoria:
+            faltan.append(" o ".join(f"'{n}'" for n in aceptados))
+    if faltan:
+        libro = f" de {Path(file_path).name}" if file_path else ""
+        vista = ", ".join(map(str, cabecera[:40])) + (f" … (+{len(cabecera) - 40})" if len(cabecera) > 40 else "")
+        raise SheetSchemaError(
+            f"La hoja '{sheet_name}'{libro} no tiene las columnas obligatorias: {'; '.join(faltan)}. "
+            f"Cabecera encontrada: {vista or '(vacía)'}"
+        )
+    return proyeccion
+
+@versioned_cache("sheet", max_versions=CACHE_VERSIONS, group_by=("sheet_name",))
+def _load_single_sheet(file_path: str, sheet_name: str, file_hash: str, columns: Optional[Tuple[str, ...]] = None, **kwargs) -> pd.DataFrame:
     """
     Carga una hoja específica de un archivo Excel con caché.
     
     Parámetros:
     - file_path (str): Ruta completa al archivo Excel
     - sheet_name (str): Nombre de la hoja a cargar
-    - file_hash (str): Hash MD5 del archivo para invalidar caché si cambia
-    - **kwargs: Argumentos adicionales para pd.read_excel (ej: usecols, skiprows)
+    - file_hash (str): Huella de la hoja (master_sources): la caché guarda la
+      versión actual y la anterior de cada hoja por separado
+    - columns (Optional[Tuple[str, ...]]): Columnas a leer (None = las del
+      esquema de la hoja en ESQUEMAS_HOJAS, o todas si no tiene)
+    - **kwargs: usecols como rango de letras (ej: "A:C"); cualquier otro
+      argumento de pd.read_excel fuerza la lectura con openpyxl
     
     Retorna:
-    - pd.DataFrame: Datos de la hoja o DataFrame vacío si hay error
+    - pd.DataFrame: Datos de la hoja o DataFrame vacío si hay error; con
+      esquema, solo sus columnas y con los nombres declarados
     
-    Nota: Usa @st.cache_data para evitar recargas innecesarias
+    Nota: Cacheada por versión del maestro (versioned_cache). Los .xlsx se
+    leen con el lector en streaming (xlsx_stream), que no construye la rejilla
+    de celdas de openpyxl. Con esquema, la proyección se resuelve al leer la
+    cabecera: las demás columnas no se parsean y, si falta una obligatoria, se
+    lanza SheetSchemaError antes de leer ninguna fila. Las columnas 'codigo'
+    se leen como texto y salen ya normalizadas (normalize_code_series; nulos
+    siguen nulos).
     """
     try:
-        return pd.read_excel(file_path, sheet_name=sheet_name, engine="openpyxl", **kwargs)
+        usecols = kwargs.pop('usecols', None)
+        esquema = ESQUEMAS_HOJAS.get(sheet_name, ()) if columns is None and usecols is None else ()
+        codigos = [c.nombre for c in ESQUEMAS_HOJAS.get(sheet_name, ()) if c.tipo == 'codigo']
+        tipos = {c.nombre: TIPOS_LECTURA[c.tipo] for c in esquema if TIPOS_LECTURA[c.tipo]} or {c: 'str' for c in codigos}
+        if not kwargs and str(file_path).lower().endswith(('.xlsx', '.xlsm')) and (usecols is None or isinstance(usecols, str)):
+            if esquema:
+                projection = lambda cabecera: resolve_sheet_schema(sheet_name, cabecera, file_path)
+            else:
+                projection = list(columns) if columns else (usecols_to_indices(usecols) if usecols else None)
+            df = read_sheet(file_path, sheet_name, columns=projection, dtypes=tipos)
+        else:
+            if usecols is not None:
+                kwargs['usecols'] = usecols
+            elif columns:
+                kwargs['usecols'] = list(columns)
+            df = pd.read_excel(file_path, sheet_name=sheet_name, engine="openpyxl", **kwargs)
+            if esquema:
+                proyeccion = resolve_sheet_schema(sheet_name, [str(c) for c in df.columns], file_path)
+                df = df[list(proyeccion)].rename(columns=proyeccion)
+                for columna in (c.nombre for c in esquema if c.tipo == 'numero'):
+                    if columna in df.columns:
+                        df[columna] = pd.to_numeric(df[columna], errors='coerce')
+        if esquema and df.columns.empty:
+            resolve_sheet_schema(sheet_name, [], file_path)  # hoja sin cabecera
+        for columna in codigos:
+            if columna in df.columns:
+                df[columna] = normalize_code_series(df[columna]).where(df[columna].notna())
+        return df
+    except SheetSchemaError:
+        raise
     except Exception as e:
         st.error(f"Error cargando hoja '{sheet_name}': {e}")
         return pd.DataFrame()
 
-@st.cache_data
+@versioned_cache("sheet_names", max_versions=CACHE_VERSIONS)
 def _get_sheet_names(file_path: str, file_hash: str) -> List[str]:
     """
     Obtiene lista de nombres de hojas en un Excel.
@@ -166,19 +417,18 @@ def _get_sheet_names(file_path: str, file_hash: str) -> List[str]:
     - List[str]: Lista de nombres de hojas o lista vacía si hay error
     """
     try:
-        with pd.ExcelFile(file_path, engine="openpyxl") as xls:
-            return xls.sheet_names
+        return sheet_names(file_path)
     except Exception:
         return []
 
-@st.cache_data
+@versioned_cache("tarifa_lookup", max_versions=CACHE_VERSIONS)
 def build_tarifa_lookup(file_path: str, file_hash: str) -> Dict[Tuple[str, str], float]:
     """
     Construye tabla de búsqueda O(1) para tarifas de nocturnidad.
     
     Parámetros:
-    - file_path (str): Ruta al archivo maestro
-    - file_hash (str): Hash para caché
+    - file_path (str): Libro con la hoja tarifas_incidencias (maestro o tarifario)
+    - file_hash (str): Huella de la hoja (versión de 'tarifas' en DEPENDENCIAS)
     
     Retorna:
     - Dict[(categoria, convenio), tarifa]: 
@@ -187,104 +437,133 @@ def build_tarifa_lookup(file_path: str, file_hash: str) -> Dict[Tuple[str, str],
     
     Procesamiento:
     - Normaliza categorías a mayúsculas
-    - Convierte códigos de convenio de notación científica a string
-    - Elimina prefijos de categoría (ej: "h ASL" → "ASL")
+    - Códigos de convenio como texto exacto (leídos sin pasar por float)
+    - Si una (categoría, convenio) se repite, cuenta la última fila
     """
-    # ✅ FIX 1: Cambiar skiprows=3 a skiprows=0 para leer headers correctos
-    df_tarifas = _load_single_sheet(file_path, 'tarifas_incidencias', file_hash, usecols="A:C")
-    lookup = {}
-    
-    if not df_tarifas.empty:
-        df_tarifas.columns = [str(c).strip() for c in df_tarifas.columns]
-
-    if {'Descripción', 'cod_convenio', 'tarifa_noct'}.issubset(df_tarifas.columns):
-        for _, row in df_tarifas.iterrows():
-            try:
-                # Normalizar categoría
-                categoria_norm = str(row['Descripción']).strip().upper()
-                
-                # ✅ FIX 2: Convertir convenio a entero para eliminar notación científica
-                # Esto convierte "9.91002E+13" a "99100165012016"
-                convenio_raw = row['cod_convenio']
-                if pd.notna(convenio_raw):
-                    try:
-                        # Convertir a float primero, luego a int, luego a string
-                        convenio_norm = str(int(float(convenio_raw)))
-                    except:
-                        convenio_norm = str(convenio_raw).strip()
-                else:
-                    convenio_norm = ""
-                
-                tarifa = float(row['tarifa_noct'])
-                
-                if categoria_norm and convenio_norm and pd.notna(tarifa):
-                    lookup[(categoria_norm, convenio_norm)] = tarifa
-            except Exception:
-                continue    
-
-    return lookup
-
-@st.cache_data
-def build_empleado_lookup(df_trabajadores: pd.DataFrame, file_hash: str) -> Dict[str, Dict]:
+    # Solo Descripción, cod_convenio y tarifa_noct (ESQUEMAS_HOJAS), por nombre
+    df_tarifas = _load_single_sheet(file_path, 'tarifas_incidencias', file_hash)
+    if df_tarifas.empty:
+        return {}
+
+    # cod_convenio ya llega como texto normalizado (tipo 'codigo')
+    categorias = df_tarifas['Descripción'].astype("string").str.strip().str.upper()
+    convenios = df_tarifas['cod_convenio'].astype("string")
+    tarifas = pd.to_numeric(df_tarifas['tarifa_noct'], errors='coerce')
+    validas = categorias.fillna("").ne("") & convenios.fillna("").ne("") & tarifas.notna()
+    return dict(zip(zip(categorias[validas], convenios[validas]), tarifas[validas].astype(float)))
+
+# Campos del lookup de empleados: clave en get_empleado_info → (columna de
+# Trabajadores, valor por defecto si falta o está vacía)
+CAMPOS_EMPLEADO: Dict[str, Tuple[str, object]] = {
+    'cat_empleado': ('cat_empleado', ''),
+    'servicio': ('servicio', ''),
+    'cod_reg_convenio': ('cod_reg_convenio', ''),
+    'coste_hora': ('coste_hora', 0.0),
+    'centro_preferente': ('centro_preferente', ''),
+    'nombre_centro_preferente': ('nombre_centro_preferente', ''),
+    'nombre_jefe_ope': ('nombre_jefe_ope', ''),
+    'porcen_contrato': ('porcen_contrato', ''),
+    'cod_empresa': ('cod_empresa', ''),
+}
+_CAMPOS_NUMERICOS = ('coste_hora', 'porcen_contrato')
+
+@versioned_cache("empleado_lookup", max_versions=CACHE_VERSIONS)
+def build_empleado_lookup(_df_trabajadores: pd.DataFrame, file_hash: str) -> Dict:
     """
-    Construye diccionario de búsqueda rápida de empleados.
+    Construye las columnas del lookup de empleados (ver EmpleadoLookup).
     
     Parámetros:
-    - df_trabajadores (pd.DataFrame): DataFrame con datos de trabajadores
-    - file_hash (str): Hash para caché
+    - _df_trabajadores (pd.DataFrame): DataFrame con datos de trabajadores
+      (con guion bajo: no forma parte de la clave de caché)
+    - file_hash (str): Versión de 'empleado_lookup' (huellas de Trabajadores y
+      Centros); es la clave de caché, ya que df_trabajadores sale de esas hojas
     
     Retorna:
-    - Dict[nombre_empleado, info_dict]: 
-      Diccionario donde la clave es el nombre del empleado
-      y el valor es un dict con toda su información
-    
-    Valores por defecto en info_dict:
-    - servicio: ''
-    - cat_empleado: ''
-    - cod_crown: ''
-    - centro_preferente: ''
-    - coste_hora: 0.0
-    """
-    lookup = {}
-    if df_trabajadores is None or df_trabajadores.empty:
-        return lookup
-
-    df = df_trabajadores.copy()
-    name_col = None
-    for c in df.columns:
-        if c.lower().strip() in ('nombre_empleado', 'nombre empleado', 'nombre'):
-            name_col = c
-            break
+    - Dict: ids (nombre → fila) y columnas (campo → array tipado): float64 para
+      los numéricos y (códigos int32, valores) para los de texto
+    
+    Si un nombre se repite cuenta la última fila, como en la hoja.
+    """
+    vacio = {'ids': {}, 'columnas': {}}
+    if _df_trabajadores is None or _df_trabajadores.empty:
+        return vacio
+    name_col = next((c for c in _df_trabajadores.columns
+                     if c.lower().strip() in ('nombre_empleado', 'nombre empleado', 'nombre')), None)
     if name_col is None:
-        return lookup
-
-    for _, empleado in df.iterrows():
-        info = empleado.to_dict()
-        default_values = {
-            'servicio': '',
-            'cat_empleado': '',
-            'cod_crown': '',
-            'centro_preferente': '',
-            'nombre_centro_preferente': '',
-            'nombre_jefe_ope': '',
-            'coste_hora': 0.0,
-            'cod_reg_convenio': '',
-            'porcen_contrato': '',
-            'cod_empresa': ''
-        }
-    # Construir la lista de diccionarios de una vez
-    records = df.to_dict('records')
-    for info in records:
-        # Aplicar la lógica de valores por defecto de manera eficiente
-        for key, default_value in default_values.items():
-            if key not in info or pd.isna(info.get(key)) or info.get(key) == '':
-                info[key] = default_value
-        
-        lookup_key = info.get(name_col, '')
-        if lookup_key: # Asegurar que la clave no esté vacía
-            lookup[lookup_key] = info
+        return vacio
+
+    df = _df_trabajadores[_df_trabajadores[name_col].notna() & (_df_trabajadores[name_col] != '')]
+    df = df.drop_duplicates(name_col, keep='last')
+    columnas = {}
+    for campo, (columna, _) in CAMPOS_EMPLEADO.items():
+        serie = df[columna] if columna in df.columns else pd.Series(np.nan, index=df.index)
+        if campo in _CAMPOS_NUMERICOS:
+            columnas[campo] = pd.to_numeric(serie, errors='coerce').to_numpy(dtype='float64')
+        else:
+            codigos, valores = pd.factorize(serie.where(serie != ''))
+            columnas[campo] = (codigos.astype('int32'), np.asarray(valores, dtype=object))
+    return {'ids': dict(zip(df[name_col], range(len(df)))), 'columnas': columnas}
+
+class EmpleadoLookup:
+    """
+    Lookup compacto de empleados: nombre → fila en arrays tipados por campo.
+    
+    Solo guarda los CAMPOS_EMPLEADO (no toda la fila de Trabajadores). get()
+    devuelve el mismo dict que antes con los valores por defecto aplicados;
+    rows()/column() sirven a las exportaciones sin pasar por un dict por fila.
+    
+    Parámetros:
+    - datos (Dict): Resultado de build_empleado_lookup
+    """
+
+    def __init__(self, datos: Dict):
+        self._ids: Dict[str, int] = datos['ids']
+        self._columnas: Dict = datos['columnas']
+
+    def __len__(self) -> int:
+        return len(self._ids)
 
-    return lookup
+    def __contains__(self, nombre: str) -> bool:
+        return nombre in self._ids
+
+    def rows(self, nombres: Iterable[str]) -> np.ndarray:
+        """Fila de cada nombre (-1 si no está en el maestro)."""
+        return np.fromiter((self._ids.get(n, -1) for n in nombres), dtype='int64')
+
+    def column(self, campo: str, filas: np.ndarray) -> np.ndarray:
+        """
+        Valores de un campo para varias filas (rows()), con el valor por
+        defecto de CAMPOS_EMPLEADO en las que faltan.
+        """
+        defecto = CAMPOS_EMPLEADO[campo][1]
+        if not self._ids:
+            return np.full(len(filas), defecto, dtype=object)
+        if campo in _CAMPOS_NUMERICOS:
+            valores = self._columnas[campo][filas]
+            faltan = (filas < 0) | np.isnan(valores)
+            if isinstance(defecto, float):
+                return np.where(faltan, defecto, valores)
+            salida = valores.astype(object)
+            salida[faltan] = defecto
+            return salida
+        codigos, categorias = self._columnas[campo]
+        codigos = codigos[filas]
+        faltan = (filas < 0) | (codigos < 0)
+        salida = np.full(len(filas), defecto, dtype=object)
+        salida[~faltan] = categorias[codigos[~faltan]]
+        return salida
+
+    def get(self, nombre: str) -> Dict:
+        """Campos de un empleado (nombre_empleado incluido) o dict vacío si no existe."""
+        fila = self._ids.get(nombre)
+        if fila is None:
+            return {}
+        filas = np.array([fila])
+        info = {'nombre_empleado': nombre}
+        for campo in CAMPOS_EMPLEADO:
+            valor = self.column(campo, filas)[0]
+            info[campo] = valor.item() if isinstance(valor, np.generic) else valor
+        return info
 
 def _get_file_hash(file_path: str) -> str:
     """
@@ -307,14 +586,70 @@ def _get_file_hash(file_path: str) -> str:
     except Exception:
         return "ERROR_HASH"
 
-@st.cache_data
+@dataclass(frozen=True)
+class FuenteHoja:
+    """Libro del que se lee una hoja del maestro y huella de la hoja en él."""
+    ruta: str
+    huella: str
+
+def _sheet_fingerprints(file_path: str, hojas: Iterable[str]) -> Dict[str, str]:
+    """Huellas por hoja; un libro que no es .xlsx usa su MD5 en todas las hojas."""
+    hojas = list(hojas)
+    try:
+        return sheet_fingerprints(file_path, hojas)
+    except (zipfile.BadZipFile, KeyError, OSError):
+        huella = _get_file_hash(file_path)
+        return {hoja: huella for hoja in hojas}
+
+def master_sources(file_path: str) -> Dict[str, FuenteHoja]:
+    """
+    Procedencia y huella de cada hoja que la aplicación lee de un maestro.
+    
+    Parámetros:
+    - file_path (str): Ruta al maestro
+    
+    Retorna:
+    - Dict[str, FuenteHoja]: hoja de HOJAS_MAESTRO → libro y huella (las que
+      no existen no aparecen; vacío si el maestro no existe)
+    
+    Procesamiento:
+    - HOJAS_TARIFARIO: de tarifarios.xlsx si está en la misma carpeta que el
+      maestro y contiene la hoja; si no, del propio maestro
+    - Huellas del directorio central del zip (sheet_fingerprints): cuestan lo
+      mismo con 1 KB que con 50 MB, así que se calculan en cada recarga
+    """
+    if not Path(file_path).is_file():
+        return {}
+    fuentes = {}
+    tarifario = Path(file_path).with_name(FICHERO_TARIFARIO)
+    if tarifario.is_file() and tarifario != Path(file_path):
+        for hoja, huella in _sheet_fingerprints(str(tarifario), HOJAS_TARIFARIO).items():
+            fuentes[hoja] = FuenteHoja(str(tarifario), huella)
+    pendientes = [hoja for hoja in HOJAS_MAESTRO if hoja not in fuentes]
+    for hoja, huella in _sheet_fingerprints(file_path, pendientes).items():
+        fuentes[hoja] = FuenteHoja(str(file_path), huella)
+    return fuentes
+
+def master_version(file_path: str, fuentes: Dict[str, FuenteHoja]) -> str:
+    """
+    Versión del maestro completo: cambia si cambia cualquiera de sus hojas.
+    
+    Retorna:
+    - str: MD5 de las fuentes y huellas, o "FILE_NOT_FOUND" si el maestro no existe
+    """
+    if not Path(file_path).is_file():
+        return "FILE_NOT_FOUND"
+    firma = "|".join(f"{hoja}={f.ruta}:{f.huella}" for hoja, f in sorted(fuentes.items()))
+    return hashlib.md5(f"{file_path}|{firma}".encode("utf-8")).hexdigest()
+
+@versioned_cache("centros_lookup", max_versions=CACHE_VERSIONS)
 def get_centros_lookup(file_path: str, file_hash: str) -> pd.DataFrame:
     """
     Carga y procesa el maestro de centros para búsqueda rápida.
     
     Parámetros:
     - file_path (str): Ruta al archivo maestro
-    - file_hash (str): Hash para caché
+    - file_hash (str): Huella de la hoja Centros
     
     Retorna:
     - pd.DataFrame con columnas:
@@ -323,7 +658,7 @@ def get_centros_lookup(file_path: str, file_hash: str) -> pd.DataFrame:
       - nombre_centro_display: "Código - Descripción" para mostrar
     
     Procesamiento:
-    - Convierte códigos a string sin decimales
+    - Códigos ya como texto sin decimales (normalizados al leer la hoja)
     - Crea campo display combinado para selectboxes
     """
     df = preprocess_centros(_load_single_sheet(file_path, 'Centros', file_hash))
@@ -331,7 +666,6 @@ def get_centros_lookup(file_path: str, file_hash: str) -> pd.DataFrame:
         return pd.DataFrame({'cod_centro_preferente': [], 'desc_centro_preferente': []})
     
     if 'cod_centro_preferente' in df.columns and 'desc_centro_preferente' in df.columns:
-        df['cod_centro_preferente'] = df['cod_centro_preferente'].apply(lambda x: str(int(float(x))) if pd.notna(x) and str(x).replace('.', '').replace('-', '').isdigit() else str(x))
         df['nombre_centro_display'] = df['cod_centro_preferente'] + ' - ' + df['desc_centro_preferente'].astype(str)
         return df[['cod_centro_preferente', 'desc_centro_preferente', 'nombre_centro_display']].drop_duplicates().reset_index(drop=True)
     return pd.DataFrame({'cod_centro_preferente': [], 'desc_centro_preferente': [], 'nombre_centro_display': []})
@@ -353,7 +687,7 @@ def preprocess_centros(df: pd.DataFrame) -> pd.DataFrame:
     Procesamiento:
     1. Filtra filas sin cod_centro_preferente
     2. Elimina centros con fecha_baja_centro
-    3. Normaliza códigos (sin decimales)
+    3. Códigos ya normalizados al leer la hoja (_load_single_sheet)
     4. Elimina columnas innecesarias
     5. Excluye jefes específicos (Angel Alcalde, Esther Martin, Julio)
     6. Crea alias 'codigo_centro'
@@ -375,10 +709,7 @@ def preprocess_centros(df: pd.DataFrame) -> pd.DataFrame:
     if 'fecha_baja_centro' in df.columns:
         df = df[df['fecha_baja_centro'].isna()]
     
-    # 3. NORMALIZAR: cod_centro_preferente como string sin decimales
-    df['cod_centro_preferente'] = df['cod_centro_preferente'].apply(
-        lambda x: str(int(float(x))) if pd.notna(x) and str(x).replace('.', '').replace('-', '').isdigit() else str(x)
-    )
+    # 3. cod_centro_preferente ya viene como texto sin decimales (tipo 'codigo')
     
     # 4. ELIMINAR COLUMNAS: fecha_alta_centro, fecha_baja_centro, almacen_centro
     columns_to_drop = ['fecha_alta_centro', 'fecha_baja_centro', 'almacen_centro']
@@ -442,6 +773,87 @@ def preprocess_maestro_centros(df: pd.DataFrame) -> pd.DataFrame:
 def preprocess_tarifas_incidencias(df: pd.DataFrame) -> pd.DataFrame:
     return df if df is not None else pd.DataFrame()
 
+def optimize_dtypes(df: pd.DataFrame, columnas: Iterable[str], max_ratio: float = 0.5) -> pd.DataFrame:
+    """
+    Reduce la memoria de un maestro ya procesado.
+    
+    Parámetros:
+    - df (pd.DataFrame): Maestro procesado
+    - columnas (Iterable[str]): Columnas que se conservan (el resto se descarta)
+    - max_ratio (float): Un texto pasa a categórico si valores distintos / filas <= max_ratio
+    
+    Retorna:
+    - pd.DataFrame: Copia con texto repetido como category, enteros reducidos al
+      tipo más pequeño y floats a float32 solo si no pierden precisión (los
+      costes por hora no lo permiten: se quedan en float64)
+    """
+    if df is None or df.empty:
+        return df
+    df = df[[c for c in df.columns if c in set(columnas)]].copy()
+    for columna in df.columns:
+        serie = df[columna]
+        if pd.api.types.is_integer_dtype(serie) and not pd.api.types.is_extension_array_dtype(serie):
+            df[columna] = pd.to_numeric(serie, downcast='integer')
+        elif pd.api.types.is_float_dtype(serie):
+            reducida = serie.astype('float32')
+            if np.array_equal(reducida.astype('float64').to_numpy(), serie.to_numpy(), equal_nan=True):
+                df[columna] = reducida
+        elif (pd.api.types.is_string_dtype(serie) or serie.dtype == object) and len(serie):
+            if serie.nunique(dropna=True) <= max_ratio * len(serie):
+                df[columna] = serie.astype('category')
+    return df
+
+def memory_report(frames: Dict[str, pd.DataFrame]) -> pd.DataFrame:
+    """
+    Memoria por columna de varios DataFrames (memory_usage con deep=True).
+    
+    Parámetros:
+    - frames (Dict[str, pd.DataFrame]): Nombre → DataFrame
+    
+    Retorna:
+    - pd.DataFrame: Frame, Columna, Tipo, Filas, Bytes (el índice cuenta como columna "(índice)")
+    """
+    filas = []
+    for nombre, df in frames.items():
+        if df is None:
+            continue
+        uso = df.memory_usage(deep=True, index=True)
+        for columna, bytes_ in uso.items():
+            tipo = 'índice' if columna == 'Index' else str(df[columna].dtype)
+            filas.append({'Frame': nombre, 'Columna': '(índice)' if columna == 'Index' else columna,
+                          'Tipo': tipo, 'Filas': len(df), 'Bytes': int(bytes_)})
+    return pd.DataFrame(filas, columns=['Frame', 'Columna', 'Tipo', 'Filas', 'Bytes'])
+
+_CODIGO_DECIMAL = re.compile(r"^(-?\d+)\.0+$")
+
+def normalize_code_series(serie: pd.Series) -> pd.Series:
+    """
+    Normaliza códigos (centros, convenios...) a texto sin decimales, vectorizado.
+    
+    Parámetros:
+    - serie (pd.Series): Códigos como números, texto o mezcla
+    
+    Retorna:
+    - pd.Series: Texto ("110001.0" → "110001", 110001 → "110001"); nulos → ""
+    """
+    texto = serie.astype("string").str.strip().fillna("")
+    return texto.str.replace(_CODIGO_DECIMAL.pattern, r"\1", regex=True).astype(object)
+
+def normalize_code(valor) -> str:
+    """
+    Versión escalar de normalize_code_series (un código suelto, p. ej. en búsquedas).
+    
+    Los enteros y floats enteros se formatean como entero sin pasar por texto
+    científico; un float de hasta 15 dígitos (convenios de 14) es exacto.
+    """
+    if valor is None or (not isinstance(valor, str) and pd.isna(valor)):
+        return ""
+    if isinstance(valor, (int, np.integer)) and not isinstance(valor, bool):
+        return str(int(valor))
+    if isinstance(valor, (float, np.floating)) and float(valor).is_integer():
+        return str(int(valor))
+    return _CODIGO_DECIMAL.sub(r"\1", str(valor).strip())
+
 # =============================================================================
 # MODELO DE DATOS
 # =============================================================================
@@ -584,43 +996,186 @@ class Incidencia:
 # DATA MANAGER OPTIMIZADO
 # =============================================================================
 
+@dataclass
+class JefePartition:
+    """
+    Vista de los datos maestros de la zona de un jefe de operaciones.
+    
+    Atributos:
+    - jefe (str): Nombre del jefe ("" = todas las zonas)
+    - empleados (List[str]): Nombres de los trabajadores de sus centros, ordenados
+    - empleados_con_centro (List[str]): Mismos trabajadores como 'código_centro - NOMBRE'
+    - centros (List[str]): Códigos de sus centros, ordenados
+    - centros_display (List[str]): Sus centros como 'Código - Nombre', ordenados
+    """
+    jefe: str
+    empleados: List[str]
+    empleados_con_centro: List[str]
+    centros: List[str]
+    centros_display: List[str]
+
 class OptimizedDataManager:
     """
     Gestor centralizado de acceso a datos maestros con caché.
     
     Atributos:
     - file_path (str): Ruta al archivo maestros.xlsx
-    - file_hash (str): Hash MD5 del archivo
+    - fuentes (Dict[str, FuenteHoja]): Libro y huella de cada hoja (master_sources)
+    - file_hash (str): Versión del maestro (master_version: cambia con cualquier hoja)
     - _df_centros (DataFrame): Caché de datos de centros
     - _df_trabajadores (DataFrame): Caché de datos de trabajadores
     - _tarifa_lookup (Dict): Lookup de tarifas O(1)
-    - _empleado_lookup (Dict): Lookup de empleados O(1)
+    - _empleado_lookup (EmpleadoLookup): Lookup de empleados O(1)
     - _jefes_list (List): Lista de supervisores
     - _empleados_list (List): Lista de nombres de empleados
     - _centros_list (List): Lista de códigos de centros
+    - _particiones (Dict): jefe → JefePartition ("" = todas las zonas)
     - centros_lookup_df (DataFrame): DataFrame para búsqueda de centros
+    - origen (str): "excel" si este proceso parseó el maestro, "instantánea"
+      si lo tomó de la instantánea compartida (SnapshotStore)
+    - reutilizadas (List[str]): Estructuras de DEPENDENCIAS tomadas del gestor
+      anterior del mismo maestro porque sus hojas no cambiaron
     """
-    def __init__(self, file_path: str = 'data/maestros.xlsx'):
+
+    # Estructura derivada (DEPENDENCIAS) → atributos del gestor que la guardan
+    ATRIBUTOS_DERIVADOS: Dict[str, Tuple[str, ...]] = {
+        'centros': ('_df_centros', '_jefes_list', '_centros_list'),
+        'centros_lookup': ('centros_lookup_df',),
+        'trabajadores': ('_df_trabajadores', '_empleados_list'),
+        'empleado_lookup': ('_empleado_lookup',),
+        'particiones': ('_particiones',),
+        'tarifas': ('_tarifa_lookup',),
+    }
+
+    def __init__(self, file_path: str = MAESTROS_FILE, fuentes: Optional[Dict[str, FuenteHoja]] = None,
+                 anterior: Optional["OptimizedDataManager"] = None):
         """
         Inicializa el gestor y construye cachés.
         
         Parámetros:
         - file_path (str): Ruta al archivo maestro
+        - fuentes (Optional[Dict[str, FuenteHoja]]): master_sources ya calculado
+        - anterior (Optional[OptimizedDataManager]): Gestor de una versión previa
+          del mismo maestro; se reutiliza lo que no depende de hojas cambiadas
         """        
         
         self.file_path = file_path
+        self.fuentes = master_sources(file_path) if fuentes is None else fuentes
+        self.file_hash = master_version(file_path, self.fuentes)
         self._df_centros = None
         self._df_trabajadores = None
-        self.file_hash = _get_file_hash(self.file_path)
 
         self._tarifa_lookup = None
         self._empleado_lookup = None
         self._jefes_list = None
         self._empleados_list = None
         self._centros_list = None
-        
-        self.centros_lookup_df = get_centros_lookup(self.file_path, self.file_hash)
+        self._particiones = None
+        self._memory_report = None
+        self.centros_lookup_df = None
+        self.origen = "excel"
+
+        self.reutilizadas = self._reuse_derived(anterior)
+        compartido = None if self.reutilizadas else self._load_snapshot()
+        if self.centros_lookup_df is None:
+            fuente = self.source('Centros')
+            self.centros_lookup_df = get_centros_lookup(fuente.ruta, fuente.huella)
         self._ensure_cache_built()
+        if compartido is None:
+            self._publish_snapshot()
+
+    def source(self, hoja: str) -> FuenteHoja:
+        """Libro y huella de una hoja (si no existe, el maestro con huella "SIN_HOJA")."""
+        return self.fuentes.get(hoja) or FuenteHoja(self.file_path, "SIN_HOJA")
+
+    def load_sheet(self, hoja: str, **kwargs) -> pd.DataFrame:
+        """Hoja del maestro desde su libro de origen, cacheada por su huella (_load_single_sheet)."""
+        fuente = self.source(hoja)
+        return _load_single_sheet(fuente.ruta, hoja, fuente.huella, **kwargs)
+
+    def version(self, derivado: str) -> str:
+        """
+        Versión de una estructura de DEPENDENCIAS: la huella de su hoja o, si
+        depende de varias, el MD5 de sus huellas.
+        """
+        huellas = [self.source(hoja).huella for hoja in DEPENDENCIAS[derivado]]
+        if len(huellas) == 1:
+            return huellas[0]
+        return hashlib.md5("|".join(huellas).encode("utf-8")).hexdigest()
+
+    def _reuse_derived(self, anterior: Optional["OptimizedDataManager"]) -> List[str]:
+        """
+        Toma del gestor anterior las estructuras cuyas hojas no cambiaron.
+        
+        Retorna:
+        - List[str]: Estructuras reutilizadas (el resto se construye al usarse)
+        """
+        if anterior is None:
+            return []
+        reutilizadas = []
+        for derivado, atributos in self.ATRIBUTOS_DERIVADOS.items():
+            if anterior.version(derivado) == self.version(derivado):
+                for atributo in atributos:
+                    setattr(self, atributo, getattr(anterior, atributo))
+                reutilizadas.append(derivado)
+        return reutilizadas
+
+    @property
+    def snapshot_version(self) -> Optional[str]:
+        """Versión de la instantánea compartida (None si el maestro no se pudo leer)."""
+        if self.file_hash in ("FILE_NOT_FOUND", "ERROR_HASH"):
+            return None
+        return f"{MASTER_SNAPSHOT_FORMAT}-{self.file_hash}"
+
+    def _load_snapshot(self) -> Optional[Dict[str, pd.DataFrame]]:
+        """
+        Toma centros, trabajadores y tarifas de la instantánea compartida si
+        otro proceso ya publicó esta versión (sin parsear el Excel).
+        
+        Retorna:
+        - Dict[str, pd.DataFrame]: Frames de la instantánea, o None si no hay
+        """
+        if not MASTER_SNAPSHOT or self.snapshot_version is None:
+            return None
+        with span("master_snapshot_load"):
+            frames = _get_snapshot_store().load(self.snapshot_version)
+        if frames is None:
+            return None
+        self._df_trabajadores = frames['trabajadores']
+        self._df_centros = frames['centros']
+        self.centros_lookup_df = frames['centros_lookup']
+        tarifas = frames['tarifas']
+        self._tarifa_lookup = dict(zip(zip(tarifas['categoria'], tarifas['convenio']), tarifas['tarifa']))
+        self.origen = "instantánea"
+        return frames
+
+    def _publish_snapshot(self) -> None:
+        """Publica los maestros procesados para los demás procesos (si falla, solo no se comparten)."""
+        if not MASTER_SNAPSHOT or self.snapshot_version is None:
+            return
+        claves = list(self._tarifa_lookup)
+        tarifas = pd.DataFrame({
+            'categoria': [c for c, _ in claves], 'convenio': [v for _, v in claves],
+            'tarifa': [self._tarifa_lookup[k] for k in claves],
+        })
+        with span("master_snapshot_publish"):
+            _get_snapshot_store().publish(self.snapshot_version, {
+                'trabajadores': self.df_trabajadores,
+                'centros': self.df_centros,
+                'centros_lookup': self.centros_lookup_df,
+                'tarifas': tarifas,
+            })
+
+    @property
+    def periodo(self) -> str:
+        """
+        Periodo del maestro cargado.
+        
+        Retorna:
+        - str: "YYYY-MM" si viene de data/periodos/<YYYY-MM>/processed, "" si es el maestro general
+        """
+        path = Path(self.file_path)
+        return path.parent.parent.name if path.parent.name == 'processed' else ""
 
     @property
     def df_centros(self) -> pd.DataFrame:
@@ -632,9 +1187,8 @@ class OptimizedDataManager:
         - pd.DataFrame: DataFrame procesado de centros
         """
         if self._df_centros is None:
-            df = _load_single_sheet(self.file_path, 'Centros', self.file_hash)
-            df = preprocess_centros(df)
-            self._df_centros = df
+            df = preprocess_centros(self.load_sheet('Centros'))
+            self._df_centros = optimize_dtypes(df, COLUMNAS_CENTROS)
         return self._df_centros
 
     @property
@@ -647,17 +1201,12 @@ class OptimizedDataManager:
         - pd.DataFrame: DataFrame procesado con info completa
         """
         if self._df_trabajadores is None:
-            df = _load_single_sheet(self.file_path, 'Trabajadores', self.file_hash)
-            df = preprocess_trabajadores(df)
+            df = preprocess_trabajadores(self.load_sheet('Trabajadores'))
 
             if not df.empty and not self.df_centros.empty and 'centro_preferente' in df.columns:
-                # Normalizar centro_preferente como string
-                df['centro_preferente'] = df['centro_preferente'].apply(
-                    lambda x: str(int(float(x))) if pd.notna(x) and str(x).replace('.', '').replace('-', '').isdigit() else str(x)
-                )
-
+                # centro_preferente ya es texto sin decimales (normalizado al leer la hoja)
                 # ✅ FIX: Merge correcto con nombres exactos de columnas
-                centros_temp = self.df_centros[['codigo_centro', 'nombre_jefe_ope', 'desc_centro_preferente']].copy()
+                centros_temp = self.df_centros[['codigo_centro', 'nombre_jefe_ope', 'desc_centro_preferente']].astype(object)
 
                 df = pd.merge(
                     df,
@@ -680,15 +1229,18 @@ class OptimizedDataManager:
                 # Limpiar columnas duplicadas del merge
                 df = df.drop(columns=[col for col in ['codigo_centro_x', 'codigo_centro_y', 'codigo_centro'] if col in df.columns], errors='ignore')
 
-            self._df_trabajadores = df
+            self._df_trabajadores = optimize_dtypes(df, COLUMNAS_TRABAJADORES)
             
         return self._df_trabajadores
 
     def _ensure_cache_built(self):
         if self._tarifa_lookup is None:
-            self._tarifa_lookup = build_tarifa_lookup(self.file_path, self.file_hash)
+            fuente = self.source('tarifas_incidencias')
+            self._tarifa_lookup = build_tarifa_lookup(fuente.ruta, fuente.huella)
         if self._empleado_lookup is None:
-            self._empleado_lookup = build_empleado_lookup(self.df_trabajadores, self.file_hash)
+            self._empleado_lookup = EmpleadoLookup(
+                build_empleado_lookup(self.df_trabajadores, self.version('empleado_lookup'))
+            )
 
         if self._jefes_list is None or self._centros_list is None:
             jefes = set()
@@ -719,6 +1271,82 @@ class OptimizedDataManager:
             else:
                 self._empleados_list = []
 
+        if self._particiones is None:
+            self._particiones = self._build_partitions()
+
+    def _employee_name_column(self) -> Optional[str]:
+        for c in self.df_trabajadores.columns:
+            if c.lower().strip() in ('nombre_empleado', 'nombre empleado', 'nombre'):
+                return c
+        return None
+
+    def _build_partitions(self) -> Dict[str, JefePartition]:
+        """
+        Particiona trabajadores y centros por nombre_jefe_ope (una vez, al cargar).
+        
+        Retorna:
+        - Dict[str, JefePartition]: Una partición por jefe más la global bajo ""
+        
+        Procesamiento:
+        - Centros: jefe de la hoja Centros
+        - Trabajadores: jefe de su centro preferente (ya unido en df_trabajadores)
+        - Los trabajadores sin jefe solo aparecen en la partición global
+        """
+        particiones = {
+            "": JefePartition(
+                jefe="",
+                empleados=self._empleados_list or [],
+                empleados_con_centro=self._employees_with_centro_all(),
+                centros=self._centros_list or [],
+                centros_display=self.get_centros_crown_with_names()[1:],
+            )
+        }
+        centros = self.df_centros
+        if centros.empty or 'nombre_jefe_ope' not in centros.columns:
+            return particiones
+
+        centros = centros[['codigo_centro', 'nombre_jefe_ope']].dropna().astype({'codigo_centro': str}).drop_duplicates()
+        centros_por_jefe = centros.groupby('nombre_jefe_ope')['codigo_centro'].agg(lambda c: sorted(c.unique()))
+        display = centros.merge(
+            self.centros_lookup_df, left_on='codigo_centro', right_on='cod_centro_preferente', how='inner'
+        ) if 'nombre_centro_display' in self.centros_lookup_df.columns else pd.DataFrame(columns=['nombre_jefe_ope', 'nombre_centro_display'])
+        display_por_jefe = display.groupby('nombre_jefe_ope')['nombre_centro_display'].agg(lambda d: sorted(d.unique()))
+
+        empleados_por_jefe = pd.Series(dtype=object)
+        con_centro_por_jefe = pd.Series(dtype=object)
+        name_col = self._employee_name_column()
+        trabajadores = self.df_trabajadores
+        if name_col and {'nombre_jefe_ope', 'centro_preferente'} <= set(trabajadores.columns):
+            trabajadores = trabajadores[[name_col, 'centro_preferente', 'nombre_jefe_ope']].dropna(subset=[name_col, 'nombre_jefe_ope']).astype(object)
+            trabajadores = trabajadores.assign(
+                _con_centro=trabajadores['centro_preferente'].astype(str) + ' - ' + trabajadores[name_col].astype(str)
+            )
+            agrupado = trabajadores.groupby('nombre_jefe_ope')
+            empleados_por_jefe = agrupado[name_col].agg(lambda n: sorted(n.unique()))
+            con_centro_por_jefe = agrupado['_con_centro'].agg(lambda n: sorted(n.unique()))
+
+        for jefe in self._jefes_list or []:
+            particiones[jefe] = JefePartition(
+                jefe=jefe,
+                empleados=empleados_por_jefe.get(jefe, []),
+                empleados_con_centro=con_centro_por_jefe.get(jefe, []),
+                centros=centros_por_jefe.get(jefe, []),
+                centros_display=display_por_jefe.get(jefe, []),
+            )
+        return particiones
+
+    def get_partition(self, jefe: str = "") -> JefePartition:
+        """
+        Datos maestros de la zona de un jefe.
+        
+        Parámetros:
+        - jefe (str): Nombre del jefe; "" o desconocido = todas las zonas
+        
+        Retorna:
+        - JefePartition: Partición del jefe o la global como respaldo
+        """
+        return self._particiones.get(jefe) or self._particiones[""]
+
     def get_precio_nocturnidad(self, categoria: str, cod_convenio: str) -> float:
         """
         Obtiene tarifa de nocturnidad con búsqueda O(1).
@@ -732,7 +1360,7 @@ class OptimizedDataManager:
         
         Procesamiento:
         - Normaliza categoría (mayúsculas, quita prefijos)
-        - Convierte convenio de notación científica
+        - Normaliza convenio con normalize_code (sin pasar por float)
         """
         # Normalizar categoría
         categoria_norm = str(categoria).strip().upper() if pd.notna(categoria) else ""
@@ -745,14 +1373,7 @@ class OptimizedDataManager:
             if len(parts) == 2 and len(parts[0]) == 1:
                 categoria_norm = parts[1]
         
-        # ✅ FIX 2: Normalizar convenio como entero (para eliminar notación científica)
-        if pd.notna(cod_convenio) and cod_convenio != '':
-            try:
-                convenio_norm = str(int(float(cod_convenio)))
-            except:
-                convenio_norm = str(cod_convenio).strip()
-        else:
-            convenio_norm = ""
+        convenio_norm = normalize_code(cod_convenio)
         
         if not categoria_norm or not convenio_norm:
             return 0.0
@@ -769,7 +1390,26 @@ class OptimizedDataManager:
         Retorna:
         - Dict: Información del empleado o dict vacío
         """
-        return self._empleado_lookup.get(nombre_empleado, {})
+        return self._empleado_lookup.get(nombre_empleado)
+
+    @property
+    def empleado_lookup(self) -> 'EmpleadoLookup':
+        """Lookup de empleados (para leer campos de muchas filas a la vez)."""
+        return self._empleado_lookup
+
+    def memory_report(self) -> pd.DataFrame:
+        """
+        Memoria de los DataFrames de este maestro, por columna (ver memory_report).
+        
+        Los maestros no cambian una vez cargados: se calcula una sola vez.
+        """
+        if self._memory_report is None:
+            self._memory_report = memory_report({
+                'Trabajadores': self.df_trabajadores,
+                'Centros': self.df_centros,
+                'Centros (lookup)': self.centros_lookup_df,
+            })
+        return self._memory_report
 
     def get_jefes(self) -> List[str]:
         """
@@ -780,22 +1420,35 @@ class OptimizedDataManager:
         """
         return self._jefes_list or []
 
-    def get_all_employees(self) -> List[str]:
+    def get_all_employees(self, jefe: str = "") -> List[str]:
         """
-        Retorna lista de todos los empleados.
+        Retorna lista de empleados.
+        
+        Parámetros:
+        - jefe (str): Limita a la zona del jefe ("" = todos)
         
         Retorna:
         - List[str]: Nombres ordenados alfabéticamente
         """
+        if jefe:
+            return self.get_partition(jefe).empleados
         return self._empleados_list or []
     
-    def get_all_employees_with_centro(self) -> List[str]:
+    def get_all_employees_with_centro(self, jefe: str = "") -> List[str]:
         """
         Retorna empleados con formato 'código_centro - NOMBRE'.
         
+        Parámetros:
+        - jefe (str): Limita a la zona del jefe ("" = todos)
+        
         Retorna:
         - List[str]: Lista formateada sin duplicados
         """        
+        if self._particiones is not None:
+            return self.get_partition(jefe).empleados_con_centro
+        return self._employees_with_centro_all()
+
+    def _employees_with_centro_all(self) -> List[str]:
         if self.df_trabajadores.empty:
             return []
         
@@ -809,8 +1462,9 @@ class OptimizedDataManager:
             return self.get_all_employees()
         
         # Crear set para evitar duplicados
+        # Sin centro preferente: " - NOMBRE" (siguen siendo seleccionables)
         empleados_serie = (
-            self.df_trabajadores['centro_preferente'].astype(str) + 
+            self.df_trabajadores['centro_preferente'].astype(object).fillna('').astype(str) + 
             ' - ' + 
             self.df_trabajadores[name_col].astype(str) # <--- 1. FIX: Asegurar que el nombre también es string        )
         )
@@ -849,26 +1503,1088 @@ class OptimizedDataManager:
         
         return sorted(filtered_df[name_col].dropna().unique().tolist())
 
-    def get_centros_crown(self) -> List[str]:
+    def get_centros_crown(self, jefe: str = "") -> List[str]:
         """
         Retorna códigos de centros para selectbox.
         
+        Parámetros:
+        - jefe (str): Limita a la zona del jefe ("" = todos)
+        
         Retorna:
         - List[str]: [""] + lista de códigos
         """
+        if jefe:
+            return [""] + self.get_partition(jefe).centros
         return [""] + [str(centro) for centro in (self._centros_list or [])]
     
-    def get_centros_crown_with_names(self) -> List[str]:
+    def get_centros_crown_with_names(self, jefe: str = "") -> List[str]:
         """
         Retorna centros con formato 'Código - Nombre'.
         
+        Parámetros:
+        - jefe (str): Limita a la zona del jefe ("" = todos)
+        
         Retorna:
         - List[str]: Lista formateada para display
         """        
+        if jefe:
+            return [""] + self.get_partition(jefe).centros_display
         if self.centros_lookup_df.empty:
             return [""]
         return [""] + sorted(self.centros_lookup_df['nombre_centro_display'].tolist())
 
+# =============================================================================
+# MAESTROS POR PERIODO (LRU)
+# =============================================================================
+
+def periodo_imputacion(imputacion: str, anio: Optional[int] = None) -> str:
+    """
+    Periodo "YYYY-MM" de un mes de imputación.
+    
+    Parámetros:
+    - imputacion (str): Mes de imputación (ej: "07-Julio") o "" si no hay
+    - anio (Optional[int]): Año del periodo (por defecto, el año en curso)
+    
+    Retorna:
+    - str: "YYYY-MM", o "" si la imputación no indica un mes
+    """
+    mes = str(imputacion).split('-', 1)[0].strip()
+    if not (mes.isdigit() and 1 <= int(mes) <= 12):
+        return ""
+    return f"{anio or date.today().year}-{int(mes):02d}"
+
+def resolve_maestros_path(imputacion: str, anio: Optional[int] = None) -> str:
+    """
+    Resuelve el maestro a usar para un mes de imputación.
+    
+    Parámetros:
+    - imputacion (str): Mes de imputación (ej: "07-Julio") o "" si no hay
+    - anio (Optional[int]): Año del periodo (por defecto, el año en curso)
+    
+    Retorna:
+    - str: data/periodos/<YYYY-MM>/processed/maestros.xlsx de ese año, o
+      MAESTROS_FILE si el ETL no ha construido el periodo. Nunca se toma el
+      mismo mes de otro año: tendría trabajadores, centros y tarifas de
+      entonces, y las fechas sin año se completarían con el año equivocado
+      (periodo_referencia)
+    """
+    periodo = periodo_imputacion(imputacion, anio)
+    if periodo:
+        ruta = PERIODOS_DIR / periodo / "processed" / "maestros.xlsx"
+        if ruta.is_file():
+            return str(ruta)
+    return MAESTROS_FILE
+
+class MasterDataLRU:
+    """
+    Caché LRU acotada de gestores de datos maestros, compartida entre sesiones.
+    
+    Atributos:
+    - max_size (int): Número máximo de maestros en memoria
+    - _entries (OrderedDict): (ruta, versión) → OptimizedDataManager, del menos al más reciente
+    - _lock (threading.Lock): Protege el acceso desde sesiones concurrentes
+    - _building (Dict): (ruta, versión) → threading.Event de los gestores en construcción
+    
+    Uso: Cambiar entre el mes anterior y el actual no vuelve a parsear los libros
+    mientras ambos sigan en la caché. Si cambia alguna hoja (maestro o
+    tarifario), cambia la versión y se construye un gestor nuevo que sustituye
+    al anterior y solo reconstruye lo que depende de las hojas cambiadas.
+    
+    Los gestores se construyen fuera del candado: parsear un periodo no bloquea
+    a las sesiones que piden otros ya cargados. Quien pide un gestor que otra
+    sesión está construyendo espera a ese y no lo parsea por segunda vez.
+    """
+    def __init__(self, max_size: int = MASTER_LRU_SIZE):
+        self.max_size = max(1, max_size)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._building: Dict[Tuple[str, str], threading.Event] = {}
+
+    def get(self, file_path: str) -> OptimizedDataManager:
+        """
+        Devuelve el gestor del maestro indicado, construyéndolo si no está en caché.
+        
+        Parámetros:
+        - file_path (str): Ruta al maestro
+        
+        Retorna:
+        - OptimizedDataManager: Gestor listo para usar
+        """
+        fuentes = master_sources(str(file_path))
+        key = (str(file_path), master_version(str(file_path), fuentes))
+        count_cache_request("master")
+        while True:
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    return self._entries[key]
+                en_curso = self._building.get(key)
+                if en_curso is None:
+                    en_curso = self._building[key] = threading.Event()
+                    # La versión anterior de este maestro se sustituye: el nuevo
+                    # gestor reutiliza lo que no depende de las hojas que cambiaron
+                    anteriores = [k for k in self._entries if k[0] == key[0]]
+                    anterior = self._entries[anteriores[-1]] if anteriores else None
+                    break
+            # Otra sesión lo está construyendo: se espera y se vuelve a mirar
+            # (si su construcción falló, esta sesión lo intenta de nuevo)
+            en_curso.wait()
+
+        count_cache_miss("master")
+        manager = None
+        try:
+            manager = OptimizedDataManager(str(file_path), fuentes=fuentes, anterior=anterior)
+        finally:
+            with self._lock:
+                del self._building[key]
+                if manager is not None:
+                    for k in [k for k in self._entries if k[0] == key[0]]:
+                        del self._entries[k]
+                    self._entries[key] = manager
+                    while len(self._entries) > self.max_size:
+                        self._entries.popitem(last=False)
+            en_curso.set()
+        return manager
+
+    def loaded(self) -> List[str]:
+        """Rutas de los maestros actualmente en memoria (del menos al más reciente)."""
+        with self._lock:
+            return [path for path, _ in self._entries]
+
+    def managers(self) -> List[OptimizedDataManager]:
+        """Gestores actualmente en memoria (del menos al más reciente)."""
+        with self._lock:
+            return list(self._entries.values())
+
+def _get_snapshot_store() -> SnapshotStore:
+    """Instantáneas de maestros compartidas por todos los procesos de la máquina."""
+    return SnapshotStore(MASTER_SNAPSHOT_DIR, keep=MASTER_LRU_SIZE)
+
+@st.cache_resource
+def _get_master_lru() -> MasterDataLRU:
+    """Instancia única de la LRU de maestros para todo el proceso."""
+    return MasterDataLRU(MASTER_LRU_SIZE)
+
+def get_data_manager(imputacion: str = "") -> OptimizedDataManager:
+    """
+    Obtiene el gestor de datos del periodo seleccionado.
+    
+    Parámetros:
+    - imputacion (str): Mes de imputación (ej: "07-Julio")
+    
+    Retorna:
+    - OptimizedDataManager: Gestor del maestro del periodo (desde la LRU)
+    """
+    return _get_master_lru().get(resolve_maestros_path(imputacion))
+
+# =============================================================================
+# PRECALENTAMIENTO Y DISPONIBILIDAD
+# =============================================================================
+
+def prewarm_master_paths() -> List[str]:
+    """
+    Maestros que se precargan al arrancar.
+    
+    Retorna:
+    - List[str]: MAESTROS_FILE (el que abre toda sesión nueva) y los periodos
+      más recientes hasta llenar la LRU (MASTER_LRU_SIZE)
+    """
+    rutas = [MAESTROS_FILE] if Path(MAESTROS_FILE).is_file() else []
+    if PERIODOS_DIR.is_dir():
+        periodos = sorted(
+            (p for p in PERIODOS_DIR.glob("*/processed/maestros.xlsx") if p.is_file()),
+            key=lambda p: p.parent.parent.name,
+            reverse=True
+        )
+        rutas.extend(str(p) for p in periodos[:max(0, MASTER_LRU_SIZE - len(rutas))])
+    return rutas
+
+def warm_data_manager(data_manager: OptimizedDataManager) -> None:
+    """Construye todas las cachés perezosas de un gestor (tarifas, empleados, jefes, centros)."""
+    data_manager.get_jefes()
+    data_manager.get_all_employees()
+    data_manager.get_all_employees_with_centro()
+    data_manager.get_centros_crown()
+    data_manager.get_centros_crown_with_names()
+
+def write_ready_file(estado: Dict, path: str = READY_FILE) -> None:
+    """Escribe el fichero de disponibilidad de forma atómica (nunca queda a medias)."""
+    if not path:
+        return
+    destino = Path(path)
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    temporal = destino.with_name(destino.name + ".tmp")
+    temporal.write_text(json.dumps(estado, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(temporal, destino)
+
+@st.cache_resource(show_spinner="⏳ Preparando datos maestros...")
+def _prewarm_process() -> Dict:
+    """
+    Precalienta el proceso una sola vez (la primera recarga de cualquier sesión).
+    
+    Retorna:
+    - Dict: Estado escrito en READY_FILE:
+      status ("ready" | "error"), pid, started_at, finished_at, seconds,
+      masters (ruta, periodo, segundos, trabajadores), history y error si lo hay
+    
+    Procesamiento:
+    1. Marca el fichero de disponibilidad como "warming"
+    2. Carga cada maestro en la LRU compartida y construye sus lookups
+    3. Agrega el cubo del histórico de exportaciones
+    4. Marca "ready" con la duración total (o "error": la app sigue
+       funcionando con carga perezosa)
+    """
+    inicio = time.perf_counter()
+    estado = {'status': 'warming', 'pid': os.getpid(), 'started_at': datetime.now().isoformat(timespec='seconds'), 'masters': []}
+    write_ready_file(estado)
+    try:
+        for ruta in prewarm_master_paths():
+            t0 = time.perf_counter()
+            with span("prewarm"):
+                data_manager = _get_master_lru().get(ruta)
+                warm_data_manager(data_manager)
+            estado['masters'].append({
+                'ruta': ruta,
+                'periodo': data_manager.periodo,
+                'seconds': round(time.perf_counter() - t0, 3),
+                'trabajadores': len(data_manager.get_all_employees()),
+            })
+        t0 = time.perf_counter()
+        with span("prewarm"):
+            cubo = _get_history_store().cube()
+        estado['history'] = {'seconds': round(time.perf_counter() - t0, 3), 'filas_cubo': len(cubo)}
+        estado['status'] = 'ready'
+    except Exception as e:
+        estado['status'] = 'error'
+        estado['error'] = f"{type(e).__name__}: {e}"
+    estado['finished_at'] = datetime.now().isoformat(timespec='seconds')
+    estado['seconds'] = round(time.perf_counter() - inicio, 3)
+    write_ready_file(estado)
+    return estado
+
+# =============================================================================
+# VALIDACIÓN COLUMNAR
+# =============================================================================
+
+# Regla → (columna de la tabla, mensaje). Las cinco primeras son los campos
+# obligatorios de Incidencia.is_valid; el resto son reglas entre campos.
+VALIDATION_RULES: Dict[str, Tuple[str, str]] = {
+    'trabajador': ("Trabajador", "Falta Trabajador"),
+    'facturable': ("Facturable", "Falta Facturable"),
+    'motivo': ("Motivo", "Falta Motivo"),
+    'codigo_crown_destino': ("Código Crown Destino", "Falta Crown Destino"),
+    'fecha': ("Fecha", "Falta Fecha"),
+    'nocturnidad_sin_tarifa': ("Nocturnidad_horas", "Nocturnidad sin tarifa para la categoría y convenio"),
+}
+VALIDATION_REQUIRED_FIELDS = ('trabajador', 'facturable', 'motivo', 'codigo_crown_destino', 'fecha')
+
+@dataclass
+class ValidationResult:
+    """
+    Resultado de validar una lista de incidencias de una sola pasada.
+    
+    Atributos:
+    - errores (pd.DataFrame): Una columna booleana por regla de VALIDATION_RULES,
+      una fila por incidencia (misma posición que en la lista); True = incumple
+    - precio_nocturnidad (np.ndarray): Tarifa de nocturnidad de cada incidencia
+    """
+    errores: pd.DataFrame
+    precio_nocturnidad: np.ndarray
+
+    @property
+    def validas(self) -> np.ndarray:
+        """Máscara booleana de incidencias que cumplen todas las reglas."""
+        return ~self.errores.to_numpy(dtype=bool).any(axis=1)
+
+    @property
+    def n_validas(self) -> int:
+        return int(self.validas.sum())
+
+    @property
+    def n_incompletas(self) -> int:
+        return len(self.errores) - self.n_validas
+
+    def filtrar(self, incidencias: List['Incidencia']) -> List['Incidencia']:
+        """Devuelve solo las incidencias válidas, en el orden original."""
+        return [inc for inc, ok in zip(incidencias, self.validas) if ok]
+
+    def resumen(self) -> pd.Series:
+        """Número de incidencias que incumplen cada regla (solo reglas con errores)."""
+        conteo = self.errores.sum()
+        return conteo[conteo > 0].rename(index={regla: VALIDATION_RULES[regla][1] for regla in conteo.index})
+
+    def estado(self) -> List[str]:
+        """Texto de estado por incidencia: "✅" o "⚠️ " con los errores encontrados."""
+        mensajes = np.array([VALIDATION_RULES[regla][1] for regla in self.errores.columns], dtype=object)
+        return [
+            "⚠️ " + ", ".join(mensajes[fila]) if fila.any() else "✅"
+            for fila in self.errores.to_numpy(dtype=bool)
+        ]
+
+    def informe(self, incidencias: List['Incidencia']) -> pd.DataFrame:
+        """
+        Informe completo de errores: una fila por (incidencia, regla incumplida).
+        
+        Retorna:
+        - pd.DataFrame: Fila (1-based), Trabajador, Campo, Error
+        """
+        filas, reglas = np.nonzero(self.errores.to_numpy(dtype=bool))
+        nombres = self.errores.columns.to_numpy()[reglas]
+        return pd.DataFrame({
+            'Fila': filas + 1,
+            'Trabajador': [incidencias[i].trabajador for i in filas],
+            'Campo': [VALIDATION_RULES[regla][0] for regla in nombres],
+            'Error': [VALIDATION_RULES[regla][1] for regla in nombres],
+        })
+
+def _vacios(valores: List) -> np.ndarray:
+    """Máscara de valores nulos, NaN o cadenas vacías (ignorando espacios)."""
+    return np.fromiter(
+        (v is None or v != v or not str(v).strip() for v in valores),
+        dtype=bool, count=len(valores),
+    )
+
+@timed("validation")
+def validate_incidencias(incidencias: List['Incidencia'], data_manager: 'OptimizedDataManager') -> ValidationResult:
+    """
+    Valida todas las incidencias por columnas en lugar de objeto a objeto.
+    
+    Parámetros:
+    - incidencias (List[Incidencia]): Lista completa (o una página)
+    - data_manager (OptimizedDataManager): Para las tarifas de nocturnidad
+    
+    Retorna:
+    - ValidationResult: Máscaras por regla y tarifa de nocturnidad por fila
+    
+    Procesamiento:
+    1. Extrae de una vez los campos necesarios, por columnas
+    2. Una máscara por campo obligatorio (nulo o vacío)
+    3. Tarifa de nocturnidad una vez por (categoría, convenio) distinto
+    4. Reglas entre campos (numpy): horas de nocturnidad sin tarifa
+    """
+    campos = list(VALIDATION_REQUIRED_FIELDS) + ['nocturnidad_horas', 'categoria', 'cod_reg_convenio']
+    # Una lista por campo: no crea una tupla por incidencia (evita pasadas del GC)
+    columnas = {campo: list(map(operator.attrgetter(campo), incidencias)) for campo in campos}
+
+    errores = {campo: _vacios(columnas[campo]) for campo in VALIDATION_REQUIRED_FIELDS}
+
+    claves = list(zip(columnas['categoria'], columnas['cod_reg_convenio']))
+    tarifas = {clave: data_manager.get_precio_nocturnidad(*clave) for clave in set(claves)}
+    precio_nocturnidad = np.fromiter((tarifas[clave] for clave in claves), dtype=float, count=len(claves))
+
+    nocturnidad = pd.to_numeric(pd.Series(columnas['nocturnidad_horas'], dtype=object), errors='coerce')
+    errores['nocturnidad_sin_tarifa'] = (nocturnidad.fillna(0.0).to_numpy(dtype=float) > 0) & (precio_nocturnidad <= 0)
+
+    return ValidationResult(
+        errores=pd.DataFrame(errores, columns=list(VALIDATION_RULES)),
+        precio_nocturnidad=precio_nocturnidad,
+    )
+
+# =============================================================================
+# FECHAS Y PERIODOS
+# =============================================================================
+# La columna Fecha es texto libre. Formatos reconocidos (día/mes/año con "/" o
+# "."; el mes y el año que falten se toman del otro extremo del rango o del
+# periodo de imputación):
+#   "15/07", "15/07/2025", "15 de julio", "2025-07-15"  → un día
+#   "01/07-15/07", "1-15/07", "del 1 al 15"             → rango (ambos incluidos)
+#   "1, 3 y 5/07", "01/07; 03/07-05/07"                 → lista de días o rangos
+#   "julio", "mes completo"                             → el mes entero
+# Un guion entre dos números sueltos ("01-07") es un rango de días, no una fecha.
+
+MESES = {
+    'enero': 1, 'febrero': 2, 'marzo': 3, 'abril': 4, 'mayo': 5, 'junio': 6, 'julio': 7,
+    'agosto': 8, 'septiembre': 9, 'setiembre': 9, 'octubre': 10, 'noviembre': 11, 'diciembre': 12,
+}
+_MESES_RE = "|".join(MESES)
+_FECHA_TOKEN = r"(\d{1,2})(?:[/.](\d{1,2})(?:[/.](\d{2,4}))?)?"
+_FECHA_TRAMO = rf"^(?:del?\s+|desde\s+|el\s+|d[ií]as?\s+)?{_FECHA_TOKEN}(?:\s*(?:-|al|a|hasta)\s*{_FECHA_TOKEN})?$"
+_FECHA_MES = rf"^(?:(?:el\s+|todo\s+el\s+)?mes(?:\s+completo)?|({_MESES_RE}))(?:\s+(?:de\s+)?(\d{{4}}))?$"
+_FECHA_SEPARADOR_LISTA = r"\s*(?:[,;+]|\by\b)\s*"
+
+
+def periodo_referencia(imputacion: str, periodo: str = "") -> Tuple[int, int]:
+    """
+    Año y mes con que se completan las fechas que no los indican.
+    
+    Parámetros:
+    - imputacion (str): Mes de imputación (ej: "07-Julio")
+    - periodo (str): "YYYY-MM" del maestro cargado ("" si es el general)
+    
+    Retorna:
+    - Tuple[int, int]: (año, mes). El año sale del periodo del maestro o, si no
+      hay, del año en curso; el mes, de la imputación o del periodo
+    """
+    hoy = date.today()
+    anio, mes = hoy.year, hoy.month
+    if re.fullmatch(r"\d{4}-\d{2}", periodo or ""):
+        anio, mes = int(periodo[:4]), int(periodo[5:])
+    mes_imputacion = str(imputacion).split('-', 1)[0].strip()
+    if mes_imputacion.isdigit() and 1 <= int(mes_imputacion) <= 12:
+        mes = int(mes_imputacion)
+    return anio, mes
+
+
+def _mes_a_numero(match: re.Match) -> str:
+    return f"/{MESES[match.group(1)]}" + (f"/{match.group(2)}" if match.group(2) else "")
+
+
+def _fechas_desde_partes(dia: pd.Series, mes: pd.Series, anio: pd.Series) -> pd.Series:
+    """Construye datetime64 desde partes numéricas; las combinaciones imposibles quedan NaT."""
+    anio = anio.where(anio >= 100, anio + 2000)
+    partes = pd.DataFrame({'year': anio, 'month': mes, 'day': dia})
+    validas = partes.notna().all(axis=1) & mes.between(1, 12) & dia.between(1, 31)
+    fechas = pd.Series(pd.NaT, index=partes.index, dtype='datetime64[ns]')
+    if validas.any():
+        fechas[validas] = pd.to_datetime(partes[validas].astype('int64'), errors='coerce')
+    return fechas
+
+
+@dataclass
+class FechasResult:
+    """
+    Fechas normalizadas de una lista de incidencias (misma posición que la entrada).
+    
+    Atributos:
+    - resumen (pd.DataFrame): Una fila por incidencia con inicio, fin (datetime64),
+      dias (int, días distintos cubiertos) y reconocida (bool)
+    - detalle (pd.DataFrame): Una fila por (fila, dia) cubierto; solo fechas reconocidas
+    """
+    resumen: pd.DataFrame
+    detalle: pd.DataFrame
+
+    @property
+    def n_no_reconocidas(self) -> int:
+        return int((~self.resumen['reconocida']).sum())
+
+    def reparto_diario(self, df: pd.DataFrame, columnas_importe: Iterable[str]) -> pd.DataFrame:
+        """
+        Expande `df` (una fila por incidencia, mismo orden) en una fila por día.
+        
+        Parámetros:
+        - df (pd.DataFrame): Filas alineadas con las fechas parseadas
+        - columnas_importe (Iterable[str]): Columnas que se reparten a partes
+          iguales entre los días de cada incidencia
+        
+        Retorna:
+        - pd.DataFrame: Columnas de `df` más "Día" y "Fracción". Las fechas no
+          reconocidas conservan una fila con Día vacío y Fracción 1, así que los
+          totales cuadran con el Excel principal
+        """
+        sin_fecha = np.flatnonzero(~self.resumen['reconocida'].to_numpy())
+        filas = np.concatenate([self.detalle['fila'].to_numpy(), sin_fecha])
+        dias = np.concatenate([self.detalle['dia'].to_numpy(), np.full(len(sin_fecha), np.datetime64('NaT'), dtype='datetime64[ns]')])
+        orden = np.argsort(filas, kind='stable')
+        filas, dias = filas[orden], dias[orden]
+
+        fraccion = 1.0 / np.maximum(self.resumen['dias'].to_numpy()[filas], 1)
+        resultado = df.iloc[filas].reset_index(drop=True)
+        resultado.insert(0, 'Día', pd.Series(dias).dt.date)
+        resultado['Fracción'] = fraccion
+        for columna in columnas_importe:
+            if columna in resultado.columns:
+                resultado[columna] = pd.to_numeric(resultado[columna], errors='coerce').fillna(0.0) * fraccion
+        return resultado
+
+
+def _parse_textos_fecha(texto: pd.Series, anio: int, mes: int) -> FechasResult:
+    """Núcleo de parse_fechas sobre textos ya normalizados a minúsculas (sin repetir)."""
+    n = len(texto)
+    texto = texto.str.replace(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b", r"\3/\2/\1", regex=True)
+    texto = texto.str.replace(r"\b(\d{1,2})-(\d{1,2})-(\d{2,4})\b", r"\1/\2/\3", regex=True)
+
+    tramos = texto.str.split(_FECHA_SEPARADOR_LISTA, regex=True).explode()
+    tramos = tramos[tramos.fillna('') != '']
+    fila = tramos.index.to_numpy()
+    tramos = tramos.reset_index(drop=True)
+
+    # Mes completo ("julio", "mes completo", "agosto de 2025")
+    mes_completo = tramos.str.extract(_FECHA_MES)
+    es_mes = tramos.str.fullmatch(_FECHA_MES).fillna(False).to_numpy()
+    mes_nombre = mes_completo[0].map(MESES)
+
+    # Días con nombre de mes ("15 de julio") → "15/7"
+    tramos = tramos.str.replace(rf"\s*(?:de\s+|/)?\b({_MESES_RE})\b(?:\s+(?:de\s+)?(\d{{4}}))?", _mes_a_numero, regex=True)
+    partes = tramos.str.extract(_FECHA_TRAMO).apply(pd.to_numeric, errors='coerce')
+    d1, m1, y1, d2, m2, y2 = (partes[i] for i in range(6))
+
+    es_rango = d2.notna()
+    m1 = m1.fillna(m2).fillna(mes)
+    y1 = y1.fillna(y2).fillna(anio)
+    # Rango que cruza de año ("28/12-03/01"): el fin es del año siguiente
+    y2 = y2.fillna(y1.where(~(m2 < m1), y1 + 1))
+    m2 = m2.fillna(m1)
+    inicio = _fechas_desde_partes(d1, m1, y1)
+    fin = _fechas_desde_partes(d2.where(es_rango, d1), m2.where(es_rango, m1), y2.where(es_rango, y1))
+
+    if es_mes.any():
+        anio_mes = pd.to_numeric(mes_completo[1], errors='coerce').fillna(anio)
+        primero = _fechas_desde_partes(pd.Series(1.0, index=tramos.index), mes_nombre.fillna(mes).astype(float), anio_mes)
+        inicio = inicio.where(~es_mes, primero)
+        fin = fin.where(~es_mes, primero + pd.offsets.MonthEnd(0))
+
+    valido = (inicio.notna() & fin.notna() & (fin >= inicio)).to_numpy()
+    # Una incidencia solo se reconoce si todos sus tramos lo son
+    reconocida = np.ones(n, dtype=bool)
+    reconocida[fila[~valido]] = False
+    reconocida &= np.bincount(fila, minlength=n) > 0
+
+    usar = valido & reconocida[fila]
+    ini = inicio.to_numpy()[usar].astype('datetime64[D]')
+    n_dias = (fin.to_numpy()[usar].astype('datetime64[D]') - ini).astype(np.int64) + 1
+    total = int(n_dias.sum())
+    desplazamiento = np.arange(total) - np.repeat(np.cumsum(n_dias) - n_dias, n_dias)
+    detalle = pd.DataFrame({
+        'fila': np.repeat(fila[usar], n_dias),
+        'dia': (np.repeat(ini, n_dias) + desplazamiento.astype('timedelta64[D]')).astype('datetime64[ns]'),
+    }).drop_duplicates(ignore_index=True)
+
+    por_fila = detalle.groupby('fila')['dia'].agg(['min', 'max', 'size'])
+    resumen = pd.DataFrame({
+        'inicio': pd.Series(pd.NaT, index=range(n), dtype='datetime64[ns]'),
+        'fin': pd.Series(pd.NaT, index=range(n), dtype='datetime64[ns]'),
+        'dias': np.zeros(n, dtype=np.int64),
+    })
+    resumen.loc[por_fila.index, 'inicio'] = por_fila['min']
+    resumen.loc[por_fila.index, 'fin'] = por_fila['max']
+    resumen.loc[por_fila.index, 'dias'] = por_fila['size'].astype(np.int64)
+    resumen['reconocida'] = reconocida
+    return FechasResult(resumen=resumen, detalle=detalle)
+
+
+@timed("fechas")
+def parse_fechas(fechas: Iterable[str], anio: int, mes: int) -> FechasResult:
+    """
+    Interpreta la columna Fecha de forma vectorizada (sin bucles por fila).
+    
+    Parámetros:
+    - fechas (Iterable[str]): Textos de la columna Fecha
+    - anio, mes (int): Periodo de referencia (periodo_referencia)
+    
+    Retorna:
+    - FechasResult: Inicio, fin y número de días por incidencia, y el detalle por día
+    
+    Procesamiento:
+    1. Factoriza los textos: un mes tiene pocas fechas distintas, se parsean una vez
+    2. Normaliza (fechas ISO y dd-mm-aaaa, nombres de mes), separa las listas en
+       tramos (explode) y extrae día/mes/año de cada extremo
+    3. Completa mes y año que falten, construye las fechas y expande cada tramo
+       a días (np.repeat)
+    4. Reparte resumen y detalle de cada texto a sus filas (indexado con los códigos)
+    """
+    texto = pd.Series(list(fechas), dtype=object).fillna('').astype(str).str.lower().str.strip()
+    codigos, unicos = pd.factorize(texto)
+    base = _parse_textos_fecha(pd.Series(unicos, dtype=object), anio, mes)
+
+    resumen = base.resumen.iloc[codigos].reset_index(drop=True)
+    # detalle de cada texto único, contiguo y ordenado por texto → rebanadas por fila
+    detalle_base = base.detalle.sort_values('fila', kind='stable')
+    por_texto = np.bincount(detalle_base['fila'].to_numpy(), minlength=len(unicos))
+    inicio_texto = np.cumsum(por_texto) - por_texto
+    n_por_fila = por_texto[codigos]
+    total = int(n_por_fila.sum())
+    posiciones = np.repeat(inicio_texto[codigos], n_por_fila) + (
+        np.arange(total) - np.repeat(np.cumsum(n_por_fila) - n_por_fila, n_por_fila)
+    )
+    detalle = pd.DataFrame({
+        'fila': np.repeat(np.arange(len(codigos)), n_por_fila),
+        'dia': detalle_base['dia'].to_numpy()[posiciones],
+    })
+    return FechasResult(resumen=resumen, detalle=detalle)
+
+# =============================================================================
+# IMPORTACIÓN MASIVA
+# =============================================================================
+
+# Campo de Incidencia → cabeceras aceptadas (normalizadas: minúsculas, sin tildes,
+# espacios como "_"). Incluye las cabeceras del Excel exportado.
+IMPORT_COLUMN_ALIASES = {
+    'trabajador': ('trabajador', 'nombre_empleado', 'empleado', 'nombre'),
+    'codigo_crown_destino': ('destino', 'codigo_crown_destino', 'crown_destino', 'centro_destino', 'cod_destino'),
+    'codigo_crown_origen': ('origen', 'codigo_crown_origen', 'crown_origen', 'centro_origen'),
+    'facturable': ('facturable',),
+    'motivo': ('motivo',),
+    'incidencia_horas': ('horas', 'incidencia_horas', 'cuantia'),
+    'incidencia_precio': ('precio', 'incidencia_precio'),
+    'nocturnidad_horas': ('nocturnidad_horas', 'horas_nocturnidad', 'nocturnidad', 'cuantia_nocturnidad'),
+    'traslados_total': ('traslados_total', 'traslados', 'horas_traslado'),
+    'empresa_destino': ('empresa_destino',),
+    'fecha': ('fecha',),
+    'observaciones': ('observaciones', 'observacion'),
+}
+IMPORT_NUMERIC_FIELDS = ('incidencia_horas', 'incidencia_precio', 'nocturnidad_horas', 'traslados_total')
+IMPORT_MAX_ERRORES_MOSTRADOS = 500
+
+@dataclass
+class ImportResult:
+    """
+    Resultado de preparar un fichero de importación.
+    
+    Atributos:
+    - incidencias (List[Incidencia]): Filas válidas ya enriquecidas
+    - errores (pd.DataFrame): Una fila por error: Fila, Campo, Valor, Error
+    - total_filas (int): Filas de datos leídas del fichero
+    - incompletas (int): Incidencias importables a las que falta algún campo obligatorio
+    """
+    incidencias: List['Incidencia']
+    errores: pd.DataFrame
+    total_filas: int
+    incompletas: int = 0
+
+def _normalize_import_header(header) -> str:
+    texto = unicodedata.normalize('NFKD', str(header)).encode('ascii', 'ignore').decode('ascii')
+    return re.sub(r'[^a-z0-9]+', '_', texto.strip().lower()).strip('_')
+
+def read_import_file(file_name: str, data: bytes) -> pd.DataFrame:
+    """
+    Lee un CSV o XLSX de importación con todas las columnas como texto.
+    
+    Parámetros:
+    - file_name (str): Nombre original (decide el formato por la extensión)
+    - data (bytes): Contenido del fichero
+    
+    Retorna:
+    - pd.DataFrame: Columnas del fichero, valores como texto ("" si vacíos)
+    
+    Formatos:
+    - .csv: separador ',' o ';' (detectado), UTF-8 o Latin-1
+    - .xlsx/.xlsm: primera hoja, leída con el lector en streaming
+    """
+    if file_name.lower().endswith(('.xlsx', '.xlsm')):
+        df = read_sheet(io.BytesIO(data))
+        for col in df.columns:
+            if pd.api.types.is_datetime64_any_dtype(df[col]):
+                df[col] = df[col].dt.strftime('%d/%m/%Y')
+            elif df[col].dtype == object:
+                # Columna con fechas y números sueltos: las fechas llegan como Timestamp
+                df[col] = df[col].map(lambda v: v.strftime('%d/%m/%Y') if isinstance(v, datetime) else v)
+        return df.apply(normalize_code_series) if not df.empty else df
+
+    try:
+        texto = data.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        texto = data.decode('latin-1')
+    primera_linea = texto.split('\n', 1)[0]
+    separador = ';' if primera_linea.count(';') > primera_linea.count(',') else ','
+    return pd.read_csv(io.StringIO(texto), sep=separador, dtype=str, keep_default_na=False).apply(lambda c: c.str.strip())
+
+def prepare_import(df_raw: pd.DataFrame, data_manager: OptimizedDataManager, imputacion: str) -> ImportResult:
+    """
+    Valida y enriquece un fichero de importación de forma vectorizada.
+    
+    Parámetros:
+    - df_raw (pd.DataFrame): Fichero leído con read_import_file
+    - data_manager (OptimizedDataManager): Maestro del periodo
+    - imputacion (str): Mes de imputación que se asigna a todas las filas
+    
+    Retorna:
+    - ImportResult: Incidencias válidas + informe de errores por fila
+    
+    Procesamiento:
+    1. Mapea cabeceras con IMPORT_COLUMN_ALIASES
+    2. Un merge con Trabajadores aporta categoría, servicio, convenio, coste hora,
+       centro preferente (origen por defecto) y jefe
+    3. Un merge con Centros aporta el nombre del destino (destino vacío = origen)
+    4. Máscaras por columna marcan trabajador/destino desconocidos, motivo o
+       facturable fuera de lista y números no válidos; las filas con algún
+       error no se importan
+    """
+    renombres = {}
+    for col in df_raw.columns:
+        normalizado = _normalize_import_header(col)
+        for campo, alias in IMPORT_COLUMN_ALIASES.items():
+            if normalizado in alias and campo not in renombres.values():
+                renombres[col] = campo
+                break
+    df = df_raw[list(renombres)].rename(columns=renombres).reset_index(drop=True)
+    for campo in IMPORT_COLUMN_ALIASES:
+        if campo not in df.columns:
+            df[campo] = ""
+    df = df.fillna("").astype(str)
+    # Las filas completamente vacías (típicas al final de un Excel) no cuentan
+    df = df[(df[list(IMPORT_COLUMN_ALIASES)] != "").any(axis=1)]
+    fila_fichero = df.index.to_series() + 2  # cabecera = fila 1
+
+    errores = []
+
+    def _marcar(mascara: pd.Series, campo: str, mensaje: str) -> None:
+        if mascara.any():
+            errores.append(pd.DataFrame({
+                'Fila': fila_fichero[mascara], 'Campo': campo,
+                'Valor': df.loc[mascara, campo], 'Error': mensaje,
+            }))
+
+    # --- Trabajador: se compara sin distinguir mayúsculas ni espacios y se
+    # guarda el nombre tal como figura en el maestro (clave de los lookups) ---
+    def _clave_nombre(serie: pd.Series) -> pd.Series:
+        return serie.fillna("").astype(str).str.upper().str.replace(r'\s+', ' ', regex=True).str.strip()
+
+    empleados = data_manager.df_trabajadores
+    columnas_empleado = ['nombre_empleado', 'cat_empleado', 'servicio', 'cod_reg_convenio', 'coste_hora', 'centro_preferente', 'nombre_jefe_ope']
+    if empleados.empty or 'nombre_empleado' not in empleados.columns:
+        empleados = pd.DataFrame(columns=columnas_empleado)
+    # object: los categóricos del maestro no admiten fillna("") tras el merge
+    empleados = empleados.reindex(columns=columnas_empleado).astype(object).drop_duplicates('nombre_empleado', keep='last')  # igual que build_empleado_lookup
+    empleados = empleados.assign(_clave=_clave_nombre(empleados['nombre_empleado'])).drop_duplicates('_clave', keep='last')
+    df['_clave'] = _clave_nombre(df['trabajador'])
+    df = df.merge(empleados, on='_clave', how='left', indicator='_empleado').set_index(fila_fichero.index)
+    _marcar(df['_clave'] == "", 'trabajador', "Falta el trabajador")
+    _marcar((df['_clave'] != "") & (df['_empleado'] == 'left_only'), 'trabajador', "Trabajador no encontrado en el maestro")
+    df['trabajador'] = df['nombre_empleado'].fillna(df['trabajador'])
+
+    # --- Origen y destino ---
+    df['centro_preferente'] = normalize_code_series(df['centro_preferente'])
+    df['codigo_crown_origen'] = normalize_code_series(df['codigo_crown_origen'])
+    df['codigo_crown_origen'] = df['codigo_crown_origen'].where(df['codigo_crown_origen'] != "", df['centro_preferente'])
+    df['codigo_crown_destino'] = normalize_code_series(df['codigo_crown_destino'])
+    df['codigo_crown_destino'] = df['codigo_crown_destino'].where(df['codigo_crown_destino'] != "", df['codigo_crown_origen'])
+
+    centros = data_manager.centros_lookup_df
+    nombres_centro = (
+        centros[['cod_centro_preferente', 'desc_centro_preferente']]
+        .drop_duplicates('cod_centro_preferente')
+        .rename(columns={'cod_centro_preferente': 'codigo_crown_destino', 'desc_centro_preferente': 'nombre_crown_destino'})
+        if not centros.empty else pd.DataFrame(columns=['codigo_crown_destino', 'nombre_crown_destino'])
+    )
+    df = df.merge(nombres_centro, on='codigo_crown_destino', how='left').set_index(fila_fichero.index)
+    _marcar((df['codigo_crown_destino'] != "") & df['nombre_crown_destino'].isna(), 'codigo_crown_destino', "Centro destino no encontrado en el maestro")
+
+    # --- Listas cerradas ---
+    facturable = df['facturable'].str.strip().str.lower().map({'sí': 'Sí', 'si': 'Sí', 's': 'Sí', 'no': 'No', 'n': 'No', '': ''})
+    _marcar(facturable.isna(), 'facturable', "Facturable debe ser 'Sí' o 'No'")
+    df['facturable'] = facturable.fillna("")
+
+    motivos = {m.lower(): m for m in MOTIVOS_INCIDENCIA}
+    motivo = df['motivo'].str.strip().str.lower().map(motivos)
+    _marcar((df['motivo'] != "") & motivo.isna(), 'motivo', f"Motivo no válido (valores: {', '.join(MOTIVOS_INCIDENCIA)})")
+    df['motivo'] = motivo.fillna("")
+
+    # --- Números (admite coma decimal) ---
+    for campo in IMPORT_NUMERIC_FIELDS:
+        texto = df[campo].str.replace(',', '.', regex=False).str.strip()
+        numero = pd.to_numeric(texto, errors='coerce')
+        _marcar((texto != "") & numero.isna(), campo, "No es un número")
+        _marcar(numero < 0, campo, "No puede ser negativo")
+        df[campo] = numero.fillna(0.0).astype(float)
+
+    errores_df = (
+        pd.concat(errores, ignore_index=True).sort_values(['Fila', 'Campo'], kind='stable').reset_index(drop=True)
+        if errores else pd.DataFrame(columns=['Fila', 'Campo', 'Valor', 'Error'])
+    )
+    validas = df[~fila_fichero.isin(errores_df['Fila'])]
+
+    validas = validas.assign(
+        imputacion_nomina=imputacion,
+        categoria=validas['cat_empleado'].fillna(""),
+        servicio=validas['servicio'].fillna(""),
+        cod_reg_convenio=validas['cod_reg_convenio'].fillna(""),
+        nombre_jefe_ope=validas['nombre_jefe_ope'].fillna('N/A'),
+        nombre_crown_destino=validas['nombre_crown_destino'].fillna(""),
+        coste_hora=pd.to_numeric(validas['coste_hora'], errors='coerce').fillna(0.0).astype(float),
+    )
+    campos = [f for f in Incidencia.__dataclass_fields__ if f in validas.columns]
+    incidencias = [Incidencia(**registro) for registro in validas[campos].to_dict('records')]
+    incompletas = validate_incidencias(incidencias, data_manager).n_incompletas
+    return ImportResult(incidencias=incidencias, errores=errores_df, total_filas=len(df), incompletas=incompletas)
+
+# =============================================================================
+# RECARGAS PARCIALES (FRAGMENTOS)
+# =============================================================================
+# Cabecera, pestañas de entrada, tabla y exportación son fragmentos (st.fragment):
+# un widget solo vuelve a ejecutar el fragmento que lo contiene. Cuando una
+# acción cambia estado compartido (incidencias, jefe, maestro) se invalida la
+# página entera con rerun_app(); los mensajes de confirmación se encolan con
+# flash() para mostrarse tras esa recarga completa.
+
+def flash(mensaje: str, nivel: str = "success") -> None:
+    """Encola un mensaje (success, warning, info) para la siguiente recarga completa."""
+    st.session_state.setdefault('flash_messages', []).append((nivel, mensaje))
+
+def show_flash() -> None:
+    """Muestra (y vacía) los mensajes encolados con flash()."""
+    for nivel, mensaje in st.session_state.pop('flash_messages', []):
+        getattr(st, nivel)(mensaje)
+
+def rerun_app() -> None:
+    """Invalida todos los fragmentos: recarga completa de la página."""
+    st.rerun(scope="app")
+
+# =============================================================================
+# ÍNDICES INCREMENTALES DE INCIDENCIAS
+# =============================================================================
+# Se mantienen al añadir, editar y borrar filas (_registrar_altas/_registrar_bajas)
+# en lugar de recorrer toda la lista en cada recarga. Si alguna ruta modifica
+# la lista sin avisar, el índice lo detecta (el total no cuadra) y se reconstruye.
+
+ClaveIncidencia = Tuple[str, str, str, str]
+
+def _texto_clave(valor) -> str:
+    if valor is None or (isinstance(valor, float) and np.isnan(valor)):
+        return ""
+    return str(valor).strip()
+
+class DuplicateIndex:
+    """
+    Índice hash de incidencias por (trabajador, destino, fecha, motivo).
+    
+    Atributos:
+    - _conteo (Counter): clave → número de incidencias con esa clave
+    - total (int): Incidencias registradas en el índice
+    
+    Todas las operaciones son O(1) por incidencia; no hay comparaciones entre
+    pares de filas.
+    """
+    def __init__(self, incidencias: Iterable['Incidencia'] = ()):
+        self._conteo: Counter = Counter()
+        self.total = 0
+        self.add(incidencias)
+
+    @staticmethod
+    def key(incidencia: 'Incidencia') -> ClaveIncidencia:
+        return (
+            _texto_clave(incidencia.trabajador), _texto_clave(incidencia.codigo_crown_destino),
+            _texto_clave(incidencia.fecha), _texto_clave(incidencia.motivo),
+        )
+
+    def add(self, incidencias: Iterable['Incidencia']) -> None:
+        for inc in incidencias:
+            self._conteo[self.key(inc)] += 1
+            self.total += 1
+
+    def remove(self, incidencias: Iterable['Incidencia']) -> None:
+        for inc in incidencias:
+            clave = self.key(inc)
+            if self._conteo[clave] <= 1:
+                self._conteo.pop(clave, None)
+            else:
+                self._conteo[clave] -= 1
+            self.total -= 1
+
+    def count(self, incidencia: 'Incidencia') -> int:
+        """Incidencias registradas con la misma clave (incluida ella si está en el índice)."""
+        return self._conteo.get(self.key(incidencia), 0)
+
+    def duplicated_keys(self) -> Dict[ClaveIncidencia, int]:
+        """Claves repetidas → número de repeticiones."""
+        return {clave: n for clave, n in self._conteo.items() if n > 1}
+
+def _registrar_altas(incidencias: Iterable['Incidencia']) -> None:
+    """Actualiza los índices de la sesión (duplicados y cubo de costes) con incidencias añadidas."""
+    incidencias = list(incidencias)
+    if st.session_state.get('dup_index') is not None:
+        st.session_state.dup_index.add(incidencias)
+    cubo = st.session_state.get('cost_cube')
+    if cubo is not None and cubo.file_hash == st.session_state.data_manager.file_hash:
+        cubo.add(incidencias, st.session_state.data_manager)
+
+def _registrar_bajas(incidencias: Iterable['Incidencia']) -> None:
+    """Actualiza los índices de la sesión (duplicados y cubo de costes) con incidencias eliminadas."""
+    incidencias = list(incidencias)
+    if st.session_state.get('dup_index') is not None:
+        st.session_state.dup_index.remove(incidencias)
+    cubo = st.session_state.get('cost_cube')
+    if cubo is not None and cubo.file_hash == st.session_state.data_manager.file_hash:
+        cubo.remove(incidencias, st.session_state.data_manager)
+
+def _reiniciar_indices() -> None:
+    """Vacía los índices (la lista de incidencias se ha vaciado o sustituido)."""
+    st.session_state.dup_index = DuplicateIndex()
+    # El cubo depende del maestro del periodo: se reconstruye con él en get_cost_cube
+    st.session_state.cost_cube = None
+
+def get_duplicate_index() -> DuplicateIndex:
+    """Índice de duplicados de la sesión, reconstruido si no cuadra con la lista."""
+    incidencias = st.session_state.get('incidencias', [])
+    indice = st.session_state.get('dup_index')
+    if indice is None or indice.total != len(incidencias):
+        indice = st.session_state.dup_index = DuplicateIndex(incidencias)
+    return indice
+
+def duplicate_report(incidencias: List['Incidencia'], indice: DuplicateIndex) -> pd.DataFrame:
+    """
+    Informe de incidencias duplicadas de todo el mes.
+    
+    Parámetros:
+    - incidencias (List[Incidencia]): Lista completa
+    - indice (DuplicateIndex): Índice sincronizado con la lista
+    
+    Retorna:
+    - pd.DataFrame: Fila (1-based), Trabajador, Destino, Fecha, Motivo,
+      Repeticiones; vacío si no hay duplicados
+    """
+    repetidas = indice.duplicated_keys()
+    filas = []
+    if repetidas:
+        for i, inc in enumerate(incidencias):
+            clave = DuplicateIndex.key(inc)
+            if clave in repetidas:
+                filas.append((i + 1, *clave, repetidas[clave]))
+    return pd.DataFrame(filas, columns=['Fila', 'Trabajador', 'Destino', 'Fecha', 'Motivo', 'Repeticiones'])
+
+# =============================================================================
+# CUBO DE COSTES
+# =============================================================================
+# Totales por jefe × centro destino × motivo × servicio × mes, mantenidos con los
+# mismos avisos que el índice de duplicados: cada alta suma su contribución y
+# cada baja la resta. Las métricas de exportación y el cuadro de mando leen el
+# cubo en lugar de recorrer todas las incidencias. Solo cuentan las válidas,
+# igual que la exportación.
+
+CUBE_DIMENSIONS = {
+    "Jefe": "jefe", "Centro": "centro", "Motivo": "motivo", "Servicio": "servicio", "Mes": "mes",
+}
+CUBE_MEASURES = {
+    "Incidencias": "incidencias",
+    "Horas": "horas",
+    "Importe horas (€)": "importe_horas",
+    "Horas nocturnidad": "horas_nocturnidad",
+    "Nocturnidad (€)": "nocturnidad",
+    "Traslados (€)": "traslados",
+    "Total con SS (€)": "total_ss",
+}
+
+ClaveCubo = Tuple[str, str, str, str, str]
+
+def _columna_numerica(incidencias: List['Incidencia'], campo: str) -> np.ndarray:
+    valores = pd.Series(list(map(operator.attrgetter(campo), incidencias)), dtype=object)
+    return pd.to_numeric(valores, errors='coerce').fillna(0.0).to_numpy(dtype=float)
+
+class CostCube:
+    """
+    Cubo de costes incremental de una sesión.
+    
+    Atributos:
+    - file_hash (str): Maestro con el que se calcularon las tarifas de nocturnidad
+    - total (int): Incidencias registradas (válidas o no), para detectar desajustes
+    - _celdas (Dict): clave de dimensiones → vector de medidas (orden CUBE_MEASURES)
+    
+    Las altas y bajas cuestan O(filas afectadas): la validación y las tarifas
+    se calculan solo para esas filas.
+    """
+    def __init__(self, data_manager: 'OptimizedDataManager', incidencias: Iterable['Incidencia'] = ()):
+        self.file_hash = data_manager.file_hash
+        self.total = 0
+        self._celdas: Dict[ClaveCubo, np.ndarray] = {}
+        self.add(incidencias, data_manager)
+
+    @staticmethod
+    def key(incidencia: 'Incidencia') -> ClaveCubo:
+        codigo = _texto_clave(incidencia.codigo_crown_destino)
+        nombre = _texto_clave(incidencia.nombre_crown_destino)
+        return (
+            _texto_clave(incidencia.nombre_jefe_ope),
+            f"{codigo} - {nombre}" if codigo and nombre else codigo or nombre,
+            _texto_clave(incidencia.motivo),
+            _texto_clave(incidencia.servicio),
+            _texto_clave(incidencia.imputacion_nomina),
+        )
+
+    def _aplicar(self, incidencias: Iterable['Incidencia'], data_manager: 'OptimizedDataManager', signo: float) -> None:
+        incidencias = list(incidencias)
+        if not incidencias:
+            return
+        self.total += int(signo) * len(incidencias)
+        validacion = validate_incidencias(incidencias, data_manager)
+        validas = validacion.validas
+        if not validas.any():
+            return
+
+        horas = _columna_numerica(incidencias, 'incidencia_horas')
+        importe = horas * _columna_numerica(incidencias, 'incidencia_precio')
+        horas_noct = _columna_numerica(incidencias, 'nocturnidad_horas')
+        nocturnidad = horas_noct * validacion.precio_nocturnidad
+        traslados = _columna_numerica(incidencias, 'traslados_total') * _columna_numerica(incidencias, 'coste_hora')
+        total_ss = (importe + nocturnidad) * COEF_SEGURIDAD_SOCIAL + traslados
+        medidas = np.column_stack([np.ones(len(incidencias)), horas, importe, horas_noct, nocturnidad, traslados, total_ss])
+
+        for i in np.flatnonzero(validas):
+            clave = self.key(incidencias[i])
+            celda = self._celdas.get(clave)
+            if celda is None:
+                self._celdas[clave] = signo * medidas[i]
+                continue
+            celda += signo * medidas[i]
+            if round(celda[0]) <= 0:
+                del self._celdas[clave]
+
+    def add(self, incidencias: Iterable['Incidencia'], data_manager: 'OptimizedDataManager') -> None:
+        self._aplicar(incidencias, data_manager, 1.0)
+
+    def remove(self, incidencias: Iterable['Incidencia'], data_manager: 'OptimizedDataManager') -> None:
+        self._aplicar(incidencias, data_manager, -1.0)
+
+    def to_frame(self) -> pd.DataFrame:
+        """Una fila por celda no vacía: columnas de CUBE_DIMENSIONS y CUBE_MEASURES."""
+        dimensiones = list(CUBE_DIMENSIONS.values())
+        medidas = list(CUBE_MEASURES.values())
+        if not self._celdas:
+            return pd.DataFrame(columns=dimensiones + medidas)
+        df = pd.DataFrame(list(self._celdas), columns=dimensiones)
+        df[medidas] = np.vstack(list(self._celdas.values()))
+        df['incidencias'] = df['incidencias'].round().astype('int64')
+        return df
+
+    def totales(self) -> Dict[str, float]:
+        """
+        Totales del cubo con las claves de las métricas de exportación.
+        
+        Retorna Dict con:
+        - total_incidencias, total_nocturnidad, total_traslados
+        - total_simple: Suma sin SS
+        - total_con_ss: Total con Seguridad Social
+        """
+        suma = np.sum(list(self._celdas.values()), axis=0) if self._celdas else np.zeros(len(CUBE_MEASURES))
+        importe, nocturnidad, traslados, total_ss = suma[2], suma[4], suma[5], suma[6]
+        return {
+            'total_incidencias': float(importe),
+            'total_nocturnidad': float(nocturnidad),
+            'total_traslados': float(traslados),
+            'total_simple': float(importe + nocturnidad + traslados),
+            'total_con_ss': float(total_ss),
+        }
+
+class CubeRegistry:
+    """
+    Cubos de todas las sesiones del proceso (para el cuadro de mando global).
+    
+    Atributos:
+    - _cubos (Dict[str, CostCube]): id de sesión → cubo
+    - _lock (threading.Lock): Protege el acceso desde sesiones concurrentes
+    """
+    def __init__(self):
+        self._cubos: Dict[str, CostCube] = {}
+        self._lock = threading.Lock()
+
+    def register(self, session_id: str, cubo: CostCube) -> None:
+        with self._lock:
+            self._cubos[session_id] = cubo
+
+    def active_frames(self) -> List[pd.DataFrame]:
+        """Cubos de las sesiones abiertas; los de sesiones cerradas se descartan."""
+        runtime = st.runtime.get_instance() if st.runtime.exists() else None
+        with self._lock:
+            if runtime is not None:
+                for session_id in [s for s in self._cubos if not runtime.is_active_session(s)]:
+                    del self._cubos[session_id]
+            cubos = list(self._cubos.values())
+        return [cubo.to_frame() for cubo in cubos]
+
+@st.cache_resource
+def _get_cube_registry() -> CubeRegistry:
+    """Registro único de cubos para todo el proceso."""
+    return CubeRegistry()
+
+def get_cost_cube(data_manager: 'OptimizedDataManager') -> CostCube:
+    """Cubo de costes de la sesión, reconstruido si no cuadra con la lista o con el maestro."""
+    incidencias = st.session_state.get('incidencias', [])
+    cubo = st.session_state.get('cost_cube')
+    if cubo is None or cubo.total != len(incidencias) or cubo.file_hash != data_manager.file_hash:
+        cubo = st.session_state.cost_cube = CostCube(data_manager, incidencias)
+        ctx = get_script_run_ctx(suppress_warning=True)
+        if ctx is not None:
+            _get_cube_registry().register(ctx.session_id, cubo)
+    return cubo
+
 # =============================================================================
 # TABLA OPTIMIZADA CON PAGINACIÓN
 # =============================================================================
@@ -908,17 +2624,30 @@ class OptimizedTablaIncidencias:
         - selected_jefe (str): Supervisor seleccionado
         
         Componentes:
-        - Tabs para métodos de entrada
+        - Tabs para métodos de entrada (centro, trabajador, fichero)
         - Tabla paginada de incidencias
+        
+        Cada pestaña y la tabla son fragmentos independientes; solo esta
+        función (recarga completa) decide si hay tabla que mostrar.
         """
         st.header("📋 Registro de Incidencias de Personal")
+        show_flash()
+
+        # Las listas se limitan a la zona del jefe salvo para cubrir otras zonas
+        st.toggle(
+            "🌍 Mostrar todas las zonas",
+            key="ver_todas_zonas",
+            help=f"Por defecto, centros y trabajadores se limitan a la zona de {selected_jefe}. "
+                 "Actívalo para registrar coberturas en centros o con trabajadores de otros jefes."
+        )
 
         incidencias = st.session_state.incidencias
 
         # TABS para diferentes métodos de entrada
-        tab1, tab2 = st.tabs([
+        tab1, tab2, tab3 = st.tabs([
             "🎯 Por Centro",
-            "👤 Por Trabajador"
+            "👤 Por Trabajador",
+            "📥 Importar fichero"
         ])
         
         with tab1:
@@ -927,12 +2656,21 @@ class OptimizedTablaIncidencias:
         with tab2:
             self._render_method_by_trabajador(selected_jefe)
 
+        with tab3:
+            self._render_method_import()
+
         if incidencias:
             st.markdown("---")
             self._render_main_table_paginated(incidencias, selected_jefe)
         else:
             st.info("💡 No hay incidencias registradas. Usa las pestañas superiores para agregar.")
 
+    def _jefe_zona(self, selected_jefe: str) -> str:
+        """Jefe cuya partición alimenta las listas de selección ("" = todas las zonas)."""
+        return "" if st.session_state.get('ver_todas_zonas', False) else selected_jefe
+
+    @st.fragment
+    @timed("tab_centro")
     def _render_method_by_centro(self, selected_jefe: str):
         """
         Tab 1: Registro masivo por centro.
@@ -954,7 +2692,7 @@ class OptimizedTablaIncidencias:
             st.warning("No se pudo cargar el maestro de centros.")
             return
         
-        centros_display_list = [""] + sorted(centros_lookup_df['nombre_centro_display'].tolist())
+        centros_display_list = self.data_manager.get_centros_crown_with_names(self._jefe_zona(selected_jefe))
         
         col1, col2 = st.columns(2)
         
@@ -1014,6 +2752,7 @@ class OptimizedTablaIncidencias:
             
             if crown_destino and empleados_centro:
                 self._add_all_employees_from_centro(empleados_centro, selected_jefe, crown_origen, crown_destino)
+                rerun_app()
             else:
                 st.warning("⚠️ Debes seleccionar un Centro de Origen (con trabajadores) y un Crown Destino.")
 
@@ -1036,9 +2775,12 @@ class OptimizedTablaIncidencias:
             
             if trabajador_individual and crown_destino:
                 self._add_incidencia(trabajador_individual, 1, selected_jefe, crown_origen, crown_destino)
+                rerun_app()
             else:
                 st.warning("⚠️ Selecciona un trabajador y el Crown Destino")
 
+    @st.fragment
+    @timed("tab_trabajador")
     def _render_method_by_trabajador(self, selected_jefe: str):
         """
         Tab 2: Registro individual por trabajador.
@@ -1054,9 +2796,10 @@ class OptimizedTablaIncidencias:
         st.subheader("👤 Registro por Trabajador")
         st.info("💡 **Ideal para:** Un trabajador que tiene múltiples incidencias en diferentes centros destino durante el mes")
         
-        empleados_con_centro = self.data_manager.get_all_employees_with_centro()
+        zona = self._jefe_zona(selected_jefe)
+        empleados_con_centro = self.data_manager.get_all_employees_with_centro(zona)
         centros_lookup_df = self.data_manager.centros_lookup_df
-        centros_display_list = [""] + centros_lookup_df['nombre_centro_display'].tolist()
+        centros_display_list = self.data_manager.get_centros_crown_with_names(zona)
         
         st.markdown("**1️⃣ Selecciona el Trabajador**")
         
@@ -1126,10 +2869,106 @@ class OptimizedTablaIncidencias:
                         "",
                         config['destino']
                     )
-                st.success(f"✅ Agregadas {len(incidencias_config)} incidencias para {nombre_trabajador}")
+                flash(f"✅ Agregadas {len(incidencias_config)} incidencias para {nombre_trabajador}")
+                rerun_app()
             else:
                 st.warning("⚠️ Completa al menos una incidencia con centro destino")
 
+    @st.fragment
+    @timed("tab_importar")
+    def _render_method_import(self):
+        """
+        Tab 3: Importación masiva desde CSV/XLSX.
+        
+        Funcionalidad:
+        - Plantilla descargable con las columnas aceptadas
+        - Validación y enriquecimiento vectorizado (prepare_import)
+        - Informe de errores por fila descargable
+        - Añade todas las filas válidas de una vez
+        
+        El resultado se guarda en session_state por file_id para no volver a
+        procesar el fichero en cada recarga.
+        """
+        st.subheader("📥 Importar incidencias desde fichero")
+        st.info("💡 **Ideal para:** Cargar de una vez las incidencias que ya tienes en tu propia hoja de cálculo")
+
+        plantilla = pd.DataFrame(columns=[
+            'trabajador', 'destino', 'origen', 'facturable', 'motivo', 'horas', 'precio',
+            'nocturnidad_horas', 'traslados_total', 'empresa_destino', 'fecha', 'observaciones',
+        ])
+        st.download_button(
+            "📄 Descargar plantilla CSV",
+            plantilla.to_csv(index=False, sep=';').encode('utf-8-sig'),
+            file_name="plantilla_incidencias.csv",
+            mime="text/csv",
+            key="import_template"
+        )
+
+        fichero = st.file_uploader("Selecciona un fichero CSV o Excel:", type=["csv", "xlsx", "xlsm"], key="import_file")
+        if fichero is None:
+            return
+        if fichero.size > MAX_UPLOAD_SIZE * 1024 * 1024:
+            st.error(f"❌ El fichero supera el máximo de {MAX_UPLOAD_SIZE} MB")
+            return
+
+        cache_key = (fichero.file_id, self.data_manager.file_hash, st.session_state.selected_imputacion)
+        if st.session_state.get('import_cache_key') != cache_key:
+            try:
+                df_raw = read_import_file(fichero.name, fichero.getvalue())
+            except Exception as e:
+                st.error(f"❌ No se pudo leer el fichero: {e}")
+                return
+            st.session_state.import_result = prepare_import(df_raw, self.data_manager, st.session_state.selected_imputacion)
+            st.session_state.import_cache_key = cache_key
+        resultado: ImportResult = st.session_state.import_result
+
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("📄 Filas leídas", resultado.total_filas)
+        with col2:
+            st.metric("✅ Importables", len(resultado.incidencias))
+        with col3:
+            st.metric("❌ Con errores", resultado.errores['Fila'].nunique())
+
+        if not resultado.errores.empty:
+            st.warning(f"⚠️ {len(resultado.errores)} errores en {resultado.errores['Fila'].nunique()} filas. Esas filas no se importarán.")
+            st.dataframe(resultado.errores.head(IMPORT_MAX_ERRORES_MOSTRADOS), hide_index=True, use_container_width=True)
+            st.download_button(
+                "⬇️ Descargar informe de errores",
+                resultado.errores.to_csv(index=False, sep=';').encode('utf-8-sig'),
+                file_name=f"errores_{Path(fichero.name).stem}.csv",
+                mime="text/csv",
+                key="import_errors_download"
+            )
+        if resultado.incompletas:
+            st.info(f"ℹ️ {resultado.incompletas} incidencias importables tienen campos obligatorios vacíos; podrás completarlas en la tabla.")
+
+        # Evita importar dos veces el mismo fichero mientras siga seleccionado
+        if st.session_state.get('import_done_key') == cache_key:
+            st.success(f"✅ {fichero.name} ya está importado")
+            return
+
+        # Bloquea duplicados (mismo trabajador, destino, fecha y motivo) frente a
+        # la tabla y dentro del propio fichero
+        indice = get_duplicate_index()
+        nuevas, vistas = [], set()
+        for inc in resultado.incidencias:
+            clave = DuplicateIndex.key(inc)
+            if indice.count(inc) == 0 and clave not in vistas:
+                vistas.add(clave)
+                nuevas.append(inc)
+        repetidas = len(resultado.incidencias) - len(nuevas)
+        if repetidas:
+            st.warning(f"🔁 {repetidas} filas ya existen en la tabla o están repetidas en el fichero; no se importarán.")
+
+        if nuevas and st.button(f"➕ Importar {len(nuevas)} incidencias", type="primary", use_container_width=True, key="btn_import"):
+            copias = [inc.clone() for inc in nuevas]
+            st.session_state.incidencias.extend(copias)
+            _registrar_altas(copias)
+            st.session_state.import_done_key = cache_key
+            flash(f"✅ Importadas {len(copias)} incidencias desde {fichero.name}")
+            rerun_app()
+
     def _add_incidencia(self, nombre_trabajador: str, num_rows: int, selected_jefe: str, crown_origen: str, crown_destino: str) -> None:
         """
         Añade una o más incidencias para un trabajador.
@@ -1146,14 +2985,19 @@ class OptimizedTablaIncidencias:
             return
 
         incidents = st.session_state.incidencias
+        indice = get_duplicate_index()
 
         for _ in range(num_rows):
             incidencia = Incidencia(imputacion_nomina=st.session_state.selected_imputacion)
             self._actualizar_datos_empleado(incidencia, nombre_trabajador, selected_jefe, crown_origen, crown_destino)
+            if indice.count(incidencia):
+                flash(f"🔁 Ya había una incidencia de {nombre_trabajador} en {crown_destino} con la misma fecha y motivo; "
+                      "revísala en la tabla para no pagarla dos veces.", "warning")
             incidents.append(incidencia)
+            _registrar_altas([incidencia])
 
         st.session_state.incidencias = incidents
-        st.success(f"✅ Agregadas {num_rows} fila(s) para {nombre_trabajador}")
+        flash(f"✅ Agregadas {num_rows} fila(s) para {nombre_trabajador}")
     
     def _add_all_employees_from_centro(self, empleados: List[str], selected_jefe: str, crown_origen: str, crown_destino: str) -> None:
         """
@@ -1170,15 +3014,25 @@ class OptimizedTablaIncidencias:
             return
         
         incidents = st.session_state.incidencias
+        indice = get_duplicate_index()
         new_incidents = []
+        omitidos = 0
         for empleado in empleados:
             incidencia = Incidencia(imputacion_nomina=st.session_state.selected_imputacion)
             self._actualizar_datos_empleado(incidencia, empleado, selected_jefe, crown_origen, crown_destino)
+            # Bloquea duplicados (p. ej. pulsar dos veces "Añadir TODO el Centro")
+            if indice.count(incidencia):
+                omitidos += 1
+                continue
             new_incidents.append(incidencia)
 
         incidents.extend(new_incidents)
+        _registrar_altas(new_incidents)
         st.session_state.incidencias = incidents
-        st.success(f"✅ Agregados {len(new_incidents)} trabajadores del centro {crown_origen}")
+        if new_incidents:
+            flash(f"✅ Agregados {len(new_incidents)} trabajadores del centro {crown_origen}")
+        if omitidos:
+            flash(f"🔁 {omitidos} trabajadores ya tenían una incidencia sin completar en {crown_destino}; no se han duplicado.", "warning")
 
     def _actualizar_datos_empleado(self, incidencia: Incidencia, nombre_trabajador: str, jefe: str, crown_origen: str, crown_destino: str):
         """
@@ -1231,6 +3085,7 @@ class OptimizedTablaIncidencias:
 
                 incidencia.coste_hora = float(empleado_info.get('coste_hora', 0.0) or 0.0)
 
+    @st.fragment
     def _render_main_table_paginated(self, incidencias: List[Incidencia], selected_jefe: str) -> None:
         """
         Renderiza tabla principal con paginación.
@@ -1243,6 +3098,10 @@ class OptimizedTablaIncidencias:
         - 50 filas por página
         - Navegación numérica
         - Edición inline
+        
+        Es un fragmento: cambiar de página o editar celdas no recarga el resto
+        de la página; guardar o borrar sí (rerun_app), porque cambian los
+        totales de exportación.
         """
         st.header("📊 Tabla de Incidencias")
         
@@ -1267,6 +3126,7 @@ class OptimizedTablaIncidencias:
 
         self._render_table_page(incidencias_pagina, selected_jefe, start_idx)
 
+    @timed("table_page")
     def _render_table_page(self, incidencias_pagina: List[Incidencia], selected_jefe: str, start_idx: int) -> None:
         """
         Renderiza una página específica de la tabla.
@@ -1285,31 +3145,7 @@ class OptimizedTablaIncidencias:
         current_hash = self._get_incidencias_hash(incidencias_pagina)
 
         if cache_key not in st.session_state or st.session_state[cache_key] != current_hash:
-            precios_nocturnidad = [
-                self.data_manager.get_precio_nocturnidad(inc.categoria, inc.cod_reg_convenio)
-                for inc in incidencias_pagina
-            ]
-            df_data = [inc.to_dict(precios_nocturnidad[i]) for i, inc in enumerate(incidencias_pagina)]
-            df = pd.DataFrame(df_data)
-
-            # if not df.empty and 'Fecha' in df.columns:
-            #     df['Fecha'] = df['Fecha'].apply(self._format_fecha_safe)
-
-            text_cols = [
-                "Código Crown Origen", "Código Crown Destino", "Centro preferente","Fecha","Observaciones"
-            ]
-            for col in text_cols:
-                if col in df.columns:
-                    df[col] = df[col].astype(str).replace('nan', '').replace('None', '')
-
-            numeric_cols = [
-                "Incidencia_horas", "Incidencia_precio", "Nocturnidad_horas", 
-                "Precio_nocturnidad", "Traslados_total", "Coste hora empresa"
-            ]
-            for col in numeric_cols:
-                if col in df.columns:
-                    df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0)
-
+            df = self._build_page_dataframe(incidencias_pagina)
             st.session_state.cached_df = df
             st.session_state[cache_key] = current_hash
         else:
@@ -1319,14 +3155,21 @@ class OptimizedTablaIncidencias:
             st.info("No hay datos para mostrar")
             return
 
-        todos_empleados = self.data_manager.get_all_employees()
-        centros_crown = self.data_manager.get_centros_crown()
+        # Opciones de la zona del jefe, más los valores ya presentes en la página
+        # (p. ej. coberturas de otra zona) para que sigan siendo válidos
+        zona = self._jefe_zona(selected_jefe)
+        todos_empleados = self.data_manager.get_all_employees(zona)
+        centros_crown = self.data_manager.get_centros_crown(zona)
+        if zona:
+            todos_empleados = sorted(set(todos_empleados) | (set(df["Trabajador"]) - {""}))
+            centros_crown = [""] + sorted(set(centros_crown[1:]) | (set(df["Código Crown Destino"]) - {""}))
 
         column_config = {
             "Borrar": st.column_config.CheckboxColumn("Borrar", help="Selecciona las filas a borrar", default=False),
+            "Estado": st.column_config.TextColumn("Estado", disabled=True, width="medium", help="Campos pendientes para poder exportar la fila"),
             "Trabajador": st.column_config.SelectboxColumn("Trabajador", options=[""] + todos_empleados, required=True, width="medium"),
-            "Facturable": st.column_config.SelectboxColumn("Facturable", options=["", "Sí", "No"], required=True, width="small"),
-            "Motivo": st.column_config.SelectboxColumn("Motivo", options=["Absentismo", "Refuerzo", "Eventos", "Festivos y Fines de Semana", "Permiso retribuido", "Puesto pendiente de cubrir","Formación","Otros","Nocturnidad"], required=True, width="medium"),
+            "Facturable": st.column_config.SelectboxColumn("Facturable", options=[""] + FACTURABLE_OPCIONES, required=True, width="small"),
+            "Motivo": st.column_config.SelectboxColumn("Motivo", options=MOTIVOS_INCIDENCIA, required=True, width="medium"),
             "Código Crown Origen": st.column_config.TextColumn("Crown Origen", disabled=True, help="Centro preferente del trabajador"),
             "Código Crown Destino": st.column_config.SelectboxColumn("Crown Destino", options=centros_crown, required=True),
             "Nombre Crown Destino": st.column_config.TextColumn("Nombre Crown Destino", disabled=True, width="medium"),
@@ -1337,7 +3180,7 @@ class OptimizedTablaIncidencias:
             "Precio_nocturnidad": st.column_config.NumberColumn("Precio Noct.",  min_value=0, disabled=True, format="€%.2f"),
             "Traslados_total": st.column_config.NumberColumn("Traslados",  min_value=0),
             "Coste hora empresa": st.column_config.NumberColumn("Coste/Hora", disabled=True,  format="€%.2f"),
-            "Fecha": st.column_config.TextColumn("Fecha", help="Ingresa una fecha o periodo",default="",required=True, width="medium"),
+            "Fecha": st.column_config.TextColumn("Fecha", help="Fecha, rango o lista: 15/07, 01/07-15/07, 1, 3 y 5/07, julio",default="",required=True, width="medium"),
             "Observaciones": st.column_config.TextColumn("Observaciones", required=True, width="medium"),
         }
 
@@ -1377,15 +3220,59 @@ class OptimizedTablaIncidencias:
             if st.button("🗑️ Borrar Todas", use_container_width=True, key="btn_delete_all"):
                 if st.session_state.incidencias:
                     st.session_state.incidencias = []
+                    _reiniciar_indices()
                     if "table_data_hash" in st.session_state:
                         del st.session_state["table_data_hash"]
                     if "cached_df" in st.session_state:
                         del st.session_state["cached_df"]
-                    st.success("✅ Todas las incidencias han sido borradas")
-                    st.rerun()
+                    flash("✅ Todas las incidencias han sido borradas")
+                    rerun_app()
                 else:
                     st.info("ℹ️ No hay incidencias para borrar")
     
+    def _build_page_dataframe(self, incidencias_pagina: List[Incidencia]) -> pd.DataFrame:
+        """
+        Prepara el DataFrame de una página de la tabla (sin renderizar).
+        
+        Parámetros:
+        - incidencias_pagina (List[Incidencia]): Incidencias de la página
+        
+        Retorna:
+        - pd.DataFrame: Una fila por incidencia con estado de validación
+          (y aviso de duplicado en el mes), precio de nocturnidad, columnas de texto limpias y columnas
+          numéricas sin nulos
+        """
+        validacion = validate_incidencias(incidencias_pagina, self.data_manager)
+        df_data = [inc.to_dict(precio) for inc, precio in zip(incidencias_pagina, validacion.precio_nocturnidad)]
+        df = pd.DataFrame(df_data)
+        if not df.empty:
+            # Los duplicados se buscan en todo el mes, no solo en la página
+            indice = get_duplicate_index()
+            estado = [
+                f"{texto} · 🔁 Duplicada" if indice.count(inc) > 1 else texto
+                for texto, inc in zip(validacion.estado(), incidencias_pagina)
+            ]
+            df.insert(1, "Estado", estado)
+
+        # if not df.empty and 'Fecha' in df.columns:
+        #     df['Fecha'] = df['Fecha'].apply(self._format_fecha_safe)
+
+        text_cols = [
+            "Código Crown Origen", "Código Crown Destino", "Centro preferente","Fecha","Observaciones"
+        ]
+        for col in text_cols:
+            if col in df.columns:
+                df[col] = df[col].astype(str).replace('nan', '').replace('None', '')
+
+        numeric_cols = [
+            "Incidencia_horas", "Incidencia_precio", "Nocturnidad_horas", 
+            "Precio_nocturnidad", "Traslados_total", "Coste hora empresa"
+        ]
+        for col in numeric_cols:
+            if col in df.columns:
+                df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0)
+        return df
+
     def _delete_selected_rows(self, start_idx: int, edited_df: pd.DataFrame) -> None:
         """
         Elimina filas marcadas con checkbox 'Borrar'.
@@ -1414,9 +3301,11 @@ class OptimizedTablaIncidencias:
             return
         
         # Eliminar las incidencias marcadas (en orden inverso para mantener índices correctos)
+        get_duplicate_index()
         deleted_count = 0
         for idx in sorted(indices_to_delete, reverse=True):
             if 0 <= idx < len(incidents):
+                _registrar_bajas([incidents[idx]])
                 del incidents[idx]
                 deleted_count += 1
         
@@ -1439,9 +3328,10 @@ class OptimizedTablaIncidencias:
         # Establecer flag de cambios
         st.session_state.rows_deleted = True
         
-        # Mensaje de confirmación
+        # Mensaje de confirmación y recarga completa (cambian tabla y exportación)
         if deleted_count > 0:
-            st.success(f"✅ {deleted_count} fila(s) eliminada(s) correctamente. Interactúa con la aplicación para ver los cambios.")
+            flash(f"✅ {deleted_count} fila(s) eliminada(s) correctamente.")
+        rerun_app()
 
     def _format_fecha_safe(self, fecha):
         """Formateo seguro de fechas, devuelve objeto date o pd.NaT"""
@@ -1457,11 +3347,15 @@ class OptimizedTablaIncidencias:
         return pd.NaT
 
     def _get_incidencias_hash(self, incidencias: List[Incidencia]) -> str:
-        data = []
+        # Incluye las repeticiones de cada clave: un duplicado en otra página cambia el Estado
+        indice = get_duplicate_index()
+        data = [str(indice.count(inc)) for inc in incidencias]
         for inc in incidencias:
-            data.append(f"{inc.trabajador}|{inc.motivo}|{inc.fecha}|{inc.incidencia_horas}|{inc.incidencia_precio}")
+            data.append(f"{inc.trabajador}|{inc.facturable}|{inc.motivo}|{inc.codigo_crown_destino}|{inc.fecha}|"
+                        f"{inc.incidencia_horas}|{inc.incidencia_precio}|{inc.nocturnidad_horas}")
         return hashlib.md5("||".join(map(str, data)).encode()).hexdigest()
 
+    @timed("process_page_changes")
     def _process_page_changes(self, start_idx: int, edited_df: pd.DataFrame) -> None:
         """
         Procesa y guarda cambios de la página actual.
@@ -1502,6 +3396,7 @@ class OptimizedTablaIncidencias:
 
         new_incidents = []
         changes_made = False
+        bajas, altas = [], []  # para actualizar los índices incrementales
         
         for i, inc in enumerate(incidents_to_update):
             is_on_current_page = start_idx <= i < start_idx + self.ROWS_PER_PAGE
@@ -1512,6 +3407,7 @@ class OptimizedTablaIncidencias:
                 # Si está marcado para borrar, no lo incluimos
                 if row_data.get("Borrar", False):
                     changes_made = True
+                    bajas.append(inc)
                     continue
 
                 filtered_data = {}
@@ -1571,11 +3467,21 @@ class OptimizedTablaIncidencias:
                     changes_made = True
 
                 new_incidents.append(new_inc)
+                bajas.append(inc)
+                altas.append(new_inc)
             else:
                 new_incidents.append(inc)
 
-        # Actualizar las incidencias
+        # Sin cambios no hay nada que invalidar: solo se recarga la tabla
+        if not changes_made:
+            st.info("ℹ️ No se detectaron cambios para guardar.")
+            return
+
+        # Actualizar las incidencias (y los índices: solo cambian las filas de la página)
+        get_duplicate_index()
         st.session_state.incidencias = new_incidents
+        _registrar_bajas(bajas)
+        _registrar_altas(altas)
 
         # Limpiar caché para forzar regeneración en el próximo render
         if "table_data_hash" in st.session_state:
@@ -1586,48 +3492,81 @@ class OptimizedTablaIncidencias:
         # Establecer un flag para indicar que se guardaron cambios
         st.session_state.changes_saved = True
         
-        # Mensaje de éxito
-        if changes_made:
-            st.success("✅ ¡Cambios guardados con éxito! Los cambios se reflejarán al interactuar con la aplicación.")
-        else:
-            st.info("ℹ️ No se detectaron cambios para guardar.")
-        st.rerun()
+        # Mensaje de éxito y recarga completa (cambian los totales de exportación)
+        flash("✅ ¡Cambios guardados con éxito!")
+        rerun_app()
 
 
 # =============================================================================
 # EXPORT MANAGER OPTIMIZADO
 # =============================================================================
 
+# Filas por bloque al escribir el Excel (cada bloque informa del progreso)
+EXCEL_CHUNK_ROWS = 5000
+
+# Columnas que la hoja "Reparto diario" divide entre los días de cada incidencia
+REPARTO_DIARIO_IMPORTES = (
+    'Cuantía', 'Cuantía nocturnidad', 'Horas traslado', '73_plus_sustitucion',
+    '72_incentivos', '70_71_festivos', '74_plus_nocturnidad', 'Coste_total',
+)
+
 class OptimizedExportManager:
     """
     Gestiona la exportación de incidencias a Excel.
     """
     @staticmethod
-    def export_to_excel(incidencias: List[Incidencia], data_manager: OptimizedDataManager) -> Optional[bytes]:
+    @timed("export")
+    def export_to_excel(incidencias: List[Incidencia], data_manager: OptimizedDataManager,
+                        validacion: Optional[ValidationResult] = None,
+                        reparto_diario: bool = False) -> Optional[bytes]:
         """
         Exporta incidencias válidas a Excel.
         
         Parámetros:
         - incidencias (List[Incidencia]): Lista completa
         - data_manager (OptimizedDataManager): Gestor de datos
+        - validacion (Optional[ValidationResult]): Validación ya calculada de
+          `incidencias` (si no se pasa, se calcula aquí)
+        - reparto_diario (bool): Añade la hoja "Reparto diario" (una fila por
+          incidencia y día, importes repartidos a partes iguales)
         
         Retorna:
         - bytes: Archivo Excel en memoria o None si no hay válidas
+        """
+        export = OptimizedExportManager.build_export_dataframe(incidencias, data_manager, validacion)
+        if export is None:
+            return None
+        df, fechas = export
+        return OptimizedExportManager.to_excel_bytes(df, fechas, reparto_diario)
+
+    @staticmethod
+    @timed("export_build")
+    def build_export_dataframe(incidencias: List[Incidencia], data_manager: OptimizedDataManager,
+                               validacion: Optional[ValidationResult] = None) -> Optional[Tuple[pd.DataFrame, FechasResult]]:
+        """
+        Construye el DataFrame de exportación (el mismo que se archiva en el histórico).
+        
+        Parámetros:
+        - incidencias (List[Incidencia]): Lista completa
+        - data_manager (OptimizedDataManager): Gestor de datos
+        - validacion (Optional[ValidationResult]): Validación ya calculada
+        
+        Retorna:
+        - Tuple[pd.DataFrame, FechasResult]: Filas exportadas y sus fechas
+          interpretadas, o None si no hay válidas
         
         Procesamiento:
-        1. Filtra solo incidencias válidas
-        2. Calcula precios de nocturnidad
-        3. Añade columnas calculadas
-        4. Genera Excel con openpyxl
+        1. Filtra solo incidencias válidas (validate_incidencias)
+        2. Reutiliza los precios de nocturnidad de la validación
+        3. Normaliza Fecha en Fecha inicio / Fecha fin / Días (parse_fechas)
+        4. Añade columnas calculadas
         """
-        incidencias_validas = [inc for inc in incidencias if inc.is_valid()]
+        if validacion is None:
+            validacion = validate_incidencias(incidencias, data_manager)
+        incidencias_validas = validacion.filtrar(incidencias)
         if not incidencias_validas:
             return None
-
-        unique_keys = set((i.categoria, i.cod_reg_convenio) for i in incidencias_validas)
-        precios_nocturnidad = {
-            key: data_manager.get_precio_nocturnidad(key[0], key[1]) for key in unique_keys
-        }
+        precios_nocturnidad = validacion.precio_nocturnidad[validacion.validas]
 
         data = [
             {
@@ -1644,7 +3583,7 @@ class OptimizedExportManager:
                 'Cuantía': inc.incidencia_horas,
                 'Precio': inc.incidencia_precio,
                 'Cuantía nocturnidad': inc.nocturnidad_horas,
-                'Precio_nocturnidad': precios_nocturnidad.get((inc.categoria, inc.cod_reg_convenio), 0.0),
+                'Precio_nocturnidad': precio_nocturnidad,
                 'Horas traslado': inc.traslados_total,
                 'coste_hora': inc.coste_hora,
                 'Empresa Origen': inc.centro_preferente,
@@ -1652,20 +3591,29 @@ class OptimizedExportManager:
                 'Fecha': inc.fecha,
                 'Observaciones': inc.observaciones,
                 "cod_reg_convenio": inc.cod_reg_convenio,
-                'porcen_contrato': data_manager.get_empleado_info(inc.trabajador).get('porcen_contrato', ''),
-                'cod_empresa': data_manager.get_empleado_info(inc.trabajador).get('cod_empresa', ''),
-                'nombre_centro': data_manager.get_empleado_info(inc.trabajador).get('nombre_centro_preferente', ''),
             }
-            for inc in incidencias_validas
+            for inc, precio_nocturnidad in zip(incidencias_validas, precios_nocturnidad)
         ]
 
         df = pd.DataFrame(data)
+        empleados = data_manager.empleado_lookup
+        filas = empleados.rows(inc.trabajador for inc in incidencias_validas)
+        df['porcen_contrato'] = empleados.column('porcen_contrato', filas)
+        df['cod_empresa'] = empleados.column('cod_empresa', filas)
+        df['nombre_centro'] = empleados.column('nombre_centro_preferente', filas)
         
         for col in ['codigo_crown_origen', 'codigo_crown_destino', 'centro_preferente']:
             if col in df.columns:
                 df[col] = df[col].astype(str).replace('nan', '').replace('None', '')
         
-        OptimizedExportManager._add_calculated_columns(df)
+        anio, mes = periodo_referencia(incidencias_validas[0].imputacion_nomina, data_manager.periodo)
+        fechas = parse_fechas(df['Fecha'], anio, mes)
+        posicion = df.columns.get_loc('Fecha') + 1
+        df.insert(posicion, 'Fecha inicio', fechas.resumen['inicio'].dt.date)
+        df.insert(posicion + 1, 'Fecha fin', fechas.resumen['fin'].dt.date)
+        df.insert(posicion + 2, 'Días', fechas.resumen['dias'])
+
+        OptimizedExportManager._add_calculated_columns(df, data_manager)
         OptimizedExportManager._add_final_calculations(df)
 
 
@@ -1674,18 +3622,53 @@ class OptimizedExportManager:
         #                     "centro_preferente","cod_empresa","nombre_centro","73_plus_sustitucion",
         #                     "72_incentivos","70_71_festivos","74_plus_nocturnidad"], errors="ignore")
 
+        return df, fechas
+
+    @staticmethod
+    @timed("export_xlsx")
+    def to_excel_bytes(df: pd.DataFrame, fechas: FechasResult, reparto_diario: bool = False,
+                       progreso: Optional[Callable[[float], None]] = None) -> bytes:
+        """
+        Escribe el DataFrame de exportación (y, si se pide, su reparto diario) con openpyxl.
+        
+        Parámetros:
+        - df (pd.DataFrame): Salida de build_export_dataframe
+        - fechas (FechasResult): Fechas interpretadas de esas filas
+        - reparto_diario (bool): Añade la hoja "Reparto diario"
+        - progreso (Optional[Callable[[float], None]]): Recibe la fracción escrita
+          (0..1) cada EXCEL_CHUNK_ROWS filas; si lanza una excepción, la
+          escritura se interrumpe (cancelación de trabajos en segundo plano)
+        
+        Retorna:
+        - bytes: Libro .xlsx
+        """
+        hojas = [('Sheet1', df)]
+        if reparto_diario:
+            hojas.append(('Reparto diario', fechas.reparto_diario(df, REPARTO_DIARIO_IMPORTES)))
+        total = sum(len(hoja) for _, hoja in hojas) or 1
+        escritas = 0
+
         excel_buffer = io.BytesIO()
-        df.to_excel(excel_buffer, index=False, engine='openpyxl')
+        with pd.ExcelWriter(excel_buffer, engine='openpyxl') as writer:
+            for nombre, hoja in hojas:
+                for inicio in range(0, max(len(hoja), 1), EXCEL_CHUNK_ROWS):
+                    bloque = hoja.iloc[inicio:inicio + EXCEL_CHUNK_ROWS]
+                    bloque.to_excel(writer, index=False, sheet_name=nombre,
+                                    header=inicio == 0, startrow=0 if inicio == 0 else inicio + 1)
+                    escritas += len(bloque)
+                    if progreso is not None:
+                        progreso(escritas / total)
         excel_buffer.seek(0)
         return excel_buffer.getvalue()
 
     @staticmethod
-    def _add_calculated_columns(df: pd.DataFrame) -> None:
+    def _add_calculated_columns(df: pd.DataFrame, data_manager: OptimizedDataManager) -> None:
         """
         Añade columnas calculadas según motivo.
         
         Parámetros:
         - df (pd.DataFrame): DataFrame a procesar
+        - data_manager (OptimizedDataManager): Gestor del maestro del periodo (hoja cuenta_motivos)
         
         Columnas añadidas:
         - 73_plus_sustitucion
@@ -1698,12 +3681,15 @@ class OptimizedExportManager:
         - Calcula totales según categoría
         """
         try:
-            df_motivos = _load_single_sheet('data/maestros.xlsx', 'cuenta_motivos', _get_file_hash('data/maestros.xlsx'))
+            df_motivos = data_manager.load_sheet('cuenta_motivos')
             if df_motivos is None or df_motivos.empty:
                 df_motivos = pd.DataFrame({'Motivo': [], 'desc_cuenta': []})
             else:
-                df_motivos['Motivo'] = df_motivos.get('Motivo', pd.Series([], dtype=str)).fillna('')
-                df_motivos['desc_cuenta'] = df_motivos.get('desc_cuenta', pd.Series([], dtype=str)).fillna('')
+                # assign: la hoja cacheada es compartida y no se modifica
+                df_motivos = df_motivos.assign(
+                    Motivo=df_motivos.get('Motivo', pd.Series([], dtype=str)).fillna(''),
+                    desc_cuenta=df_motivos.get('desc_cuenta', pd.Series([], dtype=str)).fillna(''),
+                )
         except Exception:
             df_motivos = pd.DataFrame({'Motivo': [], 'desc_cuenta': []})
 
@@ -1757,11 +3743,142 @@ class OptimizedExportManager:
         if all(col in df.columns for col in required_cols_coste):
             coste_incidencias = df['Cuantía'] * df['Precio']
             coste_nocturnidad = df['Cuantía nocturnidad'] * df['Precio_nocturnidad']
-            coste_con_ss = (coste_incidencias + coste_nocturnidad) * 1.3195
+            coste_con_ss = (coste_incidencias + coste_nocturnidad) * COEF_SEGURIDAD_SOCIAL
             df['Coste_total'] = coste_con_ss + df['Horas traslado']
         else:
             df['Coste_total'] = 0.0
 
+# =============================================================================
+# EXPORTACIÓN EN SEGUNDO PLANO
+# =============================================================================
+
+@st.cache_resource
+def _get_export_jobs() -> JobQueue:
+    """Cola única de exportaciones del proceso (los trabajos sobreviven a las recargas)."""
+    return JobQueue(max_workers=EXPORT_WORKERS, ttl=EXPORT_JOB_TTL)
+
+def export_job_key(incidencias: List[Incidencia], data_manager: OptimizedDataManager, reparto_diario: bool) -> Tuple:
+    """
+    Clave de caché de una exportación.
+    
+    Las ediciones sustituyen la incidencia por una copia (nunca se modifican en
+    sitio), así que la identidad de los objetos basta para saber si los datos
+    cambiaron. El trabajo guarda la lista, de modo que esos ids no se reutilizan
+    mientras su resultado siga en caché.
+    """
+    return (data_manager.file_hash, reparto_diario, hash(tuple(map(id, incidencias))))
+
+def run_export_job(ctx: JobContext, incidencias: List[Incidencia], data_manager: OptimizedDataManager,
+                   validacion: Optional[ValidationResult], reparto_diario: bool) -> Optional[Dict]:
+    """
+    Trabajo de exportación (se ejecuta en un hilo de _get_export_jobs).
+    
+    Parámetros:
+    - ctx (JobContext): Progreso y cancelación
+    - incidencias (List[Incidencia]): Copia de la lista en el momento de pedirlo
+    - data_manager, validacion, reparto_diario: Como en export_to_excel
+    
+    Retorna:
+    - Dict: excel (bytes), df (para archivarlo en el histórico al descargar) y
+      filas; None si no hay incidencias válidas
+    """
+    with span("export_job"):
+        ctx.progress(0.05, "Preparando filas...")
+        export = OptimizedExportManager.build_export_dataframe(incidencias, data_manager, validacion)
+        if export is None:
+            return None
+        df, fechas = export
+        ctx.progress(0.3, "Escribiendo Excel...")
+        excel = OptimizedExportManager.to_excel_bytes(
+            df, fechas, reparto_diario,
+            progreso=lambda fraccion: ctx.progress(0.3 + 0.7 * fraccion, f"Escribiendo Excel ({fraccion:.0%})..."),
+        )
+        return {'excel': excel, 'df': df, 'filas': len(df)}
+
+# =============================================================================
+# HISTÓRICO DE EXPORTACIONES
+# =============================================================================
+
+@st.cache_resource
+def _get_history_store() -> HistoryStore:
+    """Histórico único del proceso (mantiene el cubo agregado entre sesiones)."""
+    return HistoryStore(HISTORICO_DIR)
+
+def archive_export(df: pd.DataFrame, periodo: str, jefe: str) -> None:
+    """
+    Callback de la descarga: archiva la exportación en el histórico.
+    
+    Parámetros:
+    - df (pd.DataFrame): DataFrame exportado (build_export_dataframe)
+    - periodo (str): "YYYY-MM"
+    - jefe (str): Jefe seleccionado
+    
+    Un fallo al archivar no debe impedir la descarga: se avisa en la sección
+    de exportación y el histórico conserva la versión anterior.
+    """
+    try:
+        with span("history_append"):
+            _get_history_store().append(df, periodo, jefe)
+        st.session_state.ultimo_archivado = f"{periodo} · {jefe} ({len(df)} filas, {datetime.now():%H:%M})"
+    except Exception as e:
+        st.session_state.ultimo_archivado = f"⚠️ no se pudo archivar ({type(e).__name__}: {e})"
+
+def run_bundle_job(ctx: JobContext, periodo: str) -> Optional[Dict]:
+    """
+    Paquete de nóminas de un mes (se ejecuta en un hilo de _get_export_jobs).
+    
+    Parámetros:
+    - ctx (JobContext): Progreso y cancelación
+    - periodo (str): "YYYY-MM"
+    
+    Retorna:
+    - Dict: zip (ruta del ZIP en BUNDLE_DIR), manifest, bytes y filas;
+      None si el mes no tiene exportaciones archivadas
+    
+    Procesamiento:
+    1. Lee del histórico las exportaciones del mes (todas las de cada jefe)
+    2. build_bundle: un libro por "Jefe de Operaciones" (nombre_jefe_ope) más
+       el conjunto, escritos en paralelo en BUNDLE_WORKERS procesos y añadidos
+       al ZIP según terminan
+    
+    El ZIP queda en disco, no en el trabajo; los de trabajos caducados se
+    borran al generar el siguiente.
+    """
+    with span("bundle_job"):
+        ctx.progress(0.02, "Leyendo el histórico del mes...")
+        df = _get_history_store().read_period(periodo)
+        if df.empty:
+            return None
+
+        BUNDLE_DIR.mkdir(parents=True, exist_ok=True)
+        caducidad = time.time() - EXPORT_JOB_TTL
+        for viejo in BUNDLE_DIR.glob("*.zip"):
+            if viejo.stat().st_mtime < caducidad:
+                viejo.unlink(missing_ok=True)
+
+        ruta = BUNDLE_DIR / f"nominas_{periodo}_{datetime.now():%Y%m%d_%H%M%S}_{os.getpid()}.zip"
+        ctx.progress(0.05, f"Generando libros de {len(df):,} incidencias...")
+        manifest = build_bundle(
+            df, str(ruta), columna_jefe="Jefe de Operaciones", max_workers=BUNDLE_WORKERS or None,
+            progreso=lambda fraccion, mensaje: ctx.progress(0.05 + 0.95 * fraccion, mensaje),
+        )
+        return {'zip': ruta, 'manifest': manifest, 'bytes': ruta.stat().st_size, 'filas': len(df)}
+
+# =============================================================================
+# TELEMETRÍA
+# =============================================================================
+
+@st.cache_resource
+def _get_metrics_exporter() -> Optional[MetricsExporter]:
+    """Exportador único del proceso (None si METRICS_DIR no está configurado)."""
+    if not METRICS_DIR:
+        return None
+    return MetricsExporter(METRICS_DIR, METRICS_FLUSH_SECONDS, max_log_bytes=int(METRICS_LOG_MAX_MB * 1024 * 1024))
+
+def _debug_panel_enabled() -> bool:
+    """El panel de telemetría está oculto salvo con ?debug=1 o DEBUG_PANEL=1."""
+    return DEBUG_PANEL or st.query_params.get("debug") == "1"
+
 # =============================================================================
 # APLICACIÓN PRINCIPAL
 # =============================================================================
@@ -1779,16 +3896,22 @@ class OptimizedIncidenciasApp:
         - selected_jefe: Supervisor actual
         - selected_imputacion: Mes seleccionado
         - incidencias: Lista de incidencias
+        - dup_index: Índice de duplicados (DuplicateIndex)
         - data_manager: Instancia del gestor
         """
+        if PREWARM:
+            _prewarm_process()
+
         if 'app_initialized_optimized' not in st.session_state:
-            st.session_state.app_initialized_optimized = True
             st.session_state.selected_jefe = ""
             st.session_state.selected_imputacion = ""
             st.session_state.incidencias = []
-            st.session_state.data_manager = OptimizedDataManager()
+            _reiniciar_indices()
+            st.session_state.data_manager = get_data_manager(st.session_state.selected_imputacion)
             st.session_state.selected_crown_code_origen = ""
             st.session_state.selected_crown_code_destino = ""
+            # Al final: si el maestro no carga (SheetSchemaError), la próxima recarga lo reintenta
+            st.session_state.app_initialized_optimized = True
 
     def run(self):
         """
@@ -1799,14 +3922,37 @@ class OptimizedIncidenciasApp:
         2. Renderiza header con selectores
         3. Muestra tabla si hay jefe e imputación
         4. Habilita exportación si hay datos
+        
+        Toda la recarga se mide como una traza de telemetría (una fase por
+        sección); el panel de depuración solo se muestra con ?debug=1.
+        Con ?profile=1 (o ?profile=alloc) cada recarga de la sesión se perfila.
         """
+        with rerun_trace(on_finish=self._on_rerun_finished):
+            with self._profiling():
+                self._run_phases()
+
+        if _debug_panel_enabled():
+            self._render_debug_panel()
+
+    def _run_phases(self):
+        """Secuencia de render de una recarga (ver run)."""
+        vista = st.sidebar.radio("Vista", ["📋 Registro", "📊 Cuadro de mando", "📚 Histórico"], key="vista_app")
+        if vista == "📚 Histórico":
+            self._render_history_page()
+            return
+
         data_manager = st.session_state.data_manager
+        if vista == "📊 Cuadro de mando":
+            self._render_cost_dashboard(data_manager)
+            return
 
         if data_manager.file_hash == "FILE_NOT_FOUND":
-            st.error("⚠️ No se pudieron cargar los datos. Verifica que el archivo 'data/maestros.xlsx' exista.")
+            st.error(f"⚠️ No se pudieron cargar los datos. Verifica que el archivo '{data_manager.file_path}' exista.")
             return
 
         self._render_header(data_manager)
+        # El cambio de imputación puede haber cambiado el maestro del periodo
+        data_manager = st.session_state.data_manager
 
         if not st.session_state.selected_jefe or not st.session_state.selected_imputacion:
             st.warning("⚠️ Por favor, selecciona la imputación de nómina y un jefe para comenzar.")
@@ -1817,6 +3963,364 @@ class OptimizedIncidenciasApp:
 
         self._render_export_section(data_manager)
 
+    @contextmanager
+    def _profiling(self):
+        """
+        Perfila la recarga si la sesión lo ha pedido.
+        
+        Activación:
+        - ?profile=1: todas las recargas de la sesión, solo muestreo de pilas
+        - ?profile=alloc: además, top-N de asignaciones con tracemalloc
+        - Botón del panel de depuración: solo la siguiente recarga
+        
+        Resultado: <PROFILES_DIR>/rerun_<fecha>_<sesión>.folded (+ .alloc.txt; se
+        conservan los PROFILES_KEEP más recientes),
+        resumido en st.session_state.last_profile.
+        """
+        modo = st.query_params.get("profile")
+        pendiente = st.session_state.pop('profile_next_rerun', None)
+        if modo not in ("1", "alloc") and pendiente is None:
+            yield
+            return
+
+        alloc = modo == "alloc" or bool(pendiente and pendiente.get('alloc'))
+        ctx = get_script_run_ctx(suppress_warning=True)
+        sesion = "".join(c for c in ctx.session_id if c.isalnum())[:8] if ctx else "local"
+        nombre = f"rerun_{datetime.now():%Y%m%d_%H%M%S_%f}_{sesion}"
+        with profile_to_dir(PROFILES_DIR, nombre, PROFILE_INTERVAL_MS / 1000, PROFILE_ALLOC_TOP if alloc else 0,
+                            keep=PROFILES_KEEP) as result:
+            try:
+                yield
+            finally:
+                st.session_state.last_profile = result
+
+    def _on_rerun_finished(self, phases: List[Tuple[str, float]], total: float) -> None:
+        """
+        Guarda el desglose de la recarga en la sesión y lo vuelca a disco.
+        
+        Parámetros:
+        - phases (List[Tuple[str, float]]): (fase, segundos) en orden de cierre
+        - total (float): Duración total de la recarga en segundos
+        """
+        st.session_state.last_rerun_trace = {'total': total, 'phases': phases}
+        exporter = _get_metrics_exporter()
+        if exporter is not None:
+            data_manager = st.session_state.get('data_manager')
+            exporter.record_rerun(
+                phases, total,
+                periodo=data_manager.periodo if data_manager is not None else "",
+                incidencias=len(st.session_state.get('incidencias', [])),
+            )
+
+    @st.fragment
+    @timed("dashboard")
+    def _render_cost_dashboard(self, data_manager: OptimizedDataManager):
+        """
+        Cuadro de mando del mes en curso sobre el cubo de costes.
+        
+        Parámetros:
+        - data_manager: Gestor del maestro del periodo
+        
+        Funcionalidad:
+        - Ámbito: incidencias de esta sesión o de todas las sesiones abiertas
+        - Totales, tabla dinámica (filas × columnas × medida) y detalle de una fila
+        
+        El cubo se actualiza en cada alta, edición y baja, así que la página
+        solo agrupa unas pocas celdas ya agregadas.
+        """
+        st.header("📊 Cuadro de mando de costes")
+        ambito = st.radio("Ámbito", ["👤 Mi sesión", "🌍 Todas las sesiones abiertas"], horizontal=True, key="cubo_ambito")
+        cubo_sesion = get_cost_cube(data_manager)
+        if ambito == "👤 Mi sesión":
+            cubo = cubo_sesion.to_frame()
+        else:
+            frames = [f for f in _get_cube_registry().active_frames() if not f.empty]
+            cubo = pd.concat(frames, ignore_index=True) if frames else cubo_sesion.to_frame()
+
+        if cubo.empty:
+            st.info("💡 No hay incidencias válidas todavía. Las que completes en el registro aparecen aquí al momento.")
+            return
+
+        medidas = list(CUBE_MEASURES.values())
+        totales = cubo[medidas].sum()
+        col1, col2, col3, col4, col5 = st.columns(5)
+        with col1:
+            st.metric("📝 Incidencias", f"{int(totales['incidencias']):,}")
+        with col2:
+            st.metric("⏱️ Horas", f"{totales['horas']:,.1f}")
+        with col3:
+            st.metric("🌙 Nocturnidad", f"€{totales['nocturnidad']:,.2f}")
+        with col4:
+            st.metric("🚗 Traslados", f"€{totales['traslados']:,.2f}")
+        with col5:
+            st.metric("📊 Total con SS", f"€{totales['total_ss']:,.2f}")
+
+        dimensiones = list(CUBE_DIMENSIONS)
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            filas = st.selectbox("Filas", dimensiones, index=dimensiones.index("Centro"), key="cubo_filas")
+        with col2:
+            opciones_columnas = ["—"] + [d for d in dimensiones if d != filas]
+            columnas = st.selectbox("Columnas", opciones_columnas, index=opciones_columnas.index("Motivo") if filas != "Motivo" else 0,
+                                    key="cubo_columnas")
+        with col3:
+            medida = st.selectbox("Medida", list(CUBE_MEASURES), index=list(CUBE_MEASURES).index("Total con SS (€)"), key="cubo_medida")
+
+        campo_filas, campo_medida = CUBE_DIMENSIONS[filas], CUBE_MEASURES[medida]
+        if columnas == "—":
+            pivote = cubo.groupby(campo_filas)[[campo_medida]].sum().rename(columns={campo_medida: medida})
+        else:
+            pivote = cubo.pivot_table(index=campo_filas, columns=CUBE_DIMENSIONS[columnas], values=campo_medida,
+                                      aggfunc="sum", fill_value=0)
+            pivote.columns.name = columnas
+            pivote["Total"] = pivote.sum(axis=1)
+        pivote = pivote.sort_values(pivote.columns[-1], ascending=False)
+        pivote.index.name = filas
+        st.dataframe(pivote, use_container_width=True)
+
+        # Detalle: una fila de la tabla desglosada por el resto de dimensiones
+        valor = st.selectbox(f"🔎 Detalle de {filas.lower()}", [""] + list(pivote.index), key="cubo_detalle")
+        if valor:
+            resto = [CUBE_DIMENSIONS[d] for d in dimensiones if d != filas]
+            detalle = (
+                cubo[cubo[campo_filas] == valor]
+                .groupby(resto, as_index=False)[medidas].sum()
+                .sort_values("total_ss", ascending=False)
+                .rename(columns={v: k for k, v in CUBE_DIMENSIONS.items()} | {v: k for k, v in CUBE_MEASURES.items()})
+            )
+            st.dataframe(detalle, hide_index=True, use_container_width=True)
+
+    @st.fragment
+    @timed("history")
+    def _render_history_page(self):
+        """
+        Página de histórico: consultas agrupadas sobre las exportaciones archivadas.
+        
+        Controles:
+        - Agrupar por (mes, jefe, centro, motivo, servicio, categoría)
+        - Medidas a sumar y rango de meses / jefes
+        
+        Las consultas van contra el cubo del histórico (HistoryStore.cube), no
+        contra las incidencias, así que responden en milisegundos.
+        """
+        st.header("📚 Histórico de exportaciones")
+        store = _get_history_store()
+        particiones = store.partitions()
+        if particiones.empty:
+            st.info(f"💡 Aún no hay exportaciones archivadas en {HISTORICO_DIR}. "
+                    "Cada descarga del Excel de incidencias se guarda aquí (una por mes y jefe).")
+            return
+
+        periodos = sorted(particiones['periodo'].unique())
+        col1, col2 = st.columns(2)
+        with col1:
+            por = st.multiselect("Agrupar por", list(DIMENSIONES), default=["Mes", "Centro"], key="hist_por")
+            medidas = st.multiselect("Medidas", list(MEDIDAS), default=["Coste total", "Horas"], key="hist_medidas")
+        with col2:
+            if len(periodos) > 1:
+                desde, hasta = st.select_slider("Meses", options=periodos, value=(periodos[max(0, len(periodos) - 6)], periodos[-1]),
+                                                key="hist_meses")
+            else:
+                desde = hasta = periodos[0]
+                st.caption(f"📅 Mes archivado: {periodos[0]}")
+            jefes = st.multiselect("Jefes (vacío = todos)", sorted(particiones['jefe'].unique()), key="hist_jefes")
+
+        if not medidas:
+            st.warning("⚠️ Selecciona al menos una medida.")
+            return
+
+        columnas_por = [DIMENSIONES[d] for d in por]
+        resultado, stats = store.query(columnas_por, [MEDIDAS[m] for m in medidas], desde, hasta, jefes)
+        resultado = resultado.rename(columns={v: k for k, v in DIMENSIONES.items()} | {v: k for k, v in MEDIDAS.items()})
+        st.caption(f"⚡ {len(resultado)} grupos de {stats['incidencias']:,} incidencias en {stats['ms']:.1f} ms")
+
+        if "Mes" in por and len(por) <= 2 and not resultado.empty:
+            medida = medidas[0]
+            otra = next((d for d in por if d != "Mes"), None)
+            if otra:
+                # Las 10 series con más peso; el resto se ve en la tabla
+                top = resultado.groupby(otra)[medida].sum().nlargest(10).index
+                serie = resultado[resultado[otra].isin(top)].pivot_table(index="Mes", columns=otra, values=medida, aggfunc="sum")
+            else:
+                serie = resultado.set_index("Mes")[[medida]]
+            st.line_chart(serie, use_container_width=True)
+
+        st.dataframe(resultado, hide_index=True, use_container_width=True)
+        st.download_button(
+            "⬇️ Descargar consulta (CSV)",
+            data=resultado.to_csv(index=False, sep=';').encode('utf-8-sig'),
+            file_name=f"historico_{desde}_{hasta}.csv",
+            mime="text/csv",
+            key="btn_history_csv",
+        )
+
+        with st.expander(f"🗂️ Particiones archivadas ({len(particiones)})", expanded=False):
+            st.dataframe(particiones, hide_index=True, use_container_width=True)
+
+        self._render_bundle_section(particiones)
+
+    def _render_bundle_section(self, particiones: pd.DataFrame):
+        """
+        Acción de administración: paquete de nóminas del mes (ZIP con un Excel
+        por jefe de operaciones, uno conjunto y el manifiesto).
+        
+        Se genera en segundo plano con la misma cola que las exportaciones; la
+        clave incluye la fecha de cada partición del mes, así que volver a
+        pedirlo sin cambios reutiliza el ZIP ya generado.
+        """
+        with st.expander("📦 Paquete de nóminas por jefe", expanded=False):
+            periodos = sorted(particiones['periodo'].unique(), reverse=True)
+            periodo = st.selectbox("Mes", periodos, key="bundle_periodo")
+            del_mes = particiones[particiones['periodo'] == periodo]
+            st.caption(f"{del_mes['filas'].sum():,} incidencias archivadas de {len(del_mes)} exportaciones. "
+                       "Un Excel por jefe de operaciones más uno con todo, y manifest.csv con filas y totales.")
+
+            jobs = _get_export_jobs()
+            clave = ("bundle", periodo, tuple(zip(del_mes['jefe'], del_mes['modificado'], del_mes['filas'])))
+            job = jobs.get(st.session_state.get('bundle_job_id'))
+            if job is not None and job.key == clave and job.state == ERROR:
+                st.error(f"Error al generar el paquete: {job.error}")
+
+            if job is None or job.key != clave or job.state in (ERROR, CANCELLED):
+                if not st.button("📦 Generar paquete", key="btn_bundle_job"):
+                    return
+                job = jobs.submit(run_bundle_job, periodo, key=clave, label=f"Paquete de nóminas {periodo}")
+                st.session_state.bundle_job_id = job.id
+
+            if not job.finished:
+                self._render_job_progress(job.id, "btn_bundle_cancel")
+                return
+
+            resultado = job.result
+            if not resultado or not resultado['zip'].exists():
+                st.warning("⚠️ El paquete ya no está disponible: vuelve a generarlo.")
+                return
+            st.download_button(
+                label="💾 Descargar paquete (ZIP)",
+                data=resultado['zip'].read_bytes(),
+                file_name=f"nominas_{periodo}.zip",
+                mime="application/zip",
+                key="btn_bundle_download",
+            )
+            st.success(f"✅ {len(resultado['manifest'])} libros ({resultado['bytes'] / 1e6:.1f} MB) "
+                       f"generados en {job.seconds:.1f} s")
+            st.dataframe(pd.DataFrame(resultado['manifest']).drop(columns=['sha256']), hide_index=True, use_container_width=True)
+
+    def _render_memory_report(self):
+        """
+        Memoria de los maestros cargados en el proceso (uno por versión en la LRU).
+        
+        Resumen por versión y DataFrame; el detalle por columna, de la versión
+        elegida, permite ver qué crece cuando aumenta la plantilla.
+        """
+        managers = _get_master_lru().managers()
+        if not managers:
+            return
+        st.write("**🧮 Memoria de los maestros**")
+        gestores = {f"{dm.periodo or 'general'} · {dm.file_hash[:8]} ({dm.origen})": dm for dm in reversed(managers)}
+        informes = {version: dm.memory_report() for version, dm in gestores.items()}
+        resumen = pd.concat(
+            [informe.assign(Versión=version) for version, informe in informes.items()], ignore_index=True
+        ).groupby(['Versión', 'Frame'], sort=False).agg(Filas=('Filas', 'first'), Columnas=('Columna', 'size'), Bytes=('Bytes', 'sum'))
+        resumen['Columnas'] -= 1  # el índice no es una columna
+        resumen['MB'] = (resumen.pop('Bytes') / 2**20).round(2)
+        st.dataframe(resumen.reset_index(), hide_index=True, use_container_width=True)
+        if MASTER_SNAPSHOT:
+            publicadas = _get_snapshot_store().versions()
+            st.caption(f"🧊 Instantáneas compartidas en {MASTER_SNAPSHOT_DIR}: {len(publicadas)} versiones, "
+                       f"{sum(v['bytes'] for v in publicadas) / 2**20:.2f} MB (mapeadas por todos los procesos)")
+
+        version = st.selectbox("Detalle por columna", list(informes), key="debug_memoria_version")
+        detalle = informes[version].sort_values('Bytes', ascending=False)
+        st.dataframe(detalle.assign(KB=(detalle.pop('Bytes') / 1024).round(1)), hide_index=True, use_container_width=True)
+
+        dm = gestores[version]
+        st.dataframe(pd.DataFrame([
+            {'Hoja': hoja, 'Libro': Path(fuente.ruta).name, 'Huella': fuente.huella}
+            for hoja, fuente in dm.fuentes.items()
+        ]), hide_index=True, use_container_width=True)
+        if dm.reutilizadas:
+            st.caption(f"♻️ Reutilizado de la versión anterior (sus hojas no cambiaron): {', '.join(dm.reutilizadas)}")
+
+    @st.fragment
+    def _render_debug_panel(self):
+        """
+        Panel oculto de telemetría (activar con ?debug=1 o DEBUG_PANEL=1).
+        
+        Muestra:
+        - Latencia por fase agregada en el proceso (n, p50, p95, p99)
+        - Desglose de la última recarga de esta sesión
+        - Aciertos/fallos de las cachés de hojas, lookups y maestros
+        - Memoria de los maestros cargados (por versión, DataFrame y columna)
+        - Perfilado de la siguiente recarga y descarga del último perfil
+        - Descarga de las métricas en formato Prometheus y JSON
+        """
+        with st.expander("🛠️ Telemetría (depuración)", expanded=False):
+            snapshot = REGISTRY.snapshot()
+            filas = []
+            for nombre in ('rerun_seconds', 'phase_seconds'):
+                for serie in snapshot['histograms'].get(nombre, []):
+                    filas.append({
+                        'Fase': serie['labels'].get('phase', 'recarga completa'),
+                        'N': serie['count'],
+                        'p50 (ms)': round(serie['p50'] * 1000, 1),
+                        'p95 (ms)': round(serie['p95'] * 1000, 1),
+                        'p99 (ms)': round(serie['p99'] * 1000, 1),
+                        'Media (ms)': round(serie['sum'] / serie['count'] * 1000, 1) if serie['count'] else 0.0,
+                    })
+            st.write("**Latencia por fase (todas las sesiones)**")
+            st.dataframe(pd.DataFrame(filas), hide_index=True, use_container_width=True)
+
+            ultima = st.session_state.get('last_rerun_trace')
+            if ultima:
+                st.write(f"**Última recarga de esta sesión:** {ultima['total'] * 1000:.1f} ms")
+                st.dataframe(
+                    pd.DataFrame([{'Fase': f, 'ms': round(t * 1000, 1)} for f, t in ultima['phases']]),
+                    hide_index=True, use_container_width=True
+                )
+
+            if PREWARM:
+                prewarm = _prewarm_process()
+                st.caption(f"🔥 Precalentamiento: {prewarm['status']} en {prewarm.get('seconds', 0):.2f} s "
+                           f"({len(prewarm['masters'])} maestros, desde {prewarm['started_at']})")
+
+            caches = cache_stats()
+            if caches:
+                st.write("**Cachés**")
+                tabla = pd.DataFrame(caches)
+                politica = pd.DataFrame(cache_policy_stats())
+                if not politica.empty:
+                    politica['MB'] = (politica['bytes'] / 1024 ** 2).round(2)
+                    tabla = tabla.merge(politica[['cache', 'versiones', 'entradas', 'MB']], on='cache', how='left')
+                st.dataframe(tabla, hide_index=True, use_container_width=True)
+                st.caption(f"🗂️ Hojas y lookups: se conservan las {CACHE_VERSIONS} versiones del maestro más recientes")
+
+            self._render_memory_report()
+
+            st.write("**🔬 Perfilado**")
+            alloc = st.checkbox("Incluir asignaciones de memoria (tracemalloc)", key="profile_alloc_toggle")
+            if st.button("Perfilar la próxima recarga", key="btn_profile_next"):
+                st.session_state.profile_next_rerun = {'alloc': alloc}
+                rerun_app()
+
+            perfil = st.session_state.get('last_profile')
+            if perfil is not None and perfil.folded_path is not None and perfil.folded_path.exists():
+                st.caption(f"Último perfil: {perfil.folded_path.name} · {perfil.samples} muestras en {perfil.duration * 1000:.0f} ms")
+                st.download_button("⬇️ Flame graph (.folded)", perfil.folded_path.read_bytes(),
+                                   file_name=perfil.folded_path.name, mime="text/plain", key="dl_profile_folded")
+                if perfil.alloc_path is not None and perfil.alloc_path.exists():
+                    st.code(perfil.alloc_path.read_text(encoding="utf-8"), language=None)
+
+            col1, col2 = st.columns(2)
+            with col1:
+                st.download_button("⬇️ metrics.prom", REGISTRY.to_prometheus(), file_name="metrics.prom", mime="text/plain")
+            with col2:
+                st.download_button("⬇️ metrics.json", REGISTRY.to_json(), file_name="metrics.json", mime="application/json")
+            if METRICS_DIR:
+                st.caption(f"📁 Volcado periódico en {METRICS_DIR}")
+
+    @st.fragment
+    @timed("header")
     def _render_header(self, data_manager: OptimizedDataManager):
         """
         Renderiza cabecera con logo y selectores principales.
@@ -1831,6 +4335,9 @@ class OptimizedIncidenciasApp:
         
         Comportamiento:
         - Cambiar mes/jefe resetea las incidencias
+        - Cambiar mes carga el maestro de ese periodo (desde la LRU)
+        - Es un fragmento: tras cambiar mes o jefe fuerza una recarga completa,
+          porque el resto de la página depende de ellos
         """
         col_title, col_logo = st.columns([0.8, 0.2]) 
 
@@ -1841,7 +4348,6 @@ class OptimizedIncidenciasApp:
             st.image("assets/logo.png", width=200)
 
         imputacion_opciones = [""] + ["01-Enero", "02-Febrero", "03-Marzo", "04-Abril", "05-Mayo", "06-Junio", "07-Julio", "08-Agosto", "09-Septiembre", "10-Octubre", "11-Noviembre", "12-Diciembre"]
-        jefes_list = data_manager.get_jefes()
 
         col1, col2 = st.columns(2)
         with col1:
@@ -1852,6 +4358,15 @@ class OptimizedIncidenciasApp:
                 key="imputacion_nomina_main"
             )
 
+        cambio_periodo = new_imputacion != st.session_state.selected_imputacion
+        jefe_anterior = st.session_state.selected_jefe
+
+        # El maestro depende del periodo: resolverlo antes de listar los jefes
+        if cambio_periodo:
+            data_manager = get_data_manager(new_imputacion)
+            st.session_state.data_manager = data_manager
+        jefes_list = data_manager.get_jefes()
+
         with col2:
             new_jefe = st.selectbox(
                 "👤 Seleccionar nombre de supervisor:",
@@ -1859,19 +4374,34 @@ class OptimizedIncidenciasApp:
                 index=jefes_list.index(st.session_state.selected_jefe) + 1 if st.session_state.selected_jefe in jefes_list else 0,
                 key="jefe_main"
             )
+            if data_manager.periodo:
+                st.caption(f"🗂️ Maestro del periodo {data_manager.periodo}")
+            else:
+                st.caption(f"🗂️ Maestro: {Path(data_manager.file_path).name}")
+        periodo = periodo_imputacion(new_imputacion)
+        if periodo and data_manager.periodo != periodo:
+            st.warning(f"⚠️ No hay maestro del periodo {periodo} (falta ejecutar el ETL): se usa el maestro "
+                       f"general {Path(data_manager.file_path).name}. Revisa trabajadores y tarifas antes de exportar.")
 
         if new_imputacion != st.session_state.selected_imputacion:
             st.session_state.selected_imputacion = new_imputacion
             st.session_state.incidencias = []
+            _reiniciar_indices()
             st.session_state.selected_crown_code_origen = ""
             st.session_state.selected_crown_code_destino = ""
 
         if new_jefe != st.session_state.selected_jefe:
             st.session_state.selected_jefe = new_jefe
             st.session_state.incidencias = []
+            _reiniciar_indices()
             st.session_state.selected_crown_code_origen = ""
             st.session_state.selected_crown_code_destino = ""
 
+        if cambio_periodo or new_jefe != jefe_anterior:
+            rerun_app()
+
+    @st.fragment
+    @timed("export_section")
     def _render_export_section(self, data_manager: OptimizedDataManager):
         """
         Renderiza sección de exportación con métricas.
@@ -1915,56 +4445,74 @@ class OptimizedIncidenciasApp:
             st.info("💡 Añade incidencias usando las pestañas 'Por Centro' o 'Por Trabajador'")
             return
         
-        # Filtrar incidencias válidas (con todos los campos obligatorios)
-        incidencias_validas = [inc for inc in todas_incidencias if inc.is_valid()]
+        # Validación columnar: recuentos, filtro de exportación e informe de errores
+        validacion = validate_incidencias(todas_incidencias, data_manager)
+        incidencias_validas = validacion.filtrar(todas_incidencias)
         
         with col2:
             st.metric("✅ Incidencias Válidas", len(incidencias_validas))
         
         with col3:
-            incompletas = len(todas_incidencias) - len(incidencias_validas)
+            incompletas = validacion.n_incompletas
             if incompletas > 0:
                 st.metric("⚠️ Incompletas", incompletas)
         
-        # Si hay incidencias pero ninguna es válida, mostrar diagnóstico
-        if todas_incidencias and not incidencias_validas:
+        if not incidencias_validas:
             st.error("❌ No hay incidencias válidas para exportar")
-            
-            with st.expander("🔍 Ver por qué las incidencias no son válidas", expanded=True):
+        
+        # Diagnóstico completo de todas las incidencias con errores
+        if incompletas > 0:
+            with st.expander("🔍 Ver por qué las incidencias no son válidas", expanded=not incidencias_validas):
                 st.write("**Campos obligatorios para exportar:**")
-                st.write("✅ Trabajador | ✅ Imputación Nómina | ✅ Facturable | ✅ Motivo")
-                st.write("✅ Código Crown Destino | ✅ Fecha ")
+                st.write("✅ Trabajador | ✅ Facturable | ✅ Motivo | ✅ Código Crown Destino | ✅ Fecha")
+                st.write("🌙 Las horas de nocturnidad requieren tarifa para la categoría y convenio del trabajador")
                 st.write("---")
                 
-                # Mostrar las primeras 3 incidencias como ejemplo
-                for i, inc in enumerate(todas_incidencias[:3]):
-                    st.write(f"**Incidencia {i+1}:**")
-                    problemas = []
-                    if not inc.trabajador: problemas.append("❌ Falta Trabajador")
-                    if not inc.imputacion_nomina: problemas.append("❌ Falta Imputación")
-                    if not inc.facturable: problemas.append("❌ Falta Facturable")
-                    if not inc.motivo: problemas.append("❌ Falta Motivo")
-                    if not inc.codigo_crown_destino: problemas.append("❌ Falta Crown Destino")
-                    if not inc.fecha: problemas.append("❌ Falta Fecha")
-                    # if not inc.observaciones: problemas.append("❌ Falta Observaciones")
-                    
-                    if problemas:
-                        for p in problemas:
-                            st.write(f"  {p}")
-                    else:
-                        st.write("  ✅ Todos los campos completos")
+                resumen = validacion.resumen()
+                st.dataframe(
+                    resumen.rename_axis("Error").reset_index(name="Incidencias"),
+                    hide_index=True, use_container_width=True,
+                )
                 
-                if len(todas_incidencias) > 3:
-                    st.write(f"... y {len(todas_incidencias) - 3} incidencias más")
-            
+                informe = validacion.informe(todas_incidencias)
+                informe.insert(1, "Página", (informe["Fila"] - 1) // OptimizedTablaIncidencias.ROWS_PER_PAGE + 1)
+                st.dataframe(informe, hide_index=True, use_container_width=True)
+                st.download_button(
+                    "⬇️ Descargar informe de errores (CSV)",
+                    data=informe.to_csv(index=False, sep=';').encode('utf-8-sig'),
+                    file_name="errores_incidencias.csv",
+                    mime="text/csv",
+                    key="btn_validation_report",
+                )
+        
+        # Duplicados de todo el mes (índice incremental, sin comparar filas entre sí)
+        duplicados = duplicate_report(todas_incidencias, get_duplicate_index())
+        if not duplicados.empty:
+            st.warning(
+                f"🔁 {len(duplicados)} incidencias comparten trabajador, destino, fecha y motivo "
+                f"({duplicados[['Trabajador', 'Destino', 'Fecha', 'Motivo']].drop_duplicates().shape[0]} grupos). "
+                "Revísalas para no pagarlas dos veces."
+            )
+            with st.expander("🔍 Ver incidencias duplicadas", expanded=False):
+                duplicados.insert(1, "Página", (duplicados["Fila"] - 1) // OptimizedTablaIncidencias.ROWS_PER_PAGE + 1)
+                st.dataframe(duplicados, hide_index=True, use_container_width=True)
+                st.download_button(
+                    "⬇️ Descargar duplicados (CSV)",
+                    data=duplicados.to_csv(index=False, sep=';').encode('utf-8-sig'),
+                    file_name="duplicados_incidencias.csv",
+                    mime="text/csv",
+                    key="btn_duplicates_report",
+                )
+
+        if not incidencias_validas:
             st.info("💡 Completa los campos faltantes en la tabla y guarda los cambios para poder exportar")
             return
 
         # Si hay incidencias válidas, mostrar métricas y botón de descarga
         st.success(f"✅ {len(incidencias_validas)} incidencias listas para exportar")
         
-        with st.spinner("Calculando métricas..."):
-            metricas = self._calculate_metrics_optimized(incidencias_validas, data_manager)
+        # Métricas desde el cubo de costes (mantenido en cada alta/baja, no se recalcula)
+        metricas = get_cost_cube(data_manager).totales()
 
         # Mostrar métricas
         col1, col2, col3, col4, col5 = st.columns(5)
@@ -1979,73 +4527,88 @@ class OptimizedIncidenciasApp:
         with col5:
             st.metric("📊 Total coste", f"€{metricas['total_con_ss']:,.2f}")
 
-        # Generar Excel
-        with st.spinner("Generando Excel..."):
-            try:
-                excel_data = OptimizedExportManager.export_to_excel(incidencias_validas, data_manager)
-
-                if excel_data:
-                    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                    filename = f"incidencias_{str(st.session_state.selected_jefe).replace(' ', '_')}_{timestamp}.xlsx"
-
-                    # BOTÓN DE DESCARGA
-                    st.download_button(
-                        label="💾 Descargar Excel de Incidencias",
-                        data=excel_data,
-                        file_name=filename,
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                        help=f"Descarga {len(incidencias_validas)} incidencias válidas en formato Excel (.xlsx)"
-                    )
+        # Fechas: las no reconocidas se exportan igual, sin Fecha inicio/fin
+        anio, mes = periodo_referencia(st.session_state.selected_imputacion, data_manager.periodo)
+        fechas = parse_fechas((inc.fecha for inc in incidencias_validas), anio, mes)
+        if fechas.n_no_reconocidas:
+            st.caption(f"📅 {fechas.n_no_reconocidas} fechas no se han podido interpretar "
+                       "(formatos: 15/07, 01/07-15/07, 1, 3 y 5/07, julio); se exportan sin Fecha inicio/fin.")
+        st.checkbox(
+            "📅 Incluir hoja de reparto diario",
+            key="export_reparto_diario",
+            help="Una fila por incidencia y día, con horas y costes repartidos a partes iguales entre los días",
+        )
 
-                    st.success(f"✅ Archivo listo para descargar: {len(incidencias_validas)} incidencias válidas")
-                else:
-                    st.error("Error al generar el archivo Excel")
-                    
-            except Exception as e:
-                st.error(f"Error durante la exportación: {str(e)}")
-                with st.expander("Ver detalles del error"):
-                    st.exception(e)
+        # Generar Excel en segundo plano: la sesión sigue libre mientras se construye
+        reparto = st.session_state.get("export_reparto_diario", False)
+        clave = export_job_key(todas_incidencias, data_manager, reparto)
+        jobs = _get_export_jobs()
+        job = jobs.get(st.session_state.get('export_job_id'))
+
+        if job is not None and job.key != clave and job.state == DONE:
+            st.caption("✏️ Los datos han cambiado desde el último Excel generado.")
+        if job is not None and job.key == clave and job.state == ERROR:
+            st.error(f"Error durante la exportación: {job.error}")
+        if job is not None and job.key == clave and job.state == CANCELLED:
+            st.info("ℹ️ Exportación cancelada.")
+
+        if job is None or job.key != clave or job.state in (ERROR, CANCELLED):
+            if st.button("⚙️ Generar Excel", key="btn_export_job", type="primary",
+                         help="Se genera en segundo plano: puedes seguir editando y descargarlo cuando esté listo"):
+                job = jobs.submit(
+                    run_export_job, list(todas_incidencias), data_manager, validacion, reparto,
+                    key=clave, label=f"{st.session_state.selected_jefe} · {st.session_state.selected_imputacion}",
+                )
+                st.session_state.export_job_id = job.id
+            else:
+                return
 
+        if not job.finished:
+            self._render_job_progress(job.id, "btn_export_cancel")
+            return
 
-    def _calculate_metrics_optimized(self, incidencias_validas: List[Incidencia], data_manager: OptimizedDataManager) -> Dict[str, float]:
-        """
-        Calcula métricas económicas con caché.
-        
-        Parámetros:
-        - incidencias_validas: Solo incidencias completas
-        - data_manager: Gestor de datos
-        
-        Retorna Dict con:
-        - total_incidencias: Coste de horas
-        - total_nocturnidad: Coste nocturno
-        - total_traslados: Coste traslados
-        - total_simple: Suma sin SS
-        - total_con_ss: Total con Seguridad Social (×1.3195)
-        """
-        precio_cache = {}
-        monto_total_incidencias = 0.0
-        monto_total_nocturnidad = 0.0
-        monto_total_traslados = 0.0
+        resultado = job.result
+        if not resultado:
+            st.error("Error al generar el archivo Excel")
+            return
 
-        for inc in incidencias_validas:
-            monto_total_incidencias += (inc.incidencia_precio or 0.0) * (inc.incidencia_horas or 0.0)
-            key = (inc.categoria, inc.cod_reg_convenio)
-            if key not in precio_cache:
-                precio_cache[key] = data_manager.get_precio_nocturnidad(inc.categoria, inc.cod_reg_convenio)
-            precio_noct = precio_cache[key]
-            monto_total_nocturnidad += precio_noct * (inc.nocturnidad_horas or 0.0)
-            monto_total_traslados += (inc.traslados_total or 0.0) * (inc.coste_hora or 0.0)
+        timestamp = datetime.fromtimestamp(job.finished_at).strftime('%Y%m%d_%H%M%S')
+        filename = f"incidencias_{str(st.session_state.selected_jefe).replace(' ', '_')}_{timestamp}.xlsx"
+
+        # BOTÓN DE DESCARGA (descargar = exportación final: se archiva en el histórico)
+        st.download_button(
+            label="💾 Descargar Excel de Incidencias",
+            data=resultado['excel'],
+            file_name=filename,
+            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            help=f"Descarga {resultado['filas']} incidencias válidas en formato Excel (.xlsx) "
+                 "y las guarda en el histórico (sustituye la exportación anterior del mismo mes y jefe)",
+            on_click=archive_export,
+            args=(resultado['df'], f"{anio}-{mes:02d}", st.session_state.selected_jefe),
+        )
 
-        total_simple = monto_total_incidencias + monto_total_nocturnidad + monto_total_traslados
-        total_con_ss = (monto_total_incidencias + monto_total_nocturnidad) * 1.3195 + monto_total_traslados
+        st.success(f"✅ Archivo listo para descargar: {resultado['filas']} incidencias válidas "
+                   f"(generado en {job.seconds:.1f} s; disponible {EXPORT_JOB_TTL / 60:.0f} min)")
+        archivado = st.session_state.get('ultimo_archivado')
+        if archivado:
+            st.caption(f"🗄️ Archivado en el histórico: {archivado}")
 
-        return {
-            'total_incidencias': monto_total_incidencias,
-            'total_nocturnidad': monto_total_nocturnidad,
-            'total_traslados': monto_total_traslados,
-            'total_simple': total_simple,
-            'total_con_ss': total_con_ss
-        }
+    @st.fragment(run_every=1.0)
+    def _render_job_progress(self, job_id: str, cancel_key: str):
+        """
+        Progreso de un trabajo en segundo plano (se refresca cada segundo).
+        
+        Al terminar el trabajo recarga la página para mostrar la descarga y
+        dejar de refrescar.
+        """
+        jobs = _get_export_jobs()
+        job = jobs.get(job_id)
+        if job is None or job.finished:
+            rerun_app()
+            return
+        st.progress(job.progress, text=f"⏳ {job.message} · {job.seconds:.0f} s")
+        if st.button("✖️ Cancelar", key=cancel_key):
+            jobs.cancel(job_id)
 
 # =============================================================================
 # EJECUCIÓN
@@ -2110,7 +4673,11 @@ if __name__ == "__main__":
 #         └── desc_cuenta
 # '''
     _add_logo_and_css()
-    app = OptimizedIncidenciasApp()
-    app.run()
+    try:
+        app = OptimizedIncidenciasApp()
+        app.run()
+    except SheetSchemaError as e:
+        # El libro cambió de formato: mejor parar con el motivo exacto que trabajar con datos vacíos
+        st.error(f"❌ No se pueden cargar los datos maestros. {e}")
 
     
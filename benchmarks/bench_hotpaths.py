@@ -0,0 +1,381 @@
+"""
+Benchmark de los caminos críticos de la aplicación con datos sintéticos.
+
+Genera maestros.xlsx sintéticos con el esquema real (Trabajadores, Centros,
+tarifas_incidencias, cuenta_motivos) para varios tamaños de plantilla y mide:
+
+- load                : Construcción de OptimizedDataManager (parseo + cachés)
+- lookups             : build_tarifa_lookup + build_empleado_lookup
+- employees_by_centro : get_employees_by_centro sobre 200 centros
+- bulk_add            : "Añadir TODO el Centro" hasta N incidencias
+- page_prepare        : Preparación del DataFrame de una página (50 filas)
+- save                : _process_page_changes de la página 1
+- cost_cube           : Construcción completa del cubo de costes (reconstrucción)
+- metrics             : Edición de una fila en el cubo (baja + alta) y totales
+- export              : OptimizedExportManager.export_to_excel sobre N incidencias
+
+Uso:
+    python benchmarks/bench_hotpaths.py --quick
+    python benchmarks/bench_hotpaths.py --workers 1000,10000 --incidencias 100,1000
+    python benchmarks/bench_hotpaths.py --baseline benchmarks/results/anterior.json
+
+Salida: JSON en benchmarks/results/ y código de salida 1 si algún caso supera
+su umbral absoluto (thresholds.json) o empeora más de --max-regression respecto
+a la línea base.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent))
+
+import streamlit as st  # noqa: E402
+from streamlit import config as st_config, logger as st_logger  # noqa: E402
+
+# Modo "bare": sin ScriptRunContext Streamlit avisa en cada acceso a session_state.
+# La configuración se parsea antes para que no restaure el nivel por defecto.
+st_config.get_option("logger.level")
+st_logger.set_log_level("error")
+
+# "load" mide el parseo: sin instantáneas compartidas (se leerían del disco)
+os.environ.setdefault("MASTER_SNAPSHOT", "0")
+
+import app_optimized as app  # noqa: E402
+from cache_policy import clear_caches  # noqa: E402
+
+DATA_CACHE_DIR = BENCH_DIR / ".data"
+RESULTS_DIR = BENCH_DIR / "results"
+THRESHOLDS_FILE = BENCH_DIR / "thresholds.json"
+
+CONVENIOS = [99100165012016, 99008725011994, 28009435011996]
+CATEGORIAS = ["ASL", "h ASL", "Aux Ad 1", "Camarer@", "Cociner@", "Ayte Cocina", "Gobernant@", "Limpiador"]
+MOTIVOS = [
+    ("Absentismo", "73 - Plus sustitución Total"),
+    ("Refuerzo", "72 - IncentivosTotal"),
+    ("Eventos", "72 - IncentivosTotal"),
+    ("Festivos y Fines de Semana", "70/71 - Festivos Total"),
+    ("Permiso retribuido", "73 - Plus sustitución Total"),
+    ("Puesto pendiente de cubrir", "73 - Plus sustitución Total"),
+    ("Formación", "72 - IncentivosTotal"),
+    ("Otros", "72 - IncentivosTotal"),
+    ("Nocturnidad", "74 - Plus nocturnidad Total"),
+]
+
+
+# =============================================================================
+# DATOS SINTÉTICOS
+# =============================================================================
+
+def generate_master(path: Path, n_workers: int, seed: int = 0) -> Path:
+    """
+    Escribe un maestros.xlsx sintético con el esquema real.
+
+    Parámetros:
+    - path (Path): Ruta de salida
+    - n_workers (int): Filas de la hoja Trabajadores
+    - seed (int): Semilla del generador
+
+    Retorna:
+    - Path: La ruta escrita
+
+    Proporciones: ~1 centro cada 4 trabajadores y ~1 jefe cada 25 centros.
+    """
+    rng = np.random.default_rng(seed)
+    n_centros = max(20, n_workers // 4)
+    n_jefes = max(5, n_centros // 25)
+    jefes = [f"Jefe Sintético {i:03d}" for i in range(n_jefes)]
+
+    cod_centros = np.arange(110000, 110000 + n_centros)
+    baja = rng.random(n_centros) < 0.03
+    centros = pd.DataFrame({
+        "codigo_centro": (cod_centros + 100000).astype(str),
+        "nombre_centro": [f"CENTRO {c}" for c in cod_centros],
+        "cod_jefe": rng.integers(900, 900 + n_jefes, n_centros).astype(str),
+        "nombre_jefe_ope": rng.choice(jefes, n_centros),
+        "fecha_alta_centro": pd.NaT,
+        "fecha_baja_centro": np.where(baja, pd.Timestamp("2024-12-31"), pd.NaT),
+        "cod_centro_preferente": cod_centros.astype(str),
+        "desc_centro_preferente": [f"COLEGIO SINTÉTICO {c}" for c in cod_centros],
+        "almacen_centro": (cod_centros + 300000000).astype(str),
+    })
+
+    centro_pref = rng.choice(cod_centros, n_workers)
+    categorias = rng.choice(CATEGORIAS, n_workers)
+    convenios = rng.choice(CONVENIOS, n_workers)
+    trabajadores = pd.DataFrame({
+        "cod_empresa": rng.choice([19228, 20028, 19241], n_workers),
+        "cod_empleado": np.arange(1, n_workers + 1),
+        "nombre_empleado": [f"APELLIDO{i:06d} SINTÉTICO, NOMBRE" for i in range(n_workers)],
+        "nombre_empresa": "ALGADI SAU - MADRID CENTROS",
+        "cod_contrato": rng.choice([100, 200, 300], n_workers),
+        "tipo_contrato": "INDEFINIDO - TIEMPO PARCIAL - ORDINARIO",
+        "porcen_contrato": rng.choice([40, 50, 75, 100], n_workers),
+        "desc_seccion": [f"{c} SECCION" for c in centro_pref],
+        "cat_empleado": categorias,
+        "cod_seccion": rng.integers(1, 99, n_workers).astype(str),
+        "cod_reg_convenio": convenios.astype(str),
+        "desc_dpto": "Alta automática",
+        "puesto_empleado": categorias,
+        "coste_hora": np.round(rng.uniform(7.5, 16.0, n_workers), 4),
+        "empresa_codigo": rng.integers(1_900_000, 2_000_000, n_workers).astype(str),
+        "cod_crown": centro_pref,
+        "nombre_cod_crown": [f"COLEGIO SINTÉTICO {c}" for c in centro_pref],
+        "nombre_empresa_final": rng.choice(["ALGADI", "SMI", "DISTEGSA"], n_workers),
+        "centro_preferente": centro_pref,
+    })
+
+    tarifas = pd.DataFrame(
+        [(cat.split(" ", 1)[-1] if cat.startswith("h ") else cat, round(float(rng.uniform(1.2, 2.8)), 6), conv)
+         for cat in CATEGORIAS for conv in CONVENIOS],
+        columns=["Descripción", "tarifa_noct", "cod_convenio"],
+    ).drop_duplicates(subset=["Descripción", "cod_convenio"])
+    motivos = pd.DataFrame(MOTIVOS, columns=["Motivo", "desc_cuenta"])
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with pd.ExcelWriter(path, engine="xlsxwriter") as writer:
+        trabajadores.to_excel(writer, sheet_name="Trabajadores", index=False)
+        centros.to_excel(writer, sheet_name="Centros", index=False)
+        motivos.to_excel(writer, sheet_name="cuenta_motivos", index=False)
+        tarifas.to_excel(writer, sheet_name="tarifas_incidencias", index=False)
+    return path
+
+
+def _master_for(n_workers: int, seed: int) -> Path:
+    """Devuelve (generándolo si hace falta) el maestro sintético de un tamaño."""
+    path = DATA_CACHE_DIR / f"maestros_w{n_workers}_s{seed}.xlsx"
+    if not path.exists():
+        generate_master(path, n_workers, seed)
+    return path
+
+
+def _fill_incidencias(incidencias: List[app.Incidencia], seed: int) -> None:
+    """Completa los campos obligatorios para que las incidencias sean exportables."""
+    rng = np.random.default_rng(seed)
+    motivos = [m for m, _ in MOTIVOS]
+    for inc in incidencias:
+        inc.facturable = "Sí"
+        inc.motivo = motivos[int(rng.integers(len(motivos)))]
+        inc.fecha = f"{int(rng.integers(1, 29)):02d}/07"
+        inc.incidencia_horas = float(rng.integers(1, 9))
+        inc.incidencia_precio = 12.5
+        inc.nocturnidad_horas = float(rng.integers(0, 3))
+        inc.traslados_total = float(rng.integers(0, 2))
+
+
+def _bulk_add(tabla: app.OptimizedTablaIncidencias, n_incidencias: int) -> None:
+    """Añade centros completos hasta llegar a n_incidencias (último centro recortado)."""
+    dm = tabla.data_manager
+    st.session_state.incidencias = []
+    for centro in dm.get_centros_crown()[1:]:
+        pendientes = n_incidencias - len(st.session_state.incidencias)
+        if pendientes <= 0:
+            break
+        empleados = dm.get_employees_by_centro(centro)[:pendientes]
+        if empleados:
+            tabla._add_all_employees_from_centro(empleados, "", centro, centro)
+    # Plantillas pequeñas: repetir empleados hasta llegar al volumen pedido
+    while len(st.session_state.incidencias) < n_incidencias:
+        base = st.session_state.incidencias[: n_incidencias - len(st.session_state.incidencias)]
+        st.session_state.incidencias.extend(inc.clone() for inc in base)
+
+
+# =============================================================================
+# MEDICIÓN
+# =============================================================================
+
+def _timeit(fn: Callable[[], object], repeat: int, setup: Optional[Callable[[], None]] = None) -> Dict[str, float]:
+    """
+    Ejecuta fn `repeat` veces y devuelve mínimo, mediana y máximo en segundos.
+
+    Parámetros:
+    - fn (Callable): Operación a medir
+    - repeat (int): Repeticiones
+    - setup (Optional[Callable]): Preparación no medida antes de cada repetición
+    """
+    samples = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return {"min": min(samples), "median": statistics.median(samples), "max": max(samples), "repeat": repeat}
+
+
+def run_suite(workers: List[int], incidencias: List[int], repeat: int, seed: int) -> List[Dict]:
+    """
+    Ejecuta todos los casos para cada combinación de tamaños.
+
+    Retorna:
+    - List[Dict]: Un registro por caso con {case, workers, incidencias, min, median, max, repeat}
+    """
+    results = []
+
+    def record(case: str, n_workers: int, n_inc: Optional[int], timing: Dict[str, float]) -> None:
+        entry = {"case": case, "workers": n_workers, "incidencias": n_inc, **{k: round(v, 6) if isinstance(v, float) else v for k, v in timing.items()}}
+        results.append(entry)
+        scope = f"w={n_workers}" + (f" i={n_inc}" if n_inc is not None else "")
+        print(f"  {case:<20} {scope:<18} median {timing['median'] * 1000:9.1f} ms")
+
+    for n_workers in workers:
+        path = str(_master_for(n_workers, seed))
+        print(f"▶ Plantilla de {n_workers} trabajadores ({path})")
+
+        record("load", n_workers, None, _timeit(lambda: app.OptimizedDataManager(path), repeat, setup=clear_caches))
+        dm = app.OptimizedDataManager(path)
+
+        def _lookups():
+            tarifas = dm.source('tarifas_incidencias')
+            app.build_tarifa_lookup(tarifas.ruta, tarifas.huella)
+            app.build_empleado_lookup(dm.df_trabajadores, dm.version('empleado_lookup'))
+        record("lookups", n_workers, None, _timeit(_lookups, repeat, setup=clear_caches))
+        dm = app.OptimizedDataManager(path)
+
+        centros = dm.get_centros_crown()[1:201]
+        record("employees_by_centro", n_workers, None,
+               _timeit(lambda: [dm.get_employees_by_centro(c) for c in centros], repeat))
+
+        st.session_state.selected_imputacion = "07-Julio"
+        st.session_state.selected_jefe = ""
+        tabla = app.OptimizedTablaIncidencias(dm)
+
+        for n_inc in incidencias:
+            record("bulk_add", n_workers, n_inc, _timeit(lambda: _bulk_add(tabla, n_inc), repeat))
+            _fill_incidencias(st.session_state.incidencias, seed)
+            base = [inc.clone() for inc in st.session_state.incidencias]
+
+            pagina = base[: tabla.ROWS_PER_PAGE]
+            record("page_prepare", n_workers, n_inc, _timeit(lambda: tabla._build_page_dataframe(pagina), repeat))
+
+            edited = tabla._build_page_dataframe(pagina)
+            edited["Observaciones"] = "editado"
+
+            def _reset_state():
+                st.session_state.incidencias = [inc.clone() for inc in base]
+            record("save", n_workers, n_inc,
+                   _timeit(lambda: tabla._process_page_changes(0, edited), repeat, setup=_reset_state))
+
+            record("cost_cube", n_workers, n_inc, _timeit(lambda: app.CostCube(dm, base), repeat))
+            cubo = app.CostCube(dm, base)
+
+            def _edit_and_total():
+                cubo.remove(base[:1], dm)
+                cubo.add(base[:1], dm)
+                return cubo.totales()
+            record("metrics", n_workers, n_inc, _timeit(_edit_and_total, repeat))
+            record("export", n_workers, n_inc,
+                   _timeit(lambda: app.OptimizedExportManager.export_to_excel(base, dm), max(1, repeat // 2)))
+    return results
+
+
+# =============================================================================
+# UMBRALES
+# =============================================================================
+
+def case_key(entry: Dict) -> str:
+    """Clave estable de un caso: '<case>@w<workers>[/i<incidencias>]'."""
+    key = f"{entry['case']}@w{entry['workers']}"
+    if entry.get("incidencias") is not None:
+        key += f"/i{entry['incidencias']}"
+    return key
+
+
+def check_regressions(results: List[Dict], thresholds: Dict[str, float], baseline: Optional[List[Dict]], max_regression: float) -> List[str]:
+    """
+    Compara resultados con umbrales absolutos y con una línea base.
+
+    Parámetros:
+    - results (List[Dict]): Resultados actuales
+    - thresholds (Dict[str, float]): clave de caso → segundos máximos (mediana)
+    - baseline (Optional[List[Dict]]): Resultados de una ejecución anterior
+    - max_regression (float): Empeoramiento relativo tolerado (0.25 = +25%)
+
+    Retorna:
+    - List[str]: Descripción de cada violación (vacía si todo está dentro de umbral)
+    """
+    violations = []
+    base_by_key = {case_key(e): e for e in (baseline or [])}
+    for entry in results:
+        key = case_key(entry)
+        limit = thresholds.get(key)
+        if limit is not None and entry["median"] > limit:
+            violations.append(f"{key}: {entry['median']:.3f}s > umbral {limit:.3f}s")
+        previous = base_by_key.get(key)
+        # Por debajo de 5 ms el ruido domina: no se compara en relativo
+        if previous and previous["median"] > 0.005 and entry["median"] > previous["median"] * (1 + max_regression):
+            violations.append(
+                f"{key}: {entry['median']:.3f}s vs {previous['median']:.3f}s en la línea base "
+                f"(+{(entry['median'] / previous['median'] - 1) * 100:.0f}%)"
+            )
+    return violations
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(v.strip().lower().replace("k", "000")) for v in value.split(",") if v.strip()]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de caminos críticos con maestros sintéticos")
+    parser.add_argument("--workers", default="1k,10k,100k", help="Tamaños de plantilla (ej: 1k,10k,100k)")
+    parser.add_argument("--incidencias", default="100,1k,10k,50k", help="Volúmenes de incidencias")
+    parser.add_argument("--quick", action="store_true", help="Atajo para --workers 1k --incidencias 100,1k")
+    parser.add_argument("--repeat", type=int, default=3, help="Repeticiones por caso (se usa la mediana)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="Fichero JSON de resultados")
+    parser.add_argument("--thresholds", default=str(THRESHOLDS_FILE), help="JSON de umbrales absolutos")
+    parser.add_argument("--baseline", default=None, help="JSON de una ejecución anterior para comparar")
+    parser.add_argument("--max-regression", type=float, default=0.25, help="Empeoramiento relativo tolerado")
+    args = parser.parse_args(argv)
+
+    workers = _int_list("1k" if args.quick else args.workers)
+    incidencias = _int_list("100,1k" if args.quick else args.incidencias)
+
+    started = time.perf_counter()
+    results = run_suite(workers, incidencias, args.repeat, args.seed)
+
+    thresholds = {}
+    if args.thresholds and Path(args.thresholds).exists():
+        thresholds = json.loads(Path(args.thresholds).read_text(encoding="utf-8")).get("max_median_seconds", {})
+    baseline = None
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))["results"]
+    violations = check_regressions(results, thresholds, baseline, args.max_regression)
+
+    report = {
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "cpu_count": os.cpu_count(),
+        "seed": args.seed,
+        "total_seconds": round(time.perf_counter() - started, 3),
+        "results": results,
+        "violations": violations,
+    }
+    output = Path(args.output) if args.output else RESULTS_DIR / f"bench_{datetime.now():%Y%m%d_%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+
+    print(f"\n📄 Resultados: {output}")
+    if violations:
+        print("❌ Regresiones detectadas:")
+        for v in violations:
+            print(f"   - {v}")
+        return 1
+    print("✅ Todos los casos dentro de umbral")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
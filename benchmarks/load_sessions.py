@@ -0,0 +1,563 @@
+"""
+Prueba de carga con N sesiones concurrentes contra un servidor Streamlit real.
+
+Cada sesión es un cliente websocket sin navegador que habla el protocolo de
+Streamlit (BackMsg/ForwardMsg) igual que el frontend: envía el estado de los
+widgets, espera a que termine la recarga y lee los elementos renderizados.
+Así se mide el servidor tal y como corre en el contenedor (un proceso, un
+hilo por sesión, cachés compartidas).
+
+AppTest no sirve para concurrencia: cada ejecución sustituye el Runtime
+global del proceso y las sesiones en paralelo se pisan entre sí.
+
+Flujo simulado por sesión:
+1. Abrir la app
+2. Seleccionar mes de imputación y jefe (reparto round-robin entre jefes)
+3. Seleccionar centro origen/destino y pulsar "Añadir TODO el Centro"
+4. Editar cada página en el data_editor y pulsar "Guardar cambios"
+   (el primer guardado de todas las sesiones es simultáneo, con barrera)
+5. Exportación: pulsar "Generar Excel" (trabajo en segundo plano), recargar
+   el fragmento de progreso cada segundo, como el navegador, hasta que
+   aparece la descarga, y descargar el Excel
+
+Informe: percentiles de latencia por paso (el trabajo de exportación, desde
+el clic hasta la descarga disponible, y la descarga se miden aparte de las
+recargas), CPU del servidor (segundos y % de
+un núcleo) y RSS inicial/pico/final con crecimiento por sesión. CPU y RSS se
+leen de /proc (Linux).
+
+Uso:
+    python benchmarks/load_sessions.py --sessions 40
+    python benchmarks/load_sessions.py --sessions 10 --edits 2 --pages 2 --output /tmp/carga.json
+    python benchmarks/load_sessions.py --sessions 20 --month 08-Agosto --master benchmarks/.data/maestros_w10000_s0.xlsx
+    python benchmarks/load_sessions.py --url http://servidor:8501 --server-pid 1234 --sessions 40
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import websockets
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+BENCH_DIR = Path(__file__).resolve().parent
+REPO_DIR = BENCH_DIR.parent
+APP_FILE = REPO_DIR / "app_optimized.py"
+
+MOTIVOS = ["Absentismo", "Refuerzo", "Eventos", "Festivos y Fines de Semana", "Nocturnidad"]
+_MOSTRANDO_RE = re.compile(r"Mostrando (\d+) de (\d+) incidencias \(página (\d+) de (\d+)\)")
+
+
+# =============================================================================
+# SERVIDOR Y RECURSOS
+# =============================================================================
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(port: int, master: Optional[str]) -> subprocess.Popen:
+    """
+    Arranca `streamlit run app_optimized.py` y espera a /_stcore/health.
+
+    Parámetros:
+    - port (int): Puerto local
+    - master (Optional[str]): Ruta para MAESTROS_FILE_PATH
+
+    Retorna:
+    - subprocess.Popen: Proceso del servidor
+    """
+    env = dict(os.environ)
+    if master:
+        env["MAESTROS_FILE_PATH"] = str(Path(master).resolve())
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", str(APP_FILE),
+         "--server.port", str(port), "--server.address", "127.0.0.1",
+         "--server.headless", "true", "--server.enableXsrfProtection", "false",
+         "--browser.gatherUsageStats", "false", "--logger.level", "error"],
+        cwd=REPO_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"El servidor terminó al arrancar: {proc.stderr.read().decode(errors='replace')}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1) as resp:
+                if resp.status == 200:
+                    return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError("El servidor no respondió a /_stcore/health en 60 s")
+
+
+def _proc_sample(pid: int) -> Tuple[float, int]:
+    """(segundos de CPU usuario+sistema, RSS en bytes) de un proceso vía /proc."""
+    with open(f"/proc/{pid}/stat") as fh:
+        fields = fh.read().rsplit(")", 1)[1].split()
+    ticks = os.sysconf("SC_CLK_TCK")
+    cpu = (int(fields[11]) + int(fields[12])) / ticks
+    with open(f"/proc/{pid}/status") as fh:
+        rss_kb = next(int(line.split()[1]) for line in fh if line.startswith("VmRSS:"))
+    return cpu, rss_kb * 1024
+
+
+class ProcessMonitor:
+    """
+    Muestrea CPU y RSS del servidor mientras dura la prueba.
+
+    Atributos tras stop():
+    - cpu_seconds (float): CPU consumida por el servidor
+    - wall_seconds (float): Tiempo real transcurrido
+    - rss_start, rss_peak, rss_end (int): Bytes
+    """
+
+    def __init__(self, pid: int, interval: float = 0.2):
+        self.pid = pid
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        self._cpu_start, self.rss_start = _proc_sample(self.pid)
+        self.rss_peak = self.rss_start
+        self._wall_start = time.perf_counter()
+        self._task = asyncio.create_task(self._loop())
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            self.rss_peak = max(self.rss_peak, _proc_sample(self.pid)[1])
+
+    async def stop(self) -> None:
+        self._task.cancel()
+        cpu_end, self.rss_end = _proc_sample(self.pid)
+        self.rss_peak = max(self.rss_peak, self.rss_end)
+        self.cpu_seconds = cpu_end - self._cpu_start
+        self.wall_seconds = time.perf_counter() - self._wall_start
+
+
+# =============================================================================
+# CLIENTE DEL PROTOCOLO
+# =============================================================================
+
+class StreamlitClient:
+    """
+    Cliente websocket mínimo: mantiene el estado de widgets como el navegador.
+
+    Uso:
+        async with StreamlitClient(url) as client:
+            await client.rerun()
+            client.set_string(client.find("selectbox", key="jefe_main").id, "Jefe")
+            await client.rerun()
+    """
+
+    def __init__(self, base_url: str, timeout: float):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.widgets: Dict[str, WidgetState] = {}
+        self.elements: List[Tuple[str, object]] = []
+        self._element_fragments: List[str] = []    # fragmento de cada elemento ("" = ninguno)
+        self.page_script_hash = ""
+        self._ws = None
+
+    async def __aenter__(self) -> "StreamlitClient":
+        ws_url = self.base_url.replace("http", "ws", 1) + "/_stcore/stream"
+        self._ws = await websockets.connect(ws_url, subprotocols=["streamlit"], max_size=None, open_timeout=self.timeout)
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self._ws.close()
+
+    # --- estado de widgets ---------------------------------------------------
+
+    def _state(self, widget_id: str) -> WidgetState:
+        state = WidgetState(id=widget_id)
+        self.widgets[widget_id] = state
+        return state
+
+    def set_string(self, widget_id: str, value: str) -> None:
+        self._state(widget_id).string_value = value
+
+    def set_double(self, widget_id: str, value: float) -> None:
+        self._state(widget_id).double_value = value
+
+    def click(self, widget_id: str) -> None:
+        self._state(widget_id).trigger_value = True
+
+    def forget(self, widget_id: str) -> None:
+        self.widgets.pop(widget_id, None)
+
+    # --- recarga -------------------------------------------------------------
+
+    async def rerun(self, fragment_id: str = "") -> None:
+        """
+        Envía rerun_script y espera el final de la recarga (incluye st.rerun encadenados).
+
+        Con fragment_id solo se ejecuta ese fragmento (como los run_every del
+        navegador) y solo se sustituyen sus elementos.
+        """
+        msg = BackMsg()
+        msg.rerun_script.query_string = ""
+        msg.rerun_script.page_script_hash = self.page_script_hash
+        if fragment_id:
+            msg.rerun_script.fragment_id = fragment_id
+            msg.rerun_script.is_auto_rerun = True
+        msg.rerun_script.widget_states.widgets.extend(self.widgets.values())
+        await self._ws.send(msg.SerializeToString())
+        # Los botones son disparadores de un solo uso, como en el frontend
+        for widget_id in [w for w, s in self.widgets.items() if s.WhichOneof("value") == "trigger_value"]:
+            del self.widgets[widget_id]
+
+        async def _wait() -> None:
+            while True:
+                fm = ForwardMsg.FromString(await self._ws.recv())
+                kind = fm.WhichOneof("type")
+                if kind == "new_session":
+                    fragmentos = set(fm.new_session.fragment_ids_this_run)
+                    conservar = [i for i, f in enumerate(self._element_fragments) if fragmentos and f not in fragmentos]
+                    self.elements = [self.elements[i] for i in conservar]
+                    self._element_fragments = [self._element_fragments[i] for i in conservar]
+                    self.page_script_hash = fm.new_session.page_script_hash
+                elif kind == "delta" and fm.delta.WhichOneof("type") == "new_element":
+                    element = fm.delta.new_element
+                    etype = element.WhichOneof("type")
+                    self.elements.append((etype, getattr(element, etype)))
+                    self._element_fragments.append(fm.delta.fragment_id)
+                elif kind == "script_finished":
+                    if fm.script_finished == ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                        continue
+                    if fm.script_finished == ForwardMsg.FINISHED_WITH_COMPILE_ERROR:
+                        raise RuntimeError("Error de compilación del script")
+                    return
+
+        await asyncio.wait_for(_wait(), self.timeout)
+        errores = [p.message for t, p in self.elements if t == "exception"]
+        if errores:
+            raise RuntimeError(f"Excepción en la app: {errores[0]}")
+
+    # --- consulta de elementos ------------------------------------------------
+
+    def find(self, etype: str, key: Optional[str] = None, label: Optional[str] = None, id_contains: Optional[str] = None):
+        """Primer elemento del tipo dado que cumple key/label/id; KeyError si no existe."""
+        for t, proto in self.elements:
+            if t != etype:
+                continue
+            if key is not None and not proto.id.endswith(f"-{key}"):
+                continue
+            if label is not None and label not in proto.label:
+                continue
+            if id_contains is not None and id_contains not in proto.id:
+                continue
+            return proto
+        raise KeyError(f"{etype} key={key} label={label} id~={id_contains}")
+
+    def fragment_of(self, etype: str) -> str:
+        """Fragmento del primer elemento del tipo dado; KeyError si no hay ninguno en un fragmento."""
+        for (t, _), fragment_id in zip(self.elements, self._element_fragments):
+            if t == etype and fragment_id:
+                return fragment_id
+        raise KeyError(f"{etype} en un fragmento")
+
+    def texts(self, etype: str = "alert") -> List[str]:
+        return [proto.body for t, proto in self.elements if t == etype]
+
+    def download(self, url: str) -> int:
+        with urllib.request.urlopen(f"{self.base_url}{url}", timeout=self.timeout) as resp:
+            return len(resp.read())
+
+
+# =============================================================================
+# SESIÓN SIMULADA
+# =============================================================================
+
+class SimulatedSession:
+    """
+    Una sesión de supervisor.
+
+    Parámetros:
+    - index (int): Número de sesión (elige jefe y centro de forma determinista)
+    - base_url (str): URL del servidor
+    - args (argparse.Namespace): month, edits, pages, timeout
+    - save_barrier (asyncio.Barrier): Sincroniza el primer guardado de todas las sesiones
+    """
+
+    def __init__(self, index: int, base_url: str, args: argparse.Namespace, save_barrier: asyncio.Barrier):
+        self.index = index
+        self.base_url = base_url
+        self.args = args
+        self.save_barrier = save_barrier
+        self.timings: List[Dict] = []
+        self.error: Optional[str] = None
+        self.incidencias = 0
+        self.excel_bytes = 0
+
+    async def _step(self, client: StreamlitClient, name: str) -> None:
+        start = time.perf_counter()
+        await client.rerun()
+        self.timings.append({"step": name, "seconds": time.perf_counter() - start})
+
+    def _paginacion(self, client: StreamlitClient) -> Tuple[int, int]:
+        """(filas en la página, total de páginas) según el aviso 'Mostrando N de M...'."""
+        for texto in client.texts():
+            m = _MOSTRANDO_RE.search(texto)
+            if m:
+                return int(m.group(1)), int(m.group(4))
+        raise KeyError("No se encontró el aviso de paginación")
+
+    def _edicion(self, filas: int, ronda: int) -> str:
+        edited_rows = {
+            str(i): {
+                "Facturable": "Sí",
+                "Motivo": MOTIVOS[(i + ronda) % len(MOTIVOS)],
+                "Fecha": f"{(i % 28) + 1:02d}/{self.args.month[:2]}",
+                "Incidencia_horas": float((i + ronda) % 8 + 1),
+                "Incidencia_precio": 12.5,
+                "Observaciones": f"carga {self.index}/{ronda}",
+            }
+            for i in range(filas)
+        }
+        return json.dumps({"edited_rows": edited_rows, "added_rows": [], "deleted_rows": []})
+
+    async def _wait_download(self, client: StreamlitClient):
+        """
+        Recarga el fragmento de progreso cada segundo (run_every del navegador)
+        hasta que el trabajo termina y la recarga completa muestra la descarga.
+        """
+        limite = time.perf_counter() + self.args.timeout
+        while True:
+            try:
+                return client.find("download_button", label="Descargar Excel")
+            except KeyError:
+                pass
+            if time.perf_counter() > limite:
+                raise TimeoutError("La exportación no terminó a tiempo")
+            errores = [t for t in client.texts() if "Error durante la exportación" in t]
+            if errores:
+                raise RuntimeError(errores[0])
+            await asyncio.sleep(1.0)
+            start = time.perf_counter()
+            await client.rerun(fragment_id=client.fragment_of("progress"))
+            self.timings.append({"step": "progreso", "seconds": time.perf_counter() - start})
+
+    async def run(self) -> None:
+        primer_guardado = True
+        try:
+            async with StreamlitClient(self.base_url, self.args.timeout) as client:
+                await self._step(client, "abrir")
+
+                client.set_string(client.find("selectbox", key="imputacion_nomina_main").id, self.args.month)
+                await self._step(client, "mes")
+
+                jefe_box = client.find("selectbox", key="jefe_main")
+                jefes = [j for j in jefe_box.options if j]
+                if not jefes:
+                    raise RuntimeError("El maestro no tiene jefes")
+                client.set_string(jefe_box.id, jefes[self.index % len(jefes)])
+                await self._step(client, "jefe")
+
+                # Los centros sin trabajadores no muestran el destino: probar el siguiente
+                origen = client.find("selectbox", key="method1_centro_origen")
+                centros = [c for c in origen.options if c]
+                for intento in range(len(centros)):
+                    centro = centros[(self.index + intento) % len(centros)]
+                    client.set_string(origen.id, centro)
+                    await self._step(client, "centro_origen")
+                    if any("trabajadores encontrados" in t for t in client.texts()):
+                        break
+                else:
+                    raise RuntimeError("Ningún centro del maestro tiene trabajadores")
+                client.set_string(client.find("selectbox", key="method1_centro_destino").id, centro)
+                await self._step(client, "centro_destino")
+
+                client.click(client.find("button", label="TODO el Centro").id)
+                await self._step(client, "añadir_centro")
+
+                _, total_paginas = self._paginacion(client)
+                for pagina in range(1, min(self.args.pages, total_paginas) + 1):
+                    if pagina > 1:
+                        client.set_double(client.find("number_input", key="current_page").id, float(pagina))
+                        await self._step(client, "cambiar_pagina")
+                    for ronda in range(self.args.edits):
+                        filas, _ = self._paginacion(client)
+                        editor = client.find("dataframe", id_contains="unificado_editor_page")
+                        client.set_string(editor.id, self._edicion(filas, ronda))
+                        await self._step(client, "editar")
+                        if primer_guardado:
+                            primer_guardado = False
+                            await self.save_barrier.wait()
+                        client.click(client.find("button", key="btn_save_changes").id)
+                        await self._step(client, "guardar")
+                        client.forget(editor.id)
+
+                await self._step(client, "exportar")
+                client.click(client.find("button", key="btn_export_job").id)
+                start = time.perf_counter()
+                await self._step(client, "generar")
+                boton = await self._wait_download(client)
+                self.timings.append({"step": "trabajo_export", "seconds": time.perf_counter() - start})
+                start = time.perf_counter()
+                self.excel_bytes = client.download(boton.url)
+                self.timings.append({"step": "descarga", "seconds": time.perf_counter() - start})
+                total = client.find("metric", label="Total Incidencias")
+                self.incidencias = int(total.body)
+        except Exception as e:  # noqa: BLE001 - se informa por sesión
+            self.error = f"{type(e).__name__}: {e}"
+        finally:
+            # Una sesión caída no debe bloquear al resto en la barrera
+            if primer_guardado:
+                await self.save_barrier.wait()
+
+
+# =============================================================================
+# INFORME
+# =============================================================================
+
+def _percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def pct(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, round(q * (len(ordered) - 1)))], 4)
+
+    return {
+        "n": len(ordered),
+        "p50": pct(0.50),
+        "p90": pct(0.90),
+        "p95": pct(0.95),
+        "p99": pct(0.99),
+        "max": round(ordered[-1], 4),
+        "mean": round(statistics.fmean(ordered), 4),
+    }
+
+
+async def run_load(base_url: str, pid: Optional[int], args: argparse.Namespace) -> Dict:
+    """
+    Lanza las sesiones concurrentes y agrega resultados.
+
+    Parámetros:
+    - base_url (str): URL del servidor
+    - pid (Optional[int]): PID del servidor para CPU/RSS (None = sin medir recursos)
+    - args (argparse.Namespace): Opciones de la línea de comandos
+
+    Retorna:
+    - Dict: Informe con latencias por paso, recursos y errores
+    """
+    barrier = asyncio.Barrier(args.sessions)
+    sessions = [SimulatedSession(i, base_url, args, barrier) for i in range(args.sessions)]
+
+    monitor = ProcessMonitor(pid) if pid else None
+    if monitor:
+        await monitor.start()
+    wall_start = time.perf_counter()
+    tasks = []
+    for s in sessions:
+        tasks.append(asyncio.create_task(s.run()))
+        if args.ramp_up:
+            await asyncio.sleep(args.ramp_up / args.sessions)
+    await asyncio.gather(*tasks)
+    wall = time.perf_counter() - wall_start
+    if monitor:
+        await monitor.stop()
+
+    by_step: Dict[str, List[float]] = {}
+    for s in sessions:
+        for entry in s.timings:
+            by_step.setdefault(entry["step"], []).append(entry["seconds"])
+    reruns = [v for step, values in by_step.items() if step not in ("descarga", "trabajo_export") for v in values]
+
+    report = {
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "url": base_url,
+        "sessions": args.sessions,
+        "month": args.month,
+        "edits": args.edits,
+        "pages": args.pages,
+        "ok_sessions": sum(1 for s in sessions if s.error is None),
+        "errors": {f"sesion-{s.index}": s.error for s in sessions if s.error},
+        "incidencias_total": sum(s.incidencias for s in sessions),
+        "wall_seconds": round(wall, 3),
+        "latency_seconds": {"all_reruns": _percentiles(reruns), **{k: _percentiles(v) for k, v in by_step.items()}},
+    }
+    if monitor:
+        mib = 1024 * 1024
+        report["server"] = {
+            "pid": pid,
+            "cpu_seconds": round(monitor.cpu_seconds, 3),
+            "cpu_percent_of_one_core": round(100 * monitor.cpu_seconds / monitor.wall_seconds, 1),
+            "rss_start_mib": round(monitor.rss_start / mib, 1),
+            "rss_peak_mib": round(monitor.rss_peak / mib, 1),
+            "rss_end_mib": round(monitor.rss_end / mib, 1),
+            "rss_growth_per_session_mib": round((monitor.rss_end - monitor.rss_start) / mib / args.sessions, 2),
+        }
+    return report
+
+
+def _print_report(report: Dict) -> None:
+    print(f"\n▶ {report['sessions']} sesiones · {report['ok_sessions']} completadas · "
+          f"{report['incidencias_total']} incidencias · {report['wall_seconds']} s")
+    print(f"  {'paso':<16}{'n':>5}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}   (segundos)")
+    for step, p in report["latency_seconds"].items():
+        if p:
+            print(f"  {step:<16}{p['n']:>5}{p['p50']:>9.3f}{p['p95']:>9.3f}{p['p99']:>9.3f}{p['max']:>9.3f}")
+    server = report.get("server")
+    if server:
+        print(f"\n  CPU servidor: {server['cpu_seconds']} s ({server['cpu_percent_of_one_core']}% de un núcleo)")
+        print(f"  RSS servidor: {server['rss_start_mib']} → pico {server['rss_peak_mib']} → final "
+              f"{server['rss_end_mib']} MiB ({server['rss_growth_per_session_mib']} MiB/sesión)")
+    for sesion, error in report["errors"].items():
+        print(f"  ❌ {sesion}: {error}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Prueba de carga con sesiones concurrentes (websocket)")
+    parser.add_argument("--sessions", type=int, default=10, help="Sesiones simultáneas")
+    parser.add_argument("--month", default="07-Julio", help="Opción del selector de imputación")
+    parser.add_argument("--edits", type=int, default=1, help="Rondas de edición + guardado por página")
+    parser.add_argument("--pages", type=int, default=1, help="Páginas de la tabla a editar")
+    parser.add_argument("--ramp-up", type=float, default=0.0, help="Segundos para escalonar el arranque")
+    parser.add_argument("--timeout", type=float, default=300.0, help="Timeout por recarga (s)")
+    parser.add_argument("--master", default=None, help="MAESTROS_FILE_PATH del servidor lanzado (meses sin maestro de periodo)")
+    parser.add_argument("--url", default=None, help="Servidor ya arrancado (si no, se lanza uno local)")
+    parser.add_argument("--server-pid", type=int, default=None, help="PID del servidor indicado en --url, para medir CPU/RSS")
+    parser.add_argument("--output", default=None, help="Fichero JSON del informe")
+    args = parser.parse_args(argv)
+
+    server = None
+    if args.url:
+        base_url, pid = args.url, args.server_pid
+    else:
+        port = _free_port()
+        server = start_server(port, args.master)
+        base_url, pid = f"http://127.0.0.1:{port}", server.pid
+    try:
+        report = asyncio.run(run_load(base_url, pid, args))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+
+    _print_report(report)
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"\n📄 Informe: {args.output}")
+    return 0 if report["ok_sessions"] == report["sessions"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,148 @@
+"""
+Paquete de nóminas: un Excel por jefe de operaciones más uno conjunto, en un ZIP.
+
+Cada libro se escribe en un proceso aparte (ProcessPoolExecutor, arranque
+"spawn": no se hereda el estado del servidor Streamlit) y queda en un fichero
+temporal; el proceso principal lo añade al ZIP en cuanto termina y lo borra.
+En memoria solo hay, como mucho, un libro por proceso trabajador.
+
+El ZIP incluye manifest.csv y manifest.json con filas, totales y sha256 de
+cada fichero para que nóminas pueda cuadrar el paquete.
+
+Este módulo no importa la aplicación: los procesos hijos solo cargan pandas y
+openpyxl.
+
+Uso:
+    from bundle import build_bundle
+
+    manifest = build_bundle(df_mes, "paquete_2025-07.zip", columna_jefe="Jefe de Operaciones")
+"""
+
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import re
+import tempfile
+import unicodedata
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import pandas as pd
+
+# Columnas sumadas en el manifiesto (las que existan en el DataFrame)
+TOTALES_MANIFIESTO = {
+    "Cuantía": "horas",
+    "Cuantía nocturnidad": "horas_nocturnidad",
+    "74_plus_nocturnidad": "nocturnidad",
+    "Horas traslado": "traslados",
+    "Coste_total": "coste_total",
+}
+FICHERO_CONJUNTO = "00_todos_los_jefes.xlsx"
+
+# =============================================================================
+# LIBROS (se ejecuta en los procesos hijos)
+# =============================================================================
+
+def _slug(nombre: str) -> str:
+    """Nombre de fichero seguro: sin tildes, solo letras, dígitos y guiones bajos."""
+    texto = unicodedata.normalize("NFKD", str(nombre)).encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"[^A-Za-z0-9]+", "_", texto).strip("_") or "sin_jefe"
+
+
+def write_workbook(df: pd.DataFrame, path: str, jefe: str) -> Dict:
+    """
+    Escribe un libro y devuelve su entrada del manifiesto.
+
+    Parámetros:
+    - df (pd.DataFrame): Filas del libro
+    - path (str): Fichero de destino
+    - jefe (str): Jefe de operaciones ("" en el libro conjunto)
+
+    Retorna:
+    - Dict: archivo, jefe, filas, bytes, sha256 y los TOTALES_MANIFIESTO
+    """
+    df.to_excel(path, index=False, engine="openpyxl")
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for bloque in iter(lambda: f.read(1 << 20), b""):
+            sha.update(bloque)
+    entrada = {"archivo": os.path.basename(path), "jefe": jefe, "filas": len(df),
+               "bytes": os.path.getsize(path), "sha256": sha.hexdigest()}
+    for columna, clave in TOTALES_MANIFIESTO.items():
+        if columna in df.columns:
+            entrada[clave] = round(float(pd.to_numeric(df[columna], errors="coerce").fillna(0.0).sum()), 2)
+    return entrada
+
+# =============================================================================
+# PAQUETE (proceso principal)
+# =============================================================================
+
+def build_bundle(df: pd.DataFrame, zip_path: str, columna_jefe: str = "Jefe de Operaciones",
+                 max_workers: Optional[int] = None,
+                 progreso: Optional[Callable[[float, str], None]] = None) -> List[Dict]:
+    """
+    Genera el ZIP con un libro por jefe, el conjunto y el manifiesto.
+
+    Parámetros:
+    - df (pd.DataFrame): Incidencias del mes (columnas del Excel de exportación)
+    - zip_path (str): Fichero ZIP de destino
+    - columna_jefe (str): Columna por la que se parte
+    - max_workers (Optional[int]): Procesos (por defecto, núcleos disponibles)
+    - progreso (Optional[Callable[[float, str], None]]): Recibe (fracción, mensaje)
+      al terminar cada libro; si lanza una excepción, se cancelan los pendientes
+      y se borra el ZIP a medias
+
+    Retorna:
+    - List[Dict]: Manifiesto (una entrada por libro, el conjunto primero)
+    """
+    jefes = df[columna_jefe].fillna("").astype(str).str.strip() if columna_jefe in df.columns else pd.Series("", index=df.index)
+    grupos = [(jefe, parte) for jefe, parte in df.groupby(jefes, sort=True)]
+    trabajos = [(FICHERO_CONJUNTO, "", df)] + [
+        (f"{_slug(jefe)}.xlsx", jefe, parte.reset_index(drop=True)) for jefe, parte in grupos
+    ]
+    # Dos jefes con el mismo slug no pueden pisarse dentro del ZIP
+    vistos: Dict[str, int] = {}
+    for i, (nombre, jefe, parte) in enumerate(trabajos):
+        vistos[nombre] = vistos.get(nombre, 0) + 1
+        if vistos[nombre] > 1:
+            trabajos[i] = (f"{nombre[:-5]}_{vistos[nombre]}.xlsx", jefe, parte)
+
+    workers = max(1, min(max_workers or os.cpu_count() or 1, len(trabajos)))
+    manifest: List[Dict] = []
+    with tempfile.TemporaryDirectory(prefix="bundle_") as tmp, \
+            ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        pendientes = {
+            pool.submit(write_workbook, parte, os.path.join(tmp, nombre), jefe): nombre
+            for nombre, jefe, parte in trabajos
+        }
+        try:
+            with zipfile.ZipFile(zip_path, "w") as zf:
+                while pendientes:
+                    hechos, _ = wait(pendientes, return_when=FIRST_COMPLETED)
+                    for futuro in hechos:
+                        nombre = pendientes.pop(futuro)
+                        entrada = futuro.result()
+                        ruta = os.path.join(tmp, nombre)
+                        # xlsx ya va comprimido: se guarda tal cual
+                        zf.write(ruta, nombre, compress_type=zipfile.ZIP_STORED)
+                        os.unlink(ruta)
+                        manifest.append(entrada)
+                        if progreso is not None:
+                            progreso(len(manifest) / len(trabajos), f"{len(manifest)}/{len(trabajos)} libros ({nombre})")
+
+                manifest.sort(key=lambda e: (e["archivo"] != FICHERO_CONJUNTO, e["archivo"]))
+                zf.writestr("manifest.json", json.dumps(manifest, ensure_ascii=False, indent=2),
+                            compress_type=zipfile.ZIP_DEFLATED)
+                csv = io.StringIO()
+                pd.DataFrame(manifest).to_csv(csv, index=False, sep=";")
+                zf.writestr("manifest.csv", csv.getvalue().encode("utf-8-sig"), compress_type=zipfile.ZIP_DEFLATED)
+        except BaseException:
+            for futuro in pendientes:
+                futuro.cancel()
+            Path(zip_path).unlink(missing_ok=True)
+            raise
+    return manifest
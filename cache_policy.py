@@ -0,0 +1,201 @@
+"""
+Cachés acotadas por versión del maestro para las hojas y los lookups.
+
+st.cache_data guarda una entrada por combinación de argumentos y no olvida
+nada: cada maestro nuevo (hash distinto) añade otra copia de cada hoja que
+vive hasta reiniciar el contenedor. Aquí cada caché agrupa sus entradas por
+versión (el argumento file_hash) y solo conserva las `max_versions` versiones
+usadas más recientemente (por defecto, la actual y la anterior); al entrar
+una nueva se desaloja entera la más antigua. Con group_by, las versiones se
+cuentan por grupo: la caché de hojas guarda la actual y la anterior de cada
+hoja, que cambian por separado (cada una tiene su huella).
+
+Las cachés viven en este módulo importado, así que sobreviven a las recargas
+del script principal y son comunes a todas las sesiones del proceso. Los
+valores se devuelven tal cual (sin copiar, a diferencia de st.cache_data):
+quien los recibe no debe modificarlos.
+
+Los argumentos con guion bajo inicial no forman parte de la clave (como en
+st.cache_data). Peticiones, fallos y desalojos se anotan en telemetry.
+
+Uso:
+    from cache_policy import versioned_cache, cache_policy_stats, clear_caches
+
+    @versioned_cache("sheet", max_versions=2, group_by=("sheet_name",))
+    def cargar_hoja(file_path, sheet_name, file_hash): ...
+
+    cache_policy_stats()   # [{cache, grupos, versiones, entradas, bytes, aciertos, fallos, hit_ratio, desalojos}]
+    clear_caches()
+"""
+
+import functools
+import inspect
+import pickle
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Tuple
+
+import pandas as pd
+
+from telemetry import count_cache_eviction, count_cache_miss, count_cache_request
+
+# =============================================================================
+# CACHÉ
+# =============================================================================
+
+def _approx_bytes(valor: Any) -> int:
+    """Tamaño aproximado de un valor cacheado (DataFrames: memoria real; resto: pickle)."""
+    if isinstance(valor, pd.DataFrame):
+        return int(valor.memory_usage(index=True, deep=True).sum())
+    try:
+        return len(pickle.dumps(valor, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return 0
+
+
+class VersionedCache:
+    """
+    Entradas de una función cacheada agrupadas por versión del maestro.
+
+    Parámetros:
+    - name (str): Nombre de la caché (label cache="..." en las métricas)
+    - max_versions (int): Versiones que se conservan por grupo (mínimo 1)
+    """
+
+    def __init__(self, name: str, max_versions: int = 2):
+        self.name = name
+        self.max_versions = max(1, max_versions)
+        # grupo → versión → clave → (valor, bytes); las versiones en orden de
+        # uso (la última, la más reciente)
+        self._grupos: Dict[Hashable, "OrderedDict[str, Dict[Hashable, Tuple[Any, int]]]"] = {}
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.desalojos = 0
+
+    def get_or_compute(self, version: str, clave: Hashable, calcular: Callable[[], Any],
+                       grupo: Hashable = ()) -> Any:
+        """
+        Valor cacheado de (grupo, version, clave); en un fallo ejecuta calcular().
+
+        El cálculo se hace fuera del candado: una hoja lenta no bloquea las
+        consultas de otras. Si dos sesiones fallan a la vez, gana la última.
+        """
+        count_cache_request(self.name)
+        with self._lock:
+            versiones = self._grupos.get(grupo)
+            entradas = versiones.get(version) if versiones is not None else None
+            if entradas is not None and clave in entradas:
+                versiones.move_to_end(version)
+                self.aciertos += 1
+                return entradas[clave][0]
+            self.fallos += 1
+        count_cache_miss(self.name)
+
+        valor = calcular()
+        tamano = _approx_bytes(valor)
+        with self._lock:
+            versiones = self._grupos.setdefault(grupo, OrderedDict())
+            versiones.setdefault(version, {})[clave] = (valor, tamano)
+            versiones.move_to_end(version)
+            while len(versiones) > self.max_versions:
+                _, viejas = versiones.popitem(last=False)
+                self.desalojos += len(viejas)
+                count_cache_eviction(self.name, len(viejas))
+        return valor
+
+    def clear(self) -> None:
+        with self._lock:
+            self._grupos.clear()
+
+    def stats(self) -> Dict:
+        """cache, grupos, versiones, entradas, bytes, aciertos, fallos, hit_ratio, desalojos."""
+        with self._lock:
+            peticiones = self.aciertos + self.fallos
+            versiones = [e for v in self._grupos.values() for e in v.values()]
+            return {
+                "cache": self.name,
+                "grupos": len(self._grupos),
+                "versiones": len(versiones),
+                "entradas": sum(len(e) for e in versiones),
+                "bytes": sum(t for e in versiones for _, t in e.values()),
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "hit_ratio": round(self.aciertos / peticiones, 4) if peticiones else 0.0,
+                "desalojos": self.desalojos,
+            }
+
+# =============================================================================
+# REGISTRO Y DECORADOR
+# =============================================================================
+
+_CACHES: Dict[str, VersionedCache] = {}
+_CACHES_LOCK = threading.Lock()
+
+
+def get_cache(name: str, max_versions: int = 2) -> VersionedCache:
+    """Caché registrada con ese nombre (se crea la primera vez)."""
+    with _CACHES_LOCK:
+        if name not in _CACHES:
+            _CACHES[name] = VersionedCache(name, max_versions)
+        return _CACHES[name]
+
+
+def _hashable(valor: Any) -> Hashable:
+    if isinstance(valor, dict):
+        return tuple(sorted((k, _hashable(v)) for k, v in valor.items()))
+    if isinstance(valor, (list, tuple)):
+        return tuple(_hashable(v) for v in valor)
+    return valor
+
+
+def versioned_cache(name: str, max_versions: int = 2, version_arg: str = "file_hash",
+                    group_by: Tuple[str, ...] = ()) -> Callable:
+    """
+    Decorador: cachea la función en la VersionedCache `name`.
+
+    Parámetros:
+    - name (str): Nombre de la caché
+    - max_versions (int): Versiones que se conservan (por grupo)
+    - version_arg (str): Argumento que identifica la versión (hash o huella)
+    - group_by (Tuple[str, ...]): Argumentos que separan grupos con versiones
+      independientes (vacío = un único grupo)
+
+    La clave son el resto de argumentos (valores por defecto incluidos) salvo
+    los que empiezan por guion bajo. El decorador puede ejecutarse en cada
+    recarga del script principal: la caché se busca por nombre y es la misma.
+    """
+    def decorator(func: Callable) -> Callable:
+        firma = inspect.signature(func)
+        cache = get_cache(name, max_versions)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            ligados = firma.bind(*args, **kwargs)
+            ligados.apply_defaults()
+            version = str(ligados.arguments[version_arg])
+            clave = tuple(
+                (nombre, _hashable(valor)) for nombre, valor in ligados.arguments.items()
+                if nombre != version_arg and not nombre.startswith("_")
+            )
+            grupo = tuple(_hashable(ligados.arguments[nombre]) for nombre in group_by)
+            return cache.get_or_compute(version, clave, lambda: func(*args, **kwargs), grupo)
+
+        wrapper.clear = cache.clear
+        return wrapper
+    return decorator
+
+
+def cache_policy_stats() -> List[Dict]:
+    """Estadísticas de todas las cachés registradas (ver VersionedCache.stats)."""
+    with _CACHES_LOCK:
+        caches = list(_CACHES.values())
+    return [c.stats() for c in caches]
+
+
+def clear_caches() -> None:
+    """Vacía todas las cachés registradas (los contadores se conservan)."""
+    with _CACHES_LOCK:
+        caches = list(_CACHES.values())
+    for c in caches:
+        c.clear()
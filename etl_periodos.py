@@ -0,0 +1,486 @@
+"""
+ETL de periodos: construye el maestro procesado de un mes a partir de los
+ficheros crudos que se dejan en data/periodos/<YYYY-MM>/raw.
+
+Entrada (raw/):
+- repartocostes.xlsx  → Trabajadores (cabecera en fila 2), Hoja1, Centros
+- informecentros.xlsx → Informe de centros (cabecera en fila 6)
+- tarifarios.xlsx     → tarifas_incidencias, cuenta_motivos
+
+Salida (processed/):
+- maestros.xlsx        → Hojas que espera OptimizedDataManager + REPORTE
+- etl_manifest.json    → Huellas de origen y de especificación por hoja, y tiempos
+- .etl_cache/*.pkl     → Hojas ya transformadas (se reutilizan si no cambian ni la
+                         huella de origen ni su especificación/transformación)
+
+Uso:
+    python etl_periodos.py 2025-07
+    python etl_periodos.py 2025-07 --force --workers 4
+"""
+
+import argparse
+import hashlib
+import inspect
+import json
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from xlsx_stream import read_sheet, sheet_fingerprint
+
+# =============================================================================
+# CONFIGURACIÓN
+# =============================================================================
+
+BASE_DIR = Path(__file__).resolve().parent
+DATA_DIR = BASE_DIR / "data"
+PERIODOS_DIR = DATA_DIR / "periodos"
+
+PERIODO_RE = re.compile(r"^\d{4}-(0[1-9]|1[0-2])$")
+
+MANIFEST_NAME = "etl_manifest.json"
+CACHE_DIRNAME = ".etl_cache"
+OUTPUT_NAME = "maestros.xlsx"
+
+# Versión del código del ETL: súbela al cambiar la lectura o las utilidades
+# comunes de las transformaciones (_codigo_a_texto, _texto...). Invalida las
+# hojas cacheadas de todos los periodos.
+ETL_VERSION = 1
+
+
+@dataclass(frozen=True)
+class SheetSpec:
+    """
+    Definición de una hoja del maestro procesado.
+
+    Atributos:
+    - output (str): Nombre de la hoja en maestros.xlsx
+    - source_file (str): Fichero dentro de raw/
+    - source_sheet (Optional[str]): Hoja de origen (None = primera hoja)
+    - header_row (int): Fila (0-based) con la cabecera
+    - columns (Dict[str, str]): Proyección {columna origen: columna destino}
+    - transform (str): Nombre de la función de transformación
+    """
+    output: str
+    source_file: str
+    source_sheet: Optional[str]
+    header_row: int
+    columns: Dict[str, str] = field(default_factory=dict)
+    transform: str = ""
+
+
+# =============================================================================
+# UTILIDADES
+# =============================================================================
+
+def _codigo_a_texto(serie: pd.Series) -> pd.Series:
+    """
+    Convierte una columna de códigos a texto sin decimales ni notación científica.
+
+    Parámetros:
+    - serie (pd.Series): Códigos leídos del Excel (números, textos o nulos)
+
+    Retorna:
+    - pd.Series: Códigos como str ('' para nulos)
+    """
+    numeric = pd.to_numeric(serie, errors="coerce")
+    is_num = numeric.notna() & np.isfinite(numeric) & (numeric == np.round(numeric))
+    out = serie.astype(object).where(serie.notna(), "").astype(str).str.strip()
+    out[is_num] = numeric[is_num].astype("int64").astype(str)
+    return out
+
+
+def _texto(serie: pd.Series) -> pd.Series:
+    """Convierte una columna a texto limpio ('' para nulos)."""
+    return serie.astype(object).where(serie.notna(), "").astype(str).str.strip()
+
+
+# =============================================================================
+# DEFINICIÓN DE HOJAS
+# =============================================================================
+
+SHEET_SPECS: List[SheetSpec] = [
+    SheetSpec(
+        output="Trabajadores",
+        source_file="repartocostes.xlsx",
+        source_sheet="Trabajadores",
+        header_row=1,
+        columns={
+            "empresa2": "cod_empresa",
+            "Empleado - Código": "cod_empleado",
+            "Nombre empleado": "nombre_empleado",
+            "Nombre de la empresa": "nombre_empresa",
+            "Código contrato": "cod_contrato",
+            "Contrato": "tipo_contrato",
+            "Porcentaje de jornada": "porcen_contrato",
+            "Sección": "desc_seccion",
+            "Categoría": "cat_empleado",
+            "Código sección": "cod_seccion",
+            "Código reg. convenio": "cod_reg_convenio",
+            "Departamento": "desc_dpto",
+            "Puesto de trabajo": "puesto_empleado",
+            "coste hora empresa": "coste_hora",
+            "empresa/seccion": "empresa_codigo",
+            "codigo Cwon": "cod_crown",
+            "Nombre Código Crown": "nombre_cod_crown",
+            "centro preferente": "centro_preferente",
+        },
+        transform="_transform_trabajadores",
+    ),
+    SheetSpec(
+        output="Centros",
+        source_file="informecentros.xlsx",
+        source_sheet=None,
+        header_row=5,
+        columns={
+            "Código": "codigo_centro",
+            "Descripción": "nombre_centro",
+            "Jefe de operaciones (Códigos)": "cod_jefe",
+            "Jefe de operaciones (Descripción)": "nombre_jefe_ope",
+            "Fecha de baja": "fecha_baja_centro",
+            "Centro preferente (Códigos)": "cod_centro_preferente",
+            "Centro preferente (Descripción)": "desc_centro_preferente",
+        },
+        transform="_transform_centros",
+    ),
+    SheetSpec(
+        output="maestro_centros",
+        source_file="repartocostes.xlsx",
+        source_sheet="Hoja1",
+        header_row=0,
+        columns={
+            "ccentro": "codigo_centro",
+            "dcentro": "nombre_centro",
+            "centropref": "cod_centro_preferente",
+        },
+        transform="_transform_maestro_centros",
+    ),
+    SheetSpec(
+        output="equivalencia_centros",
+        source_file="repartocostes.xlsx",
+        source_sheet="Centros",
+        header_row=0,
+        columns={
+            "c1": "c1",
+            "c2": "c2",
+            "centro": "centro",
+            "concatenado": "llave",
+            "CENTRO PREF": "centro_pref",
+        },
+        transform="_transform_equivalencia",
+    ),
+    SheetSpec(
+        output="tarifas_incidencias",
+        source_file="tarifarios.xlsx",
+        source_sheet="tarifas_incidencias",
+        header_row=0,
+        columns={
+            "Descripción": "Descripción",
+            "tarifa_noct": "tarifa_noct",
+            "cod_convenio": "cod_convenio",
+        },
+        transform="_transform_tarifas",
+    ),
+    SheetSpec(
+        output="cuenta_motivos",
+        source_file="tarifarios.xlsx",
+        source_sheet="cuenta_motivos",
+        header_row=0,
+        columns={
+            "Motivo": "Motivo",
+            "desc_cuenta": "desc_cuenta",
+        },
+        transform="_transform_motivos",
+    ),
+]
+
+
+# =============================================================================
+# LECTURA Y TRANSFORMACIONES
+# =============================================================================
+
+def _read_projected(raw_dir: Path, spec: SheetSpec) -> pd.DataFrame:
+    """
+    Lee solo las columnas declaradas en la especificación (lector en streaming).
+
+    Parámetros:
+    - raw_dir (Path): Carpeta raw/ del periodo
+    - spec (SheetSpec): Hoja a leer
+
+    Retorna:
+    - pd.DataFrame: Columnas renombradas a los nombres de destino
+
+    Nota: Si una cabecera aparece repetida se usa la primera aparición.
+    """
+    try:
+        df = read_sheet(
+            str(raw_dir / spec.source_file),
+            spec.source_sheet,
+            columns=list(spec.columns),
+            header_row=spec.header_row,
+        )
+    except KeyError as e:
+        raise ValueError(f"{spec.source_file}:{spec.source_sheet or '<primera>'}: {e}") from e
+    return df.rename(columns=spec.columns)
+
+
+def _transform_trabajadores(df: pd.DataFrame) -> pd.DataFrame:
+    """Filtra empleados con empresa asignada y normaliza códigos y servicio."""
+    df = df[df["cod_empresa"].notna() & df["nombre_empleado"].notna()].copy()
+    df["nombre_empresa_final"] = df["cod_empresa"]
+    df["nombre_empleado"] = _texto(df["nombre_empleado"]).str.upper()
+    for col in ("cod_empleado", "cod_contrato", "cod_seccion", "cod_reg_convenio",
+                "empresa_codigo", "cod_crown", "centro_preferente"):
+        df[col] = _codigo_a_texto(df[col])
+    df["coste_hora"] = pd.to_numeric(df["coste_hora"], errors="coerce").replace([np.inf, -np.inf], np.nan)
+    df["porcen_contrato"] = pd.to_numeric(df["porcen_contrato"], errors="coerce")
+    df["servicio"] = np.where(
+        df["cat_empleado"].astype(str).str.contains("limp|asl", case=False, na=False),
+        "020 Limpieza",
+        "010 Restauración",
+    )
+    return df.reset_index(drop=True)
+
+
+def _transform_centros(df: pd.DataFrame) -> pd.DataFrame:
+    """Centros activos con jefe de operaciones y centro preferente."""
+    for col in ("codigo_centro", "nombre_centro", "cod_jefe", "nombre_jefe_ope",
+                "cod_centro_preferente", "desc_centro_preferente"):
+        df[col] = _texto(df[col])
+    activos = (
+        df["fecha_baja_centro"].isna()
+        & (df["cod_centro_preferente"] != "")
+        & (df["nombre_jefe_ope"] != "")
+    )
+    return df.loc[activos].drop(columns=["fecha_baja_centro"]).reset_index(drop=True)
+
+
+def _transform_maestro_centros(df: pd.DataFrame) -> pd.DataFrame:
+    """Relación completa centro → centro preferente (incluye bajas)."""
+    df = df[df["codigo_centro"].notna()].copy()
+    df["codigo_centro"] = _codigo_a_texto(df["codigo_centro"]).str.zfill(6)
+    df["nombre_centro"] = _texto(df["nombre_centro"])
+    df["cod_centro_preferente"] = _codigo_a_texto(df["cod_centro_preferente"])
+    return df.reset_index(drop=True)
+
+
+def _transform_equivalencia(df: pd.DataFrame) -> pd.DataFrame:
+    """Tabla de equivalencias empresa/sección → centro."""
+    df = df[df["c1"].notna() & df["centro"].notna()].copy()
+    for col in ("c2", "centro", "llave", "centro_pref"):
+        df[col] = _codigo_a_texto(df[col])
+    return df.reset_index(drop=True)
+
+
+def _transform_tarifas(df: pd.DataFrame) -> pd.DataFrame:
+    """Tarifas de nocturnidad por categoría y convenio."""
+    df = df[df["Descripción"].notna()].copy()
+    df["cod_convenio"] = _codigo_a_texto(df["cod_convenio"])
+    df["tarifa_noct"] = pd.to_numeric(df["tarifa_noct"], errors="coerce")
+    return df.reset_index(drop=True)
+
+
+def _transform_motivos(df: pd.DataFrame) -> pd.DataFrame:
+    """Relación motivo → cuenta contable."""
+    return df[df["Motivo"].notna()].reset_index(drop=True)
+
+
+_TRANSFORMS: Dict[str, Callable[[pd.DataFrame], pd.DataFrame]] = {
+    "_transform_trabajadores": _transform_trabajadores,
+    "_transform_centros": _transform_centros,
+    "_transform_maestro_centros": _transform_maestro_centros,
+    "_transform_equivalencia": _transform_equivalencia,
+    "_transform_tarifas": _transform_tarifas,
+    "_transform_motivos": _transform_motivos,
+}
+
+
+def spec_hash(spec: SheetSpec) -> str:
+    """
+    Huella de cómo se construye una hoja: ETL_VERSION, la especificación y el
+    código de su transformación. Si cambia, la hoja cacheada no vale aunque el
+    origen sea el mismo.
+    """
+    transform = _TRANSFORMS[spec.transform]
+    try:
+        codigo = inspect.getsource(transform)
+    except (OSError, TypeError):
+        codigo = transform.__code__.co_code.hex()
+    contenido = f"{ETL_VERSION}|{spec!r}|{transform.__qualname__}|{codigo}"
+    return hashlib.md5(contenido.encode("utf-8")).hexdigest()[:16]
+
+
+def _build_sheet(raw_dir: str, spec: SheetSpec, cache_file: str) -> Dict:
+    """
+    Lee, transforma y cachea una hoja. Se ejecuta en un proceso hijo.
+
+    Parámetros:
+    - raw_dir (str): Carpeta raw/ del periodo
+    - spec (SheetSpec): Hoja a construir
+    - cache_file (str): Ruta del .pkl donde guardar el resultado
+
+    Retorna:
+    - Dict: {'output', 'rows', 'seconds'}
+    """
+    start = time.perf_counter()
+    df = _TRANSFORMS[spec.transform](_read_projected(Path(raw_dir), spec))
+    df.to_pickle(cache_file)
+    return {"output": spec.output, "rows": len(df), "seconds": time.perf_counter() - start}
+
+
+# =============================================================================
+# ORQUESTACIÓN
+# =============================================================================
+
+def run_etl(periodo: str, data_dir: Path = DATA_DIR, force: bool = False, workers: Optional[int] = None) -> Dict:
+    """
+    Construye processed/maestros.xlsx para un periodo.
+
+    Parámetros:
+    - periodo (str): Mes en formato YYYY-MM
+    - data_dir (Path): Carpeta data/ del proyecto
+    - force (bool): Reconstruir todas las hojas aunque no hayan cambiado
+    - workers (Optional[int]): Procesos para parsear hojas en paralelo
+
+    Retorna:
+    - Dict: Manifest escrito (huellas, filas y tiempos por hoja)
+
+    Procesamiento:
+    1. Calcula la huella de cada hoja de origen
+    2. Reutiliza del caché las hojas cuya huella y especificación (spec_hash)
+       no cambiaron
+    3. Parsea en paralelo el resto (proyectando columnas)
+    4. Escribe maestros.xlsx con hoja REPORTE y el manifest
+    """
+    if not PERIODO_RE.match(periodo):
+        raise ValueError(f"Periodo '{periodo}' no válido (formato YYYY-MM)")
+
+    periodo_dir = Path(data_dir) / "periodos" / periodo
+    raw_dir = periodo_dir / "raw"
+    processed_dir = periodo_dir / "processed"
+    cache_dir = processed_dir / CACHE_DIRNAME
+    if not raw_dir.is_dir():
+        raise FileNotFoundError(f"No existe la carpeta {raw_dir}")
+    cache_dir.mkdir(parents=True, exist_ok=True)
+
+    total_start = time.perf_counter()
+    manifest_path = processed_dir / MANIFEST_NAME
+    previous = {}
+    if manifest_path.exists() and not force:
+        previous = json.loads(manifest_path.read_text(encoding="utf-8")).get("sheets", {})
+
+    fingerprints = {
+        spec.output: sheet_fingerprint(raw_dir / spec.source_file, spec.source_sheet)
+        for spec in SHEET_SPECS
+    }
+    for spec in SHEET_SPECS:
+        if fingerprints[spec.output] == "FILE_NOT_FOUND":
+            raise FileNotFoundError(f"Falta {raw_dir / spec.source_file}")
+
+    specs = {spec.output: spec_hash(spec) for spec in SHEET_SPECS}
+
+    pending = [
+        spec for spec in SHEET_SPECS
+        if previous.get(spec.output, {}).get("fingerprint") != fingerprints[spec.output]
+        or previous.get(spec.output, {}).get("spec") != specs[spec.output]
+        or not (cache_dir / f"{spec.output}.pkl").exists()
+    ]
+
+    results = {}
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers or min(len(pending), 4)) as pool:
+            futures = [
+                pool.submit(_build_sheet, str(raw_dir), spec, str(cache_dir / f"{spec.output}.pkl"))
+                for spec in pending
+            ]
+            for future in futures:
+                info = future.result()
+                results[info["output"]] = info
+
+    frames = {spec.output: pd.read_pickle(cache_dir / f"{spec.output}.pkl") for spec in SHEET_SPECS}
+
+    sheets_manifest = {}
+    for spec in SHEET_SPECS:
+        rebuilt = spec.output in results
+        sheets_manifest[spec.output] = {
+            "fingerprint": fingerprints[spec.output],
+            "spec": specs[spec.output],
+            "source": f"{spec.source_file}:{spec.source_sheet or '<primera>'}",
+            "rows": len(frames[spec.output]),
+            "columns": len(frames[spec.output].columns),
+            "rebuilt": rebuilt,
+            "seconds": round(results[spec.output]["seconds"], 3) if rebuilt else 0.0,
+        }
+
+    write_start = time.perf_counter()
+    _write_master(processed_dir / OUTPUT_NAME, frames, sheets_manifest, periodo)
+    write_seconds = time.perf_counter() - write_start
+
+    manifest = {
+        "periodo": periodo,
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "output": str(processed_dir / OUTPUT_NAME),
+        "write_seconds": round(write_seconds, 3),
+        "total_seconds": round(time.perf_counter() - total_start, 3),
+        "sheets": sheets_manifest,
+    }
+    manifest_path.write_text(json.dumps(manifest, indent=2, ensure_ascii=False), encoding="utf-8")
+    return manifest
+
+
+def _write_master(output: Path, frames: Dict[str, pd.DataFrame], sheets_manifest: Dict, periodo: str) -> None:
+    """
+    Escribe el maestro procesado de forma atómica (fichero temporal + rename).
+
+    Parámetros:
+    - output (Path): Ruta final de maestros.xlsx
+    - frames (Dict[str, DataFrame]): Hojas a escribir, en orden
+    - sheets_manifest (Dict): Resumen por hoja para la hoja REPORTE
+    - periodo (str): Mes procesado
+    """
+    reporte = [("INFO", "Reporte de Consolidación", datetime.now().strftime("%Y-%m-%d %H:%M:%S"), f"Periodo: {periodo}")]
+    for name, info in sheets_manifest.items():
+        estado = "RECONSTRUIDA" if info["rebuilt"] else "SIN CAMBIOS"
+        reporte.append(("Resumen", name, f"{info['rows']} filas, {info['columns']} columnas", estado))
+
+    tmp = output.with_name(f".{output.name}.tmp")
+    with pd.ExcelWriter(tmp, engine="xlsxwriter") as writer:
+        for name, df in frames.items():
+            df.to_excel(writer, sheet_name=name, index=False)
+        pd.DataFrame(reporte, columns=["Seccion", "Detalle", "Valor", "Notas"]).to_excel(
+            writer, sheet_name="REPORTE", index=False
+        )
+    tmp.replace(output)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Genera processed/maestros.xlsx de un periodo a partir de raw/")
+    parser.add_argument("periodo", help="Mes a procesar (YYYY-MM)")
+    parser.add_argument("--data-dir", default=str(DATA_DIR), help="Carpeta data/ (por defecto la del proyecto)")
+    parser.add_argument("--force", action="store_true", help="Ignorar huellas y reconstruir todas las hojas")
+    parser.add_argument("--workers", type=int, default=None, help="Procesos en paralelo (por defecto hasta 4)")
+    args = parser.parse_args(argv)
+
+    try:
+        manifest = run_etl(args.periodo, Path(args.data_dir), force=args.force, workers=args.workers)
+    except (ValueError, FileNotFoundError, KeyError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+
+    for name, info in manifest["sheets"].items():
+        estado = f"{info['seconds']:.2f}s" if info["rebuilt"] else "sin cambios"
+        print(f"  {name:<22} {info['rows']:>6} filas  {estado}")
+    print(f"✅ {manifest['output']} generado en {manifest['total_seconds']:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,262 @@
+"""
+Histórico analítico de exportaciones (Parquet particionado por periodo y jefe).
+
+Cada exportación finalizada se guarda en
+
+    <raíz>/periodo=<YYYY-MM>/jefe=<jefe, codificado URI>/incidencias.parquet
+
+Volver a exportar el mismo periodo y jefe sustituye su partición (cuenta la
+última exportación), así que un mes nunca se suma dos veces.
+
+Las consultas no recorren las incidencias: cada partición se agrega una vez
+(Arrow group_by) al grano de las dimensiones de análisis y el cubo resultante,
+pequeño y con dimensiones categóricas, se mantiene en memoria. Archivar un mes
+solo reagrega esa partición; agrupar años de histórico cuesta milisegundos.
+
+Uso:
+    from historico import HistoryStore
+
+    store = HistoryStore("data/historico")
+    store.append(df_export, periodo="2025-07", jefe="ANA PÉREZ")
+    tabla, stats = store.query(["periodo", "Centro Destino"], ["Coste_total"], desde="2025-01", hasta="2025-06")
+"""
+
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+from urllib.parse import quote, unquote
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# =============================================================================
+# ESQUEMA
+# =============================================================================
+
+# Etiqueta en la página de histórico → columna (periodo y jefe son las particiones)
+DIMENSIONES: Dict[str, str] = {
+    "Mes": "periodo",
+    "Jefe": "jefe",
+    "Centro": "Centro Destino",
+    "Motivo": "Motivo",
+    "Servicio": "Servicio",
+    "Categoría": "Categoria",
+}
+
+MEDIDAS: Dict[str, str] = {
+    "Coste total": "Coste_total",
+    "Horas": "Cuantía",
+    "Horas nocturnidad": "Cuantía nocturnidad",
+    "Plus nocturnidad": "74_plus_nocturnidad",
+    "Traslados": "Horas traslado",
+}
+
+FICHERO_PARTICION = "incidencias.parquet"
+_FECHAS = ("Fecha inicio", "Fecha fin")
+# Códigos: texto aunque lleguen como número (un convenio de 14 dígitos no es un float)
+_CODIGOS = ("Código Crown Destino", "Código Crown Origen", "cod_reg_convenio", "cod_empresa")
+
+
+def _tabla_historico(df: pd.DataFrame) -> pa.Table:
+    """
+    Tipos estables entre meses: medidas y numéricos a float64, fechas a
+    date32, códigos y el resto a texto ('' en vacíos). Sin esto, una columna vacía un
+    mes y rellena otro tendría tipos distintos en cada fichero.
+    """
+    columnas = {}
+    for nombre in df.columns:
+        serie = df[nombre]
+        if nombre in _FECHAS:
+            columnas[nombre] = pd.to_datetime(serie, errors="coerce").dt.date
+        elif nombre in _CODIGOS and pd.api.types.is_numeric_dtype(serie):
+            columnas[nombre] = serie.astype("Int64").astype(str).replace("<NA>", "")
+        elif nombre in MEDIDAS.values() or (pd.api.types.is_numeric_dtype(serie) and not pd.api.types.is_bool_dtype(serie)):
+            columnas[nombre] = pd.to_numeric(serie, errors="coerce").astype("float64")
+        else:
+            columnas[nombre] = serie.astype(object).where(serie.notna(), "").astype(str)
+    tabla = pa.Table.from_pandas(pd.DataFrame(columnas), preserve_index=False)
+    for nombre in _FECHAS:
+        if nombre in tabla.column_names:
+            tabla = tabla.set_column(tabla.schema.get_field_index(nombre), nombre, tabla[nombre].cast(pa.date32()))
+    return tabla.append_column("archivado_en", pa.array([datetime.now().isoformat(timespec="seconds")] * tabla.num_rows))
+
+# =============================================================================
+# ALMACÉN
+# =============================================================================
+
+class HistoryStore:
+    """
+    Histórico de exportaciones en una carpeta local.
+
+    Parámetros:
+    - root (str): Carpeta raíz (se crea al archivar la primera exportación)
+    """
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+        self._lock = threading.Lock()
+        self._resumenes: Dict[Path, Tuple[Tuple[int, int], pd.DataFrame]] = {}
+        self._cubo: Optional[pd.DataFrame] = None
+        self._cubo_firmas: Dict[Path, Tuple[int, int]] = {}
+
+    def _ruta(self, periodo: str, jefe: str) -> Path:
+        return self.root / f"periodo={periodo}" / f"jefe={quote(jefe, safe='')}" / FICHERO_PARTICION
+
+    def _ficheros(self) -> List[Path]:
+        if not self.root.is_dir():
+            return []
+        return sorted(self.root.glob(f"periodo=*/jefe=*/{FICHERO_PARTICION}"))
+
+    def append(self, df: pd.DataFrame, periodo: str, jefe: str) -> Path:
+        """
+        Archiva una exportación, sustituyendo la de ese periodo y jefe si existía.
+
+        Parámetros:
+        - df (pd.DataFrame): DataFrame exportado (columnas del Excel)
+        - periodo (str): "YYYY-MM"
+        - jefe (str): Jefe de operaciones
+
+        Retorna:
+        - Path: Fichero de la partición
+
+        La escritura es atómica (fichero temporal + os.replace): una consulta
+        concurrente ve la versión anterior o la nueva, nunca una a medias.
+        """
+        ruta = self._ruta(periodo, jefe)
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+        tmp = ruta.with_name(f".{ruta.name}.{os.getpid()}.tmp")
+        pq.write_table(_tabla_historico(df), tmp, compression="zstd")
+        os.replace(tmp, ruta)
+        return ruta
+
+    def partitions(self) -> pd.DataFrame:
+        """
+        Particiones archivadas (solo lee los pies de los ficheros Parquet).
+
+        Retorna:
+        - pd.DataFrame: periodo, jefe, filas, bytes, modificado
+        """
+        filas = []
+        for ruta in self._ficheros():
+            stat = ruta.stat()
+            filas.append({
+                "periodo": ruta.parent.parent.name.split("=", 1)[1],
+                "jefe": unquote(ruta.parent.name.split("=", 1)[1]),
+                "filas": pq.read_metadata(ruta).num_rows,
+                "bytes": stat.st_size,
+                "modificado": datetime.fromtimestamp(stat.st_mtime).isoformat(timespec="seconds"),
+            })
+        return pd.DataFrame(filas, columns=["periodo", "jefe", "filas", "bytes", "modificado"])
+
+    def read_period(self, periodo: str) -> pd.DataFrame:
+        """
+        Incidencias archivadas de un mes (todas las particiones de jefe, una tras otra).
+
+        Parámetros:
+        - periodo (str): "YYYY-MM"
+
+        Retorna:
+        - pd.DataFrame: Columnas del Excel exportado, sin "archivado_en"
+          (vacío si el mes no tiene exportaciones)
+        """
+        ficheros = sorted((self.root / f"periodo={periodo}").glob(f"jefe=*/{FICHERO_PARTICION}"))
+        if not ficheros:
+            return pd.DataFrame()
+        # promote_options: un mes puede mezclar exportaciones con y sin columnas opcionales
+        tabla = pa.concat_tables([pq.read_table(ruta) for ruta in ficheros], promote_options="default")
+        return tabla.drop_columns(["archivado_en"]).to_pandas()
+
+    def _resumen_particion(self, ruta: Path) -> pd.DataFrame:
+        """Partición agregada al grano más fino de DIMENSIONES (suma de MEDIDAS + filas)."""
+        esquema = pq.read_schema(ruta)
+        dims = [c for c in DIMENSIONES.values() if c not in ("periodo", "jefe")]
+        presentes = [c for c in dims + list(MEDIDAS.values()) if c in esquema.names]
+        tabla = pq.read_table(ruta, columns=presentes)
+        for columna in dims:
+            if columna not in tabla.column_names:
+                tabla = tabla.append_column(columna, pa.array([""] * tabla.num_rows, pa.string()))
+        medidas = [m for m in MEDIDAS.values() if m in tabla.column_names]
+        resumen = tabla.group_by(dims).aggregate([(m, "sum") for m in medidas] + [([], "count_all")]).to_pandas()
+        resumen = resumen.rename(columns={f"{m}_sum": m for m in medidas} | {"count_all": "Incidencias"})
+        for m in MEDIDAS.values():
+            if m not in resumen.columns:
+                resumen[m] = 0.0
+        resumen.insert(0, "jefe", unquote(ruta.parent.name.split("=", 1)[1]))
+        resumen.insert(0, "periodo", ruta.parent.parent.name.split("=", 1)[1])
+        return resumen
+
+    def cube(self) -> pd.DataFrame:
+        """
+        Cubo del histórico: una fila por combinación de DIMENSIONES con las MEDIDAS
+        sumadas e "Incidencias".
+
+        Cada partición se agrega una sola vez y se reutiliza mientras su fichero
+        no cambie (firma mtime/tamaño), así que archivar un mes solo reagrega ese
+        mes. Las dimensiones son categóricas: agrupar el cubo cuesta milisegundos.
+        """
+        with self._lock:
+            firmas = {ruta: (ruta.stat().st_mtime_ns, ruta.stat().st_size) for ruta in self._ficheros()}
+            if self._cubo is not None and firmas == self._cubo_firmas:
+                return self._cubo
+            for ruta in list(self._resumenes):
+                if ruta not in firmas:
+                    del self._resumenes[ruta]
+            for ruta, firma in firmas.items():
+                if ruta not in self._resumenes or self._resumenes[ruta][0] != firma:
+                    self._resumenes[ruta] = (firma, self._resumen_particion(ruta))
+
+            columnas = list(DIMENSIONES.values()) + list(MEDIDAS.values()) + ["Incidencias"]
+            partes = [resumen for _, resumen in self._resumenes.values()]
+            cubo = pd.concat(partes, ignore_index=True)[columnas] if partes else pd.DataFrame(columns=columnas)
+            for columna in DIMENSIONES.values():
+                cubo[columna] = cubo[columna].astype("category")
+            self._cubo, self._cubo_firmas = cubo, firmas
+            return cubo
+
+    def query(self, por: Sequence[str], medidas: Sequence[str], desde: str = "", hasta: str = "",
+              jefes: Sequence[str] = ()) -> Tuple[pd.DataFrame, Dict[str, float]]:
+        """
+        Agrega el histórico.
+
+        Parámetros:
+        - por (Sequence[str]): Columnas de agrupación (valores de DIMENSIONES)
+        - medidas (Sequence[str]): Columnas a sumar (valores de MEDIDAS)
+        - desde, hasta (str): Rango de periodos "YYYY-MM" incluidos ("" = sin límite)
+        - jefes (Sequence[str]): Restringe a esos jefes (vacío = todos)
+
+        Retorna:
+        - Tuple[pd.DataFrame, Dict]: Una fila por grupo con las medidas sumadas y
+          "Incidencias" (número de filas); y estadísticas {filas_cubo, incidencias, ms}
+
+        Procesamiento:
+        1. Cubo del histórico (cube): solo reagrega particiones nuevas o cambiadas
+        2. Filtra periodo/jefe sobre los códigos de las categorías
+        3. groupby(observed=True) sobre el cubo, no sobre las incidencias
+        """
+        inicio = time.perf_counter()
+        columnas = list(medidas) + ["Incidencias"]
+        cubo = self.cube()
+
+        # Los filtros se evalúan sobre las categorías (decenas), no sobre las filas
+        periodos = [p for p in cubo["periodo"].cat.categories if (not desde or p >= desde) and (not hasta or p <= hasta)]
+        mascara = cubo["periodo"].isin(periodos).to_numpy()
+        if jefes:
+            mascara &= cubo["jefe"].isin(list(jefes)).to_numpy()
+        filtrado = cubo[list(por) + columnas] if mascara.all() else cubo.loc[mascara, list(por) + columnas]
+
+        if por:
+            resultado = filtrado.groupby(list(por), observed=True, sort=True)[columnas].sum().reset_index()
+        else:
+            resultado = filtrado[columnas].sum().to_frame().T
+        for columna in por:
+            resultado[columna] = resultado[columna].astype(str)
+        resultado["Incidencias"] = resultado["Incidencias"].astype("int64")
+        return resultado, {
+            "filas_cubo": len(filtrado),
+            "incidencias": int(resultado["Incidencias"].sum()),
+            "ms": (time.perf_counter() - inicio) * 1000,
+        }
@@ -0,0 +1,188 @@
+"""
+Cola de trabajos en segundo plano con progreso, cancelación y caché de resultados.
+
+Pensada para exportaciones largas: la recarga de Streamlit encola el trabajo y
+vuelve enseguida; un hilo del pool lo ejecuta mientras el usuario sigue
+editando, y la página consulta el estado por su id hasta que el resultado está
+listo para descargar.
+
+La función del trabajo recibe un JobContext como primer argumento:
+
+    def exportar(ctx, datos):
+        ctx.progress(0.1, "Validando...")
+        ...
+        ctx.check_cancelled()          # punto de cancelación cooperativa
+        return resultado
+
+    jobs = JobQueue(max_workers=2, ttl=900)
+    job = jobs.submit(exportar, datos, key="hash-de-los-datos", label="Excel julio")
+    jobs.get(job.id).state            # queued | running | done | error | cancelled
+
+Los trabajos terminados se conservan `ttl` segundos; volver a pedir la misma
+clave mientras tanto devuelve el trabajo existente en lugar de repetirlo.
+"""
+
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+# =============================================================================
+# TRABAJOS
+# =============================================================================
+
+QUEUED, RUNNING, DONE, ERROR, CANCELLED = "queued", "running", "done", "error", "cancelled"
+FINISHED_STATES = (DONE, ERROR, CANCELLED)
+
+
+class JobCancelled(Exception):
+    """El trabajo se canceló en un punto de cancelación (JobContext.check_cancelled)."""
+
+
+@dataclass
+class Job:
+    """
+    Estado de un trabajo (lo actualiza el hilo del pool; la página solo lo lee).
+
+    Atributos:
+    - id (str): Identificador corto
+    - key (Hashable): Clave de caché (mismos datos → mismo trabajo)
+    - label (str): Descripción para la interfaz
+    - state (str): queued | running | done | error | cancelled
+    - progress (float): 0..1
+    - message (str): Paso actual
+    - result (Any): Valor devuelto por la función (solo en done)
+    - error (str): Tipo y mensaje de la excepción (solo en error)
+    """
+    id: str
+    key: Hashable
+    label: str = ""
+    state: str = QUEUED
+    progress: float = 0.0
+    message: str = "En cola"
+    result: Any = None
+    error: str = ""
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    _cancel: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.state in FINISHED_STATES
+
+    @property
+    def seconds(self) -> float:
+        """Duración hasta ahora (o total, si ya terminó)."""
+        return (self.finished_at or time.time()) - self.created_at
+
+
+class JobContext:
+    """Interfaz del trabajo en ejecución con su Job: progreso y cancelación."""
+
+    def __init__(self, job: Job):
+        self._job = job
+
+    def progress(self, fraction: float, message: str = "") -> None:
+        """Anota el avance (0..1) y comprueba la cancelación."""
+        self.check_cancelled()
+        self._job.progress = min(max(fraction, 0.0), 1.0)
+        if message:
+            self._job.message = message
+
+    def check_cancelled(self) -> None:
+        if self._job._cancel.is_set():
+            raise JobCancelled()
+
+# =============================================================================
+# COLA
+# =============================================================================
+
+class JobQueue:
+    """
+    Pool de hilos con registro de trabajos por id.
+
+    Parámetros:
+    - max_workers (int): Trabajos simultáneos (el resto espera en cola)
+    - ttl (float): Segundos que se conserva un trabajo terminado (y su resultado)
+    - max_jobs (int): Tope de trabajos terminados en memoria (se descartan los más antiguos)
+    """
+
+    def __init__(self, max_workers: int = 2, ttl: float = 900.0, max_jobs: int = 50):
+        self.ttl = ttl
+        self.max_jobs = max_jobs
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="export-job")
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, fn: Callable[..., Any], *args, key: Hashable = None, label: str = "", **kwargs) -> Job:
+        """
+        Encola fn(ctx, *args, **kwargs), o devuelve el trabajo vigente con la misma clave.
+
+        Un trabajo con la misma clave se reutiliza si está en cola, en marcha o
+        terminado con éxito y dentro del TTL; los fallidos o cancelados se repiten.
+        """
+        with self._lock:
+            self._purge_locked()
+            if key is not None:
+                for job in self._jobs.values():
+                    if job.key == key and job.state in (QUEUED, RUNNING, DONE):
+                        return job
+            job = Job(id=uuid.uuid4().hex[:12], key=key, label=label)
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def _run(self, job: Job, fn: Callable[..., Any], args: tuple, kwargs: dict) -> None:
+        if job._cancel.is_set():
+            self._finish(job, CANCELLED, "Cancelado")
+            return
+        job.state, job.message = RUNNING, "Iniciando..."
+        try:
+            result = fn(JobContext(job), *args, **kwargs)
+        except JobCancelled:
+            self._finish(job, CANCELLED, "Cancelado")
+        except Exception as e:
+            self._finish(job, ERROR, "Error", error=f"{type(e).__name__}: {e}")
+        else:
+            self._finish(job, DONE, "Listo", result=result)
+
+    def _finish(self, job: Job, state: str, message: str, result: Any = None, error: str = "") -> None:
+        """Estado terminal con finished_at ya puesto: la purga nunca ve uno sin el otro."""
+        with self._lock:
+            job.finished_at = time.time()
+            job.result, job.error, job.message = result, error, message
+            if state == DONE:
+                job.progress = 1.0
+            job.state = state
+
+    def get(self, job_id: Optional[str]) -> Optional[Job]:
+        """Trabajo por id, o None si no existe o ya caducó."""
+        with self._lock:
+            self._purge_locked()
+            return self._jobs.get(job_id) if job_id else None
+
+    def cancel(self, job_id: str) -> None:
+        """Pide la cancelación: inmediata si está en cola, en el siguiente punto de control si está en marcha."""
+        job = self.get(job_id)
+        if job is not None and not job.finished:
+            job._cancel.set()
+            job.message = "Cancelando..."
+
+    def jobs(self) -> List[Job]:
+        """Trabajos vigentes, del más reciente al más antiguo."""
+        with self._lock:
+            self._purge_locked()
+            return sorted(self._jobs.values(), key=lambda j: j.created_at, reverse=True)
+
+    def _purge_locked(self) -> None:
+        ahora = time.time()
+        # Sin finished_at no cuenta como terminado (salvaguarda: _finish pone ambos a la vez)
+        terminados = [j for j in self._jobs.values() if j.finished and j.finished_at is not None]
+        for job in terminados:
+            if ahora - job.finished_at > self.ttl:
+                del self._jobs[job.id]
+        terminados = sorted((j for j in terminados if j.id in self._jobs), key=lambda j: j.finished_at)
+        for job in terminados[:max(0, len(terminados) - self.max_jobs)]:
+            del self._jobs[job.id]
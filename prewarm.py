@@ -0,0 +1,147 @@
+"""
+Precalentamiento del servidor y comprobación de disponibilidad.
+
+Las cachés de Streamlit viven dentro del proceso del servidor, así que no se
+pueden llenar desde otro proceso: este script espera a que el servidor
+responda y abre una sesión sin navegador (websocket, mismo protocolo que el
+frontend). Esa primera recarga ejecuta _prewarm_process() en la app, que
+carga los maestros y sus lookups una sola vez y escribe READY_FILE:
+
+    {"status": "ready", "seconds": 4.2, "started_at": "...", "finished_at": "...",
+     "masters": [{"ruta": "...", "periodo": "2025-07", "seconds": 2.1, ...}]}
+
+Uso (contenedor):
+    python prewarm.py &  exec streamlit run app_optimized.py ...   # al arrancar
+    python prewarm.py --check                                       # healthcheck
+
+Opciones:
+    --url URL        Servidor Streamlit (por defecto http://127.0.0.1:8501)
+    --timeout SEG    Espera máxima al servidor y a la recarga (por defecto 300)
+    --check          Solo comprueba READY_FILE: código 0 si status == "ready"
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import urllib.request
+from pathlib import Path
+from typing import Dict, Optional
+
+READY_FILE = os.getenv('READY_FILE', '/tmp/incidencias_ready.json')
+
+# =============================================================================
+# FICHERO DE DISPONIBILIDAD
+# =============================================================================
+
+def read_ready_file(path: str = READY_FILE) -> Optional[Dict]:
+    """Estado escrito por la app o None si aún no existe (o está ilegible)."""
+    try:
+        return json.loads(Path(path).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def check(path: str = READY_FILE) -> int:
+    """Código de salida para el healthcheck: 0 listo, 1 calentando/error/sin fichero."""
+    estado = read_ready_file(path)
+    if estado is None:
+        print(f"❌ Sin fichero de disponibilidad ({path})")
+        return 1
+    if estado.get('status') != 'ready':
+        print(f"⏳ Estado: {estado.get('status')} {estado.get('error', '')}".rstrip())
+        return 1
+    print(f"✅ Listo en {estado.get('seconds', 0):.2f} s desde {estado.get('started_at')}")
+    return 0
+
+# =============================================================================
+# DISPARO DEL PRECALENTAMIENTO
+# =============================================================================
+
+def wait_for_server(url: str, timeout: float) -> None:
+    """Espera a que /_stcore/health responda 200."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"{url}/_stcore/health", timeout=2) as resp:
+                if resp.status == 200:
+                    return
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise TimeoutError(f"El servidor no respondió a /_stcore/health en {timeout:.0f} s")
+
+
+async def run_warmup_session(url: str, timeout: float) -> None:
+    """Abre una sesión, ejecuta la primera recarga y espera a que termine."""
+    import websockets
+    from streamlit.proto.BackMsg_pb2 import BackMsg
+    from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+    ws_url = url.replace("http", "ws", 1) + "/_stcore/stream"
+    async with websockets.connect(ws_url, subprotocols=["streamlit"], max_size=None, open_timeout=timeout) as ws:
+        msg = BackMsg()
+        msg.rerun_script.query_string = ""
+        await ws.send(msg.SerializeToString())
+
+        async def _wait() -> None:
+            while True:
+                fm = ForwardMsg.FromString(await ws.recv())
+                if fm.WhichOneof("type") == "script_finished" and fm.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    return
+
+        await asyncio.wait_for(_wait(), timeout)
+
+
+def warmup(url: str, timeout: float, path: str = READY_FILE) -> int:
+    """
+    Dispara el precalentamiento del servidor y espera al fichero de disponibilidad.
+
+    Parámetros:
+    - url (str): URL base del servidor
+    - timeout (float): Segundos máximos de espera
+    - path (str): READY_FILE
+
+    Retorna:
+    - int: Código de salida (0 si el estado final es "ready")
+    """
+    # Un fichero de un arranque anterior del contenedor no vale para este
+    Path(path).unlink(missing_ok=True)
+    inicio = time.perf_counter()
+    wait_for_server(url, timeout)
+    print(f"🌐 Servidor disponible en {time.perf_counter() - inicio:.1f} s; precalentando...")
+    asyncio.run(run_warmup_session(url, timeout))
+
+    estado = read_ready_file(path)
+    if estado is None:
+        print("⚠️ La recarga terminó pero la app no escribió el fichero de disponibilidad "
+              "(¿PREWARM=0, o el servidor ya estaba precalentado antes de lanzar este script?)")
+        return 1
+    for maestro in estado.get('masters', []):
+        print(f"  {maestro['seconds']:>7.2f} s  {maestro['ruta']} ({maestro['trabajadores']} trabajadores)")
+    return check(path)
+
+# =============================================================================
+# CLI
+# =============================================================================
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Precalienta el servidor Streamlit o comprueba si está listo")
+    parser.add_argument("--url", default="http://127.0.0.1:8501")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--check", action="store_true", help="Solo comprobar READY_FILE (healthcheck)")
+    args = parser.parse_args()
+
+    if args.check:
+        return check()
+    try:
+        return warmup(args.url.rstrip("/"), args.timeout)
+    except Exception as e:
+        print(f"❌ Precalentamiento fallido: {type(e).__name__}: {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
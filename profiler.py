@@ -0,0 +1,223 @@
+"""
+Perfilador bajo demanda de recargas individuales.
+
+Un hilo muestrea la pila del hilo de la sesión a intervalos fijos (perfilado
+estadístico: sobrecarga baja y constante, apto para producción) y acumula las
+pilas en formato "folded" (una línea `raiz;...;hoja N`), que leen
+directamente flamegraph.pl, speedscope e inferno.
+
+Opcionalmente, tracemalloc registra las asignaciones durante la recarga y se
+guarda el top-N por línea de código. tracemalloc es global al proceso y cada
+sesión de Streamlit recarga en su propio hilo: se activa con un contador de
+usuarios y solo se detiene cuando termina el último.
+
+La carpeta conserva los `keep` perfiles más recientes (el resto se borra al
+guardar uno nuevo).
+
+Uso:
+    from profiler import profile_to_dir
+
+    with profile_to_dir("profiles", "rerun_sesion", alloc_top=25, keep=50) as result:
+        app.run()
+    result.folded_path   # profiles/rerun_sesion.folded
+"""
+
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, Optional
+
+# =============================================================================
+# MUESTREO DE PILAS
+# =============================================================================
+
+# Marcos que no aportan nada al gráfico (el propio perfilador y threading)
+_SKIP_FILES = (os.path.abspath(__file__), threading.__file__)
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})".replace(";", ":")
+
+
+class SamplingProfiler:
+    """
+    Muestrea la pila de un hilo cada `interval` segundos.
+
+    Parámetros:
+    - interval (float): Segundos entre muestras (por defecto 5 ms)
+    - thread_id (Optional[int]): Hilo a muestrear (por defecto el que llama a start)
+
+    Atributos:
+    - stacks (Counter): pila plegada → número de muestras
+    - samples (int): Total de muestras tomadas
+    """
+
+    def __init__(self, interval: float = 0.005, thread_id: Optional[int] = None):
+        self.interval = interval
+        self.thread_id = thread_id
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self.thread_id is None:
+            self.thread_id = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="rerun-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            labels = []
+            while frame is not None:
+                if frame.f_code.co_filename not in _SKIP_FILES:
+                    labels.append(_frame_label(frame))
+                frame = frame.f_back
+            if labels:
+                labels.reverse()
+                self.stacks[";".join(labels)] += 1
+                self.samples += 1
+
+    def folded(self) -> str:
+        """Pilas en formato folded, de mayor a menor número de muestras."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+# =============================================================================
+# PERFIL DE UNA RECARGA
+# =============================================================================
+
+@dataclass
+class ProfileResult:
+    """Ficheros y estadísticas de un perfil guardado."""
+    folded_path: Optional[Path] = None
+    alloc_path: Optional[Path] = None
+    samples: int = 0
+    duration: float = 0.0
+
+
+PROFILE_SUFFIXES = (".folded", ".alloc.txt")
+
+# tracemalloc compartido entre sesiones: usuarios activos y si lo arrancamos nosotros
+_ALLOC_LOCK = threading.Lock()
+_alloc_users = 0
+_alloc_started = False
+# Escribir un perfil y podar la carpeta no se intercalan entre sesiones
+_WRITE_LOCK = threading.Lock()
+
+
+def _acquire_tracing() -> None:
+    global _alloc_users, _alloc_started
+    with _ALLOC_LOCK:
+        if _alloc_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _alloc_started = True
+        _alloc_users += 1
+
+
+def _release_tracing() -> tracemalloc.Snapshot:
+    """Instantánea de las asignaciones y suelta un uso; el último detiene tracemalloc."""
+    global _alloc_users, _alloc_started
+    with _ALLOC_LOCK:
+        snapshot = tracemalloc.take_snapshot()
+        _alloc_users -= 1
+        if _alloc_users == 0 and _alloc_started:
+            tracemalloc.stop()
+            _alloc_started = False
+    return snapshot
+
+
+def prune_profiles(directory: Path, keep: int) -> None:
+    """Borra los perfiles más antiguos de la carpeta: deja los `keep` más recientes (con su .alloc.txt)."""
+    perfiles = {}
+    for path in directory.iterdir():
+        suffix = next((x for x in PROFILE_SUFFIXES if path.name.endswith(x)), None)
+        if suffix is None:
+            continue
+        try:
+            mtime = path.stat().st_mtime
+        except OSError:
+            continue  # otra sesión acaba de podarlo
+        base = path.name[:-len(suffix)]
+        perfiles[base] = max(mtime, perfiles.get(base, 0.0))
+    for base in sorted(perfiles, key=perfiles.get, reverse=True)[max(1, keep):]:
+        for suffix in PROFILE_SUFFIXES:
+            (directory / f"{base}{suffix}").unlink(missing_ok=True)
+
+
+def _write_alloc_report(path: Path, snapshot: tracemalloc.Snapshot, top_n: int) -> None:
+    snapshot = snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        tracemalloc.Filter(False, "<unknown>"),
+    ))
+    stats = snapshot.statistics("lineno")
+    total = sum(s.size for s in stats)
+    lines = [f"# Top {top_n} asignaciones vivas al final de la recarga (total {total / 1024:.1f} KiB)"]
+    for i, stat in enumerate(stats[:top_n], 1):
+        frame = stat.traceback[0]
+        lines.append(f"{i:>3}. {stat.size / 1024:10.1f} KiB {stat.count:>8} bloques  {frame.filename}:{frame.lineno}")
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+@contextmanager
+def profile_to_dir(directory: str, name: str, interval: float = 0.005, alloc_top: int = 0,
+                   keep: int = 50) -> Iterator[ProfileResult]:
+    """
+    Perfila el bloque y guarda el resultado en `directory`.
+
+    Parámetros:
+    - directory (str): Carpeta de perfiles (se crea si no existe)
+    - name (str): Nombre base de los ficheros
+    - interval (float): Intervalo de muestreo en segundos
+    - alloc_top (int): Si > 0, activa tracemalloc y guarda el top-N en <name>.alloc.txt
+    - keep (int): Perfiles que se conservan en la carpeta (los más recientes)
+
+    Retorna (yield):
+    - ProfileResult: Se completa al salir del bloque (también si sale con excepción)
+
+    Con varias sesiones perfilando asignaciones a la vez, cada informe incluye
+    también lo que asignen las demás en ese intervalo.
+    """
+    out_dir = Path(directory)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    result = ProfileResult()
+
+    if alloc_top > 0:
+        _acquire_tracing()
+
+    sampler = SamplingProfiler(interval)
+    start = time.perf_counter()
+    sampler.start()
+    try:
+        yield result
+    finally:
+        sampler.stop()
+        result.duration = time.perf_counter() - start
+        result.samples = sampler.samples
+        snapshot = _release_tracing() if alloc_top > 0 else None
+        with _WRITE_LOCK:
+            result.folded_path = out_dir / f"{name}.folded"
+            result.folded_path.write_text(sampler.folded(), encoding="utf-8")
+            if snapshot is not None:
+                result.alloc_path = out_dir / f"{name}.alloc.txt"
+                _write_alloc_report(result.alloc_path, snapshot, alloc_top)
+            prune_profiles(out_dir, keep)
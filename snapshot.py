@@ -0,0 +1,154 @@
+"""
+Instantánea compartida de los maestros procesados (Arrow IPC en memoria mapeada).
+
+El primer proceso que construye una versión del maestro (hash del fichero) la
+publica como ficheros Arrow IPC sin comprimir:
+
+    <raíz>/<versión>/<frame>.arrow
+
+Los demás procesos de la aplicación (varios detrás de un proxy en el cierre de
+mes) la abren con pa.memory_map: no vuelven a parsear el Excel y las columnas
+de texto y numéricas apuntan a las páginas del fichero, que el sistema
+operativo comparte entre procesos. Con la raíz en /dev/shm las páginas viven
+en RAM y cada proceso extra apenas añade memoria.
+
+La publicación es atómica (carpeta temporal + rename) y una versión publicada
+no se modifica nunca: si el maestro cambia, cambia su hash y es otra versión.
+Se conservan las `keep` versiones más recientes; borrar una que otro proceso
+tiene mapeada es seguro (el mapeo sigue vivo hasta que la suelta).
+
+Uso:
+    from snapshot import SnapshotStore
+
+    store = SnapshotStore("/dev/shm/incidencias_maestros")
+    frames = store.load(version)             # None si no está publicada
+    if frames is None:
+        frames = construir_maestro()
+        store.publish(version, frames)
+"""
+
+import json
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+
+EXTENSION = ".arrow"
+FICHERO_META = "meta.json"
+
+
+class SnapshotStore:
+    """
+    Carpeta de instantáneas de maestros, una subcarpeta por versión.
+
+    Parámetros:
+    - root (str): Carpeta raíz (se crea al publicar)
+    - keep (int): Versiones que se conservan al publicar una nueva
+    """
+
+    def __init__(self, root: str, keep: int = 3):
+        self.root = Path(root)
+        self.keep = max(1, keep)
+
+    def _carpeta(self, version: str) -> Path:
+        return self.root / version
+
+    def load(self, version: str) -> Optional[Dict[str, pd.DataFrame]]:
+        """
+        Abre una versión publicada sin copiarla.
+
+        Parámetros:
+        - version (str): Identificador de la versión (hash del maestro + formato)
+
+        Retorna:
+        - Dict[str, pd.DataFrame]: frame → DataFrame respaldado por el fichero
+          mapeado; None si la versión no está publicada o no se puede leer
+        """
+        carpeta = self._carpeta(version)
+        meta = carpeta / FICHERO_META
+        if not meta.exists():
+            return None
+        try:
+            nombres = json.loads(meta.read_text(encoding="utf-8"))["frames"]
+            frames = {}
+            for nombre in nombres:
+                # Sin cerrar el mapeo: los buffers de la tabla apuntan a él
+                fuente = pa.memory_map(str(carpeta / f"{nombre}{EXTENSION}"), "r")
+                frames[nombre] = pa.ipc.open_file(fuente).read_all().to_pandas()
+            os.utime(carpeta)  # marca de uso para la poda
+            return frames
+        except (OSError, KeyError, ValueError, pa.ArrowException):
+            return None
+
+    def publish(self, version: str, frames: Dict[str, pd.DataFrame]) -> Optional[Path]:
+        """
+        Publica una versión (no hace nada si ya existe).
+
+        Parámetros:
+        - version (str): Identificador de la versión
+        - frames (Dict[str, pd.DataFrame]): frame → DataFrame (se conservan los
+          tipos: categóricos como diccionarios Arrow, enteros reducidos, etc.)
+
+        Retorna:
+        - Path: Carpeta de la versión; None si no se pudo escribir (p. ej. una
+          columna con tipos mezclados que Arrow no admite): la aplicación sigue
+          funcionando, solo que sin compartir
+        """
+        destino = self._carpeta(version)
+        if (destino / FICHERO_META).exists():
+            return destino
+        tmp = self.root / f".{version}.{os.getpid()}.{uuid.uuid4().hex[:6]}.tmp"
+        try:
+            tmp.mkdir(parents=True)
+            for nombre, df in frames.items():
+                tabla = pa.Table.from_pandas(df, preserve_index=False)
+                with pa.OSFile(str(tmp / f"{nombre}{EXTENSION}"), "wb") as sink:
+                    with pa.ipc.new_file(sink, tabla.schema) as writer:
+                        writer.write_table(tabla)
+            (tmp / FICHERO_META).write_text(json.dumps({
+                "version": version, "frames": list(frames), "created_at": time.time(), "pid": os.getpid(),
+            }), encoding="utf-8")
+            os.rename(tmp, destino)
+        except OSError:
+            # Otro proceso publicó la misma versión a la vez: vale la suya
+            shutil.rmtree(tmp, ignore_errors=True)
+            return destino if (destino / FICHERO_META).exists() else None
+        except (pa.ArrowException, ValueError, TypeError):
+            shutil.rmtree(tmp, ignore_errors=True)
+            return None
+        self._prune()
+        return destino
+
+    def versions(self) -> List[Dict]:
+        """
+        Versiones publicadas, de la más reciente a la más antigua.
+
+        Retorna:
+        - List[Dict]: version, frames, bytes, usado (fecha del último load/publish)
+        """
+        if not self.root.is_dir():
+            return []
+        filas = []
+        for carpeta in self.root.iterdir():
+            if carpeta.name.startswith(".") or not (carpeta / FICHERO_META).exists():
+                continue
+            try:
+                ficheros = list(carpeta.glob(f"*{EXTENSION}"))
+                filas.append({
+                    "version": carpeta.name,
+                    "frames": len(ficheros),
+                    "bytes": sum(f.stat().st_size for f in ficheros),
+                    "usado": carpeta.stat().st_mtime,
+                })
+            except OSError:
+                continue  # otro proceso la está podando
+        return sorted(filas, key=lambda f: f["usado"], reverse=True)
+
+    def _prune(self) -> None:
+        for vieja in self.versions()[self.keep:]:
+            shutil.rmtree(self._carpeta(vieja["version"]), ignore_errors=True)
@@ -0,0 +1,466 @@
+"""
+Instrumentación ligera por recarga (rerun) de la aplicación.
+
+Cada recarga de Streamlit se mide como una traza compuesta de spans por fase
+(cabecera, pestañas, página de la tabla, guardado, métricas, exportación).
+Las duraciones se agregan en histogramas de buckets fijos (estilo Prometheus)
+y los contadores registran aciertos/fallos de las cachés de hojas y lookups.
+
+El registro es global al proceso: sobrevive a las recargas del script
+principal porque vive en este módulo importado, y agrega todas las sesiones.
+
+Uso:
+    from telemetry import REGISTRY, rerun_trace, span, timed
+
+    with rerun_trace():
+        with span("header"):
+            ...
+
+    @timed("metrics")
+    def calcular(...): ...
+
+    REGISTRY.to_prometheus({"pid": "123"})   # texto para el textfile collector
+    REGISTRY.to_json()         # snapshot con p50/p95/p99 por fase
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# =============================================================================
+# CONSTANTES
+# =============================================================================
+
+METRIC_PREFIX = "incidencias"
+
+# Límites superiores de los buckets en segundos (el bucket +Inf es implícito)
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    body = ",".join(f'{k}="{_escape(v)}"' for k, v in pairs)
+    return "{" + body + "}"
+
+
+def _format_bound(bound: float) -> str:
+    return "+Inf" if bound == float("inf") else repr(float(bound))
+
+
+# =============================================================================
+# HISTOGRAMA Y REGISTRO
+# =============================================================================
+
+class Histogram:
+    """
+    Histograma de buckets fijos con suma y recuento.
+
+    Parámetros:
+    - bounds (Tuple[float, ...]): Límites superiores ordenados (sin +Inf)
+    """
+
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.bounds = tuple(bounds) + (float("inf"),)
+        self.counts = [0] * len(self.bounds)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """
+        Estima el cuantil q con interpolación lineal dentro del bucket.
+
+        Misma semántica que histogram_quantile() de Prometheus: si el cuantil
+        cae en el bucket +Inf se devuelve el último límite finito.
+        """
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        lower = 0.0
+        for bound, n in zip(self.bounds, self.counts):
+            if cumulative + n >= rank and n > 0:
+                if bound == float("inf"):
+                    return self.bounds[-2]
+                return lower + (bound - lower) * (rank - cumulative) / n
+            cumulative += n
+            if bound != float("inf"):
+                lower = bound
+        return self.bounds[-2]
+
+    def cumulative_counts(self) -> List[int]:
+        total = 0
+        out = []
+        for n in self.counts:
+            total += n
+            out.append(total)
+        return out
+
+
+class MetricsRegistry:
+    """
+    Registro thread-safe de histogramas y contadores etiquetados.
+
+    Los nombres se exportan con el prefijo METRIC_PREFIX. Streamlit ejecuta
+    cada sesión en su propio hilo, de ahí el lock.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._help: Dict[str, str] = {}
+        self.started_at = time.time()
+
+    def describe(self, name: str, help_text: str) -> None:
+        """Registra el texto HELP de una métrica."""
+        self._help[name] = help_text
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = Histogram(self.buckets)
+            hist.observe(value)
+
+    def inc(self, name: str, amount: float = 1.0, **labels: str) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + amount
+
+    def counter(self, name: str, **labels: str) -> float:
+        with self._lock:
+            return self._counters.get(name, {}).get(_label_key(labels), 0.0)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self.started_at = time.time()
+
+    # -------------------------------------------------------------------------
+    # Exportación
+    # -------------------------------------------------------------------------
+
+    def snapshot(self) -> Dict:
+        """
+        Retorna un dict serializable con histogramas (p50/p95/p99) y contadores.
+
+        Estructura:
+        - histograms: {nombre: [{labels, count, sum, p50, p95, p99}]}
+        - counters: {nombre: [{labels, value}]}
+        """
+        with self._lock:
+            histograms = {
+                name: [
+                    {
+                        "labels": dict(key),
+                        "count": h.count,
+                        "sum": round(h.sum, 6),
+                        "p50": round(h.quantile(0.50), 6),
+                        "p95": round(h.quantile(0.95), 6),
+                        "p99": round(h.quantile(0.99), 6),
+                    }
+                    for key, h in sorted(series.items())
+                ]
+                for name, series in self._histograms.items()
+            }
+            counters = {
+                name: [{"labels": dict(key), "value": v} for key, v in sorted(series.items())]
+                for name, series in self._counters.items()
+            }
+        return {
+            "generated_at": time.time(),
+            "started_at": self.started_at,
+            "histograms": histograms,
+            "counters": counters,
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), ensure_ascii=False, indent=2)
+
+    def to_prometheus(self, const_labels: Optional[Dict[str, str]] = None) -> str:
+        """
+        Serializa el registro en el formato de exposición de texto de Prometheus.
+
+        const_labels se añaden a todas las series (p. ej. {"pid": ...}: con varios
+        procesos, cada uno expone las suyas sin chocar con las de los demás).
+        """
+        const = _label_key(const_labels or {})
+        lines: List[str] = []
+        with self._lock:
+            for name, series in sorted(self._histograms.items()):
+                full = f"{METRIC_PREFIX}_{name}"
+                if name in self._help:
+                    lines.append(f"# HELP {full} {self._help[name]}")
+                lines.append(f"# TYPE {full} histogram")
+                for key, h in sorted(series.items()):
+                    key = const + key
+                    for bound, cum in zip(h.bounds, h.cumulative_counts()):
+                        lines.append(f"{full}_bucket{_format_labels(key, ('le', _format_bound(bound)))} {cum}")
+                    lines.append(f"{full}_sum{_format_labels(key)} {h.sum:.6f}")
+                    lines.append(f"{full}_count{_format_labels(key)} {h.count}")
+            for name, series in sorted(self._counters.items()):
+                full = f"{METRIC_PREFIX}_{name}"
+                if name in self._help:
+                    lines.append(f"# HELP {full} {self._help[name]}")
+                lines.append(f"# TYPE {full} counter")
+                for key, value in sorted(series.items()):
+                    key = const + key
+                    lines.append(f"{full}{_format_labels(key)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+REGISTRY.describe("phase_seconds", "Duración de cada fase de render por recarga")
+REGISTRY.describe("rerun_seconds", "Duración total de la recarga del script")
+REGISTRY.describe("cache_requests_total", "Llamadas a funciones cacheadas")
+REGISTRY.describe("cache_misses_total", "Llamadas que ejecutaron la función (fallo de caché)")
+REGISTRY.describe("cache_evictions_total", "Entradas desalojadas por la política de versiones")
+
+
+# =============================================================================
+# SPANS
+# =============================================================================
+
+_local = threading.local()
+
+
+@contextmanager
+def span(phase: str, registry: MetricsRegistry = REGISTRY) -> Iterator[None]:
+    """
+    Mide la duración de una fase y la añade al histograma phase_seconds.
+
+    Si hay una traza de recarga activa en el hilo, la fase se anota también
+    en ella para el desglose de la última recarga. Se registra aunque la fase
+    termine con excepción (p. ej. st.rerun()).
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        registry.observe("phase_seconds", elapsed, phase=phase)
+        trace = getattr(_local, "trace", None)
+        if trace is not None:
+            trace.append((phase, elapsed))
+
+
+def timed(phase: str) -> Callable:
+    """Decorador equivalente a envolver el cuerpo de la función en span(phase)."""
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(phase):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def rerun_trace(
+    on_finish: Optional[Callable[[List[Tuple[str, float]], float], None]] = None,
+    registry: MetricsRegistry = REGISTRY,
+) -> Iterator[List[Tuple[str, float]]]:
+    """
+    Abre la traza de una recarga completa.
+
+    Parámetros:
+    - on_finish (Optional[Callable]): Recibe (fases, segundos_totales) al cerrar
+    - registry (MetricsRegistry): Registro destino
+
+    Retorna (yield):
+    - List[Tuple[str, float]]: Lista de (fase, segundos) que se va rellenando
+    """
+    trace: List[Tuple[str, float]] = []
+    previous = getattr(_local, "trace", None)
+    _local.trace = trace
+    start = time.perf_counter()
+    try:
+        yield trace
+    finally:
+        elapsed = time.perf_counter() - start
+        _local.trace = previous
+        registry.observe("rerun_seconds", elapsed)
+        if on_finish is not None:
+            on_finish(trace, elapsed)
+
+
+def count_cache_request(cache: str, registry: MetricsRegistry = REGISTRY) -> None:
+    """Anota una llamada a la caché indicada."""
+    registry.inc("cache_requests_total", cache=cache)
+
+
+def count_cache_miss(cache: str, registry: MetricsRegistry = REGISTRY) -> None:
+    """Anota un fallo (la función cacheada se ejecutó) en la caché indicada."""
+    registry.inc("cache_misses_total", cache=cache)
+
+
+def count_cache_eviction(cache: str, entries: int = 1, registry: MetricsRegistry = REGISTRY) -> None:
+    """Anota entradas desalojadas de la caché indicada (versión del maestro antigua)."""
+    registry.inc("cache_evictions_total", float(entries), cache=cache)
+
+
+def cache_stats(registry: MetricsRegistry = REGISTRY) -> List[Dict]:
+    """
+    Resume aciertos/fallos por caché.
+
+    Retorna:
+    - List[Dict]: [{cache, requests, misses, hits, hit_ratio, evictions}]
+    """
+    snap = registry.snapshot()["counters"]
+    misses = {e["labels"].get("cache"): e["value"] for e in snap.get("cache_misses_total", [])}
+    evictions = {e["labels"].get("cache"): e["value"] for e in snap.get("cache_evictions_total", [])}
+    out = []
+    for entry in snap.get("cache_requests_total", []):
+        name = entry["labels"].get("cache")
+        requests = entry["value"]
+        miss = misses.get(name, 0.0)
+        hits = max(requests - miss, 0.0)
+        out.append({
+            "cache": name,
+            "requests": int(requests),
+            "misses": int(miss),
+            "hits": int(hits),
+            "hit_ratio": round(hits / requests, 4) if requests else 0.0,
+            "evictions": int(evictions.get(name, 0.0)),
+        })
+    return out
+
+
+# =============================================================================
+# EXPORTACIÓN A DISCO
+# =============================================================================
+
+class MetricsExporter:
+    """
+    Vuelca las métricas a disco para gráficas externas.
+
+    - reruns.jsonl: una línea JSON por recarga con el desglose por fase
+      (permite calcular p95 exactos fuera de la app). Al pasar de
+      `max_log_bytes` rota a reruns.jsonl.1 ... .<backups> (se pierde el más
+      antiguo): el disco ocupado queda acotado
+    - metrics.<pid>.prom: exposición Prometheus del registro del proceso,
+      reescrita de forma atómica como mucho cada `interval` segundos. Cada
+      proceso de la app (varios tras el proxy) tiene su fichero y sus series
+      llevan la etiqueta pid: el textfile collector de node_exporter lee todos
+      los *.prom de la carpeta y en Prometheus se agregan con
+      sum without (pid) (...). Al arrancar se borran los de procesos que ya
+      no existen
+
+    Parámetros:
+    - directory (str): Carpeta de salida (se crea si no existe)
+    - interval (float): Segundos mínimos entre reescrituras de metrics.<pid>.prom
+    - max_log_bytes (int): Tamaño a partir del cual rota reruns.jsonl (0 = sin log)
+    - backups (int): Ficheros rotados que se conservan
+    """
+
+    def __init__(self, directory: str, interval: float = 30.0, registry: MetricsRegistry = REGISTRY,
+                 max_log_bytes: int = 10 * 1024 * 1024, backups: int = 3):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.interval = interval
+        self.max_log_bytes = max_log_bytes
+        self.backups = max(1, backups)
+        self.registry = registry
+        self._lock = threading.Lock()
+        self._last_flush = 0.0
+        self._prune_prometheus()
+
+    @property
+    def prom_path(self) -> Path:
+        return self.directory / f"metrics.{os.getpid()}.prom"
+
+    @property
+    def log_path(self) -> Path:
+        return self.directory / "reruns.jsonl"
+
+    def record_rerun(self, phases: List[Tuple[str, float]], total: float, **context: str) -> None:
+        """Añade la recarga al log JSON (si está activo) y reescribe metrics.<pid>.prom si toca."""
+        entry = {
+            "ts": round(time.time(), 3),
+            "pid": os.getpid(),
+            "rerun_seconds": round(total, 6),
+            "phases": [[phase, round(seconds, 6)] for phase, seconds in phases],
+            **context,
+        }
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            if self.max_log_bytes > 0:
+                with open(self.log_path, "a", encoding="utf-8") as fh:
+                    fh.write(line)
+                    size = fh.tell()
+                if size >= self.max_log_bytes:
+                    self._rotate_log()
+            now = time.monotonic()
+            if now - self._last_flush >= self.interval:
+                self._last_flush = now
+                self._write_prometheus()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._last_flush = time.monotonic()
+            self._write_prometheus()
+
+    def _rotate_log(self) -> None:
+        """reruns.jsonl → .1 → .2 ... (otro proceso puede haber rotado ya: se ignora)."""
+        try:
+            for i in range(self.backups - 1, 0, -1):
+                origen = self.log_path.with_name(f"{self.log_path.name}.{i}")
+                if origen.exists():
+                    os.replace(origen, self.log_path.with_name(f"{self.log_path.name}.{i + 1}"))
+            os.replace(self.log_path, self.log_path.with_name(f"{self.log_path.name}.1"))
+        except OSError:
+            pass
+
+    def _write_prometheus(self) -> None:
+        tmp = self.prom_path.with_suffix(".prom.tmp")
+        tmp.write_text(self.registry.to_prometheus({"pid": str(os.getpid())}), encoding="utf-8")
+        os.replace(tmp, self.prom_path)
+
+    def _prune_prometheus(self) -> None:
+        """Borra los metrics.<pid>.prom de procesos muertos (y el metrics.prom común de versiones anteriores)."""
+        for path in self.directory.glob("metrics*.prom"):
+            pid = path.name[len("metrics."):-len(".prom")]
+            if pid.isdigit():
+                try:
+                    os.kill(int(pid), 0)
+                    continue
+                except ProcessLookupError:
+                    pass
+                except PermissionError:
+                    continue  # existe, de otro usuario
+            try:
+                path.unlink()
+            except OSError:
+                pass
@@ -0,0 +1,587 @@
+"""
+Lector en streaming de hojas .xlsx basado en iterparse sobre el XML de la hoja.
+
+A diferencia de pd.read_excel/openpyxl no construye objetos celda ni la
+rejilla completa: recorre las filas una a una, materializa solo las columnas
+proyectadas y entrega bloques de columnas ya tipadas (arrays de NumPy).
+La memoria pico queda acotada por el tamaño de bloque, no por el de la hoja.
+
+Uso:
+    from xlsx_stream import read_sheet, iter_sheet_chunks
+
+    df = read_sheet("data/maestros.xlsx", "Trabajadores",
+                    columns=["nombre_empleado", "centro_preferente"])
+
+    for chunk in iter_sheet_chunks(path, "Incidencias", header_row=2, chunk_size=5000):
+        ...  # chunk: Dict[str, np.ndarray]
+"""
+
+import os
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+from typing import Callable, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+# =============================================================================
+# CONSTANTES
+# =============================================================================
+
+_NS_MAIN = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_NS_REL = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+_NS_PKG_REL = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+_TAG_ROW = f"{_NS_MAIN}row"
+_TAG_C = f"{_NS_MAIN}c"
+_TAG_V = f"{_NS_MAIN}v"
+_TAG_IS = f"{_NS_MAIN}is"
+_TAG_T = f"{_NS_MAIN}t"
+_TAG_SI = f"{_NS_MAIN}si"
+_TAG_RPH = f"{_NS_MAIN}rPh"
+_TAG_SHEETDATA = f"{_NS_MAIN}sheetData"
+
+# Formatos de número integrados de Excel que representan fechas/horas
+_BUILTIN_DATE_FORMATS = set(range(14, 23)) | {27, 30, 36, 45, 46, 47, 50, 57}
+
+_CELL_REF_RE = re.compile(r"([A-Z]+)")
+
+ColumnSpec = Union[str, int]
+# Proyección: columnas, {columna: nombre de salida} o una función que recibe la
+# cabecera (nombres ya desambiguados) y devuelve cualquiera de las dos
+Projection = Union[
+    Sequence[ColumnSpec], Mapping[ColumnSpec, str],
+    Callable[[List[str]], Union[Sequence[ColumnSpec], Mapping[ColumnSpec, str]]],
+]
+
+
+
+class SheetSchemaError(ValueError):
+    """
+    La cabecera de una hoja no tiene las columnas que espera quien la lee.
+
+    Vive aquí y no en la aplicación: el script principal se vuelve a ejecutar
+    en cada recarga y una clase definida en él cambiaría de identidad entre
+    recargas (un except no capturaría la de la recarga anterior).
+    """
+
+# =============================================================================
+# UTILIDADES
+# =============================================================================
+
+def column_letter_to_index(letters: str) -> int:
+    """Convierte letras de columna Excel a índice 0-based ("A" → 0, "AB" → 27)."""
+    idx = 0
+    for ch in letters.upper():
+        idx = idx * 26 + (ord(ch) - 64)
+    return idx - 1
+
+
+def usecols_to_indices(usecols: str) -> List[int]:
+    """
+    Convierte una especificación tipo pandas ("A:C", "A,C:E") a índices 0-based.
+
+    Parámetros:
+    - usecols (str): Rango(s) de letras separados por comas
+
+    Retorna:
+    - List[int]: Índices de columna ordenados
+    """
+    indices = set()
+    for part in usecols.replace(" ", "").split(","):
+        if not part:
+            continue
+        if ":" in part:
+            start, end = part.split(":", 1)
+            indices.update(range(column_letter_to_index(start), column_letter_to_index(end) + 1))
+        else:
+            indices.add(column_letter_to_index(part))
+    return sorted(indices)
+
+
+def _norm_header(value) -> str:
+    """Normaliza una cabecera: espacios y saltos de línea colapsados."""
+    return re.sub(r"\s+", " ", str(value)).strip()
+
+
+def sheet_member(zf: zipfile.ZipFile, sheet_name: Optional[str]) -> str:
+    """
+    Resuelve la ruta interna (xl/worksheets/sheetN.xml) de una hoja por nombre.
+
+    Parámetros:
+    - zf (zipfile.ZipFile): Libro abierto
+    - sheet_name (Optional[str]): Hoja (None = primera hoja)
+
+    Retorna:
+    - str: Ruta del XML de la hoja dentro del zip
+    """
+    workbook = ET.fromstring(zf.read("xl/workbook.xml"))
+    rels = ET.fromstring(zf.read("xl/_rels/workbook.xml.rels"))
+    targets = {r.get("Id"): r.get("Target") for r in rels.iter(f"{_NS_PKG_REL}Relationship")}
+
+    sheets = list(workbook.iter(f"{_NS_MAIN}sheet"))
+    if not sheets:
+        raise KeyError("El libro no contiene hojas")
+    if sheet_name is None:
+        chosen = sheets[0]
+    else:
+        chosen = next((s for s in sheets if s.get("name") == sheet_name), None)
+        if chosen is None:
+            raise KeyError(f"No existe la hoja '{sheet_name}'")
+
+    target = targets[chosen.get(f"{_NS_REL}id")].lstrip("/")
+    return target if target.startswith("xl/") else f"xl/{target}"
+
+
+def sheet_names(file_path: str) -> List[str]:
+    """Nombres de las hojas del libro, leyendo solo xl/workbook.xml."""
+    with zipfile.ZipFile(file_path) as zf:
+        workbook = ET.fromstring(zf.read("xl/workbook.xml"))
+    return [s.get("name") for s in workbook.iter(f"{_NS_MAIN}sheet")]
+
+
+def sheet_fingerprints(file_path: str, sheets: Sequence[Optional[str]]) -> Dict[Optional[str], str]:
+    """
+    Huella de varias hojas de un libro sin descomprimirlas.
+
+    Parámetros:
+    - file_path (str): Libro .xlsx
+    - sheets (Sequence[Optional[str]]): Hojas (None = primera hoja)
+
+    Retorna:
+    - Dict[Optional[str], str]: hoja → "<crc hoja>-<crc sharedStrings>-<tamaño>";
+      las hojas que no existen no aparecen
+
+    Nota: Un .xlsx es un zip; el CRC32 de cada parte ya está en el directorio
+    central, así que la huella cuesta lo mismo con 1 KB que con 50 MB. Los
+    textos viven en sharedStrings, común a todas las hojas: cambiar un texto
+    cambia la huella de todas las hojas del libro; cambiar un número, solo la
+    de su hoja.
+    """
+    huellas = {}
+    with zipfile.ZipFile(file_path) as zf:
+        try:
+            shared = zf.getinfo("xl/sharedStrings.xml").CRC
+        except KeyError:
+            shared = 0
+        for sheet in sheets:
+            try:
+                info = zf.getinfo(sheet_member(zf, sheet))
+            except KeyError:
+                continue
+            huellas[sheet] = f"{info.CRC:08x}-{shared:08x}-{info.file_size}"
+    return huellas
+
+
+def sheet_fingerprint(file_path: str, sheet_name: Optional[str]) -> str:
+    """
+    Huella de una hoja (ver sheet_fingerprints).
+
+    Retorna:
+    - str: Huella, o "FILE_NOT_FOUND" si el libro no existe
+
+    Lanza KeyError si la hoja no existe.
+    """
+    if not os.path.exists(file_path):
+        return "FILE_NOT_FOUND"
+    huellas = sheet_fingerprints(file_path, [sheet_name])
+    if sheet_name not in huellas:
+        raise KeyError(f"No existe la hoja '{sheet_name}'")
+    return huellas[sheet_name]
+
+
+def _load_shared_strings(zf: zipfile.ZipFile) -> List[str]:
+    """Lee la tabla de cadenas compartidas en streaming (ignora textos fonéticos)."""
+    try:
+        handle = zf.open("xl/sharedStrings.xml")
+    except KeyError:
+        return []
+    strings = []
+    with handle:
+        for _, elem in ET.iterparse(handle, events=("end",)):
+            if elem.tag == _TAG_SI:
+                for rph in elem.findall(_TAG_RPH):
+                    elem.remove(rph)
+                strings.append("".join(t.text or "" for t in elem.iter(_TAG_T)))
+                elem.clear()
+    return strings
+
+
+def _load_date_styles(zf: zipfile.ZipFile) -> Tuple[set, bool]:
+    """
+    Determina qué índices de estilo (atributo s de la celda) son fechas.
+
+    Retorna:
+    - Tuple[set, bool]: (índices de estilo con formato fecha, libro en sistema 1904)
+    """
+    date1904 = False
+    try:
+        workbook = ET.fromstring(zf.read("xl/workbook.xml"))
+        pr = workbook.find(f"{_NS_MAIN}workbookPr")
+        date1904 = pr is not None and pr.get("date1904") in ("1", "true")
+    except KeyError:
+        pass
+
+    try:
+        styles = ET.fromstring(zf.read("xl/styles.xml"))
+    except KeyError:
+        return set(), date1904
+
+    custom_dates = set()
+    num_fmts = styles.find(f"{_NS_MAIN}numFmts")
+    if num_fmts is not None:
+        for fmt in num_fmts:
+            code = re.sub(r'"[^"]*"|\[[^\]]*\]|\\.', "", fmt.get("formatCode", "")).lower()
+            if re.search(r"[dmyhs]", code) and not re.search(r"[0#]", code):
+                custom_dates.add(int(fmt.get("numFmtId")))
+
+    date_styles = set()
+    cell_xfs = styles.find(f"{_NS_MAIN}cellXfs")
+    if cell_xfs is not None:
+        for idx, xf in enumerate(cell_xfs):
+            fmt_id = int(xf.get("numFmtId", "0"))
+            if fmt_id in _BUILTIN_DATE_FORMATS or fmt_id in custom_dates:
+                date_styles.add(idx)
+    return date_styles, date1904
+
+
+def _mangle_headers(raw: Dict[int, str], width: int) -> List[str]:
+    """Nombres de columna al estilo pandas: vacíos → 'Unnamed: i', repetidos → 'x.1'."""
+    names, seen = [], {}
+    for i in range(width):
+        name = raw.get(i)
+        name = f"Unnamed: {i}" if name is None or str(name).strip() == "" else str(name)
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+# =============================================================================
+# TIPADO DE COLUMNAS
+# =============================================================================
+
+class _Date(float):
+    """Marca un número de serie Excel que procede de una celda con formato fecha."""
+
+
+def _serials_to_datetime(serials: np.ndarray, epoch: np.datetime64) -> np.ndarray:
+    """Números de serie (NaN = vacío) → datetime64[ns] (NaT)."""
+    out = np.full(len(serials), np.datetime64("NaT"), dtype="datetime64[ns]")
+    ok = ~np.isnan(serials)
+    out[ok] = epoch + (serials[ok] * 86_400_000_000).round().astype("int64").astype("timedelta64[us]")
+    return out
+
+
+def _to_array(values: List, dtype: Optional[str], epoch: np.datetime64) -> np.ndarray:
+    """
+    Convierte los valores de una columna de un bloque a un array tipado.
+
+    Parámetros:
+    - values (List): Valores crudos (float, str, bool, _Date o None)
+    - dtype (Optional[str]): 'str', 'float', 'int', 'datetime' o None (inferir)
+    - epoch (np.datetime64): Origen de los números de serie de fecha
+
+    Retorna:
+    - np.ndarray: float64/int64/datetime64[ns]/bool u object según el contenido.
+      Una columna con celdas de fecha y números sin formato de fecha sale
+      object con las fechas como Timestamp y los números como float (igual
+      que pd.read_excel): no se pierden las fechas ni se inventan
+    """
+    if dtype == "str":
+        return np.array([None if v is None else str(v) for v in values], dtype=object)
+
+    plain = values
+    non_null = [v for v in plain if v is not None]
+
+    if dtype == "datetime" or (dtype is None and non_null and all(isinstance(v, _Date) for v in non_null)):
+        serials = np.array([np.nan if v is None or isinstance(v, str) else float(v) for v in plain], dtype="float64")
+        return _serials_to_datetime(serials, epoch)
+
+    if dtype in ("float", "int") or (dtype is None and non_null and all(isinstance(v, float) and not isinstance(v, _Date) for v in non_null)):
+        arr = np.array([np.nan if v is None or isinstance(v, (str, bool)) else float(v) for v in plain], dtype="float64")
+        if dtype == "int" or (dtype is None and len(non_null) == len(plain) and np.all(arr == np.round(arr)) and np.all(np.abs(arr) < 2**53)):
+            if not np.isnan(arr).any():
+                return arr.astype("int64")
+        return arr
+
+    if dtype is None and non_null and all(isinstance(v, bool) for v in non_null) and len(non_null) == len(plain):
+        return np.array(plain, dtype=bool)
+
+    out = np.array([None if v is None else (float(v) if isinstance(v, _Date) else v) for v in plain], dtype=object)
+    fechas = [i for i, v in enumerate(plain) if isinstance(v, _Date)]
+    if fechas:
+        convertidas = _serials_to_datetime(np.array([float(plain[i]) for i in fechas]), epoch)
+        for i, valor in zip(fechas, convertidas):
+            out[i] = pd.Timestamp(valor)
+    return out
+
+
+def _settle_column(arrays: List[np.ndarray]) -> np.ndarray:
+    """
+    Une los bloques de una columna con un único tipo para toda la hoja.
+
+    Cada bloque se tipa por separado (_to_array): uno sin valores sale object,
+    otro con un número suelto en una columna de fechas sale object... y al
+    unirlos la columna dependería de dónde caen los huecos y del tamaño de
+    bloque. Aquí se decide el tipo con todos los bloques, con las mismas
+    reglas que _to_array aplicaría a la columna entera.
+
+    Parámetros:
+    - arrays (List[np.ndarray]): Bloques de la columna, en orden
+
+    Retorna:
+    - np.ndarray: Columna completa
+    """
+    def vacio(arr: np.ndarray) -> bool:
+        return arr.dtype == object and all(v is None for v in arr)
+
+    kinds = {arr.dtype.kind for arr in arrays if not vacio(arr)}
+    huecos = any(vacio(arr) for arr in arrays)
+    if not kinds or (len(kinds) == 1 and not huecos):
+        return np.concatenate(arrays)
+
+    if kinds == {"M"}:
+        return np.concatenate([
+            np.full(len(arr), np.datetime64("NaT"), dtype="datetime64[ns]") if vacio(arr) else arr
+            for arr in arrays
+        ])
+    if kinds <= {"i", "f"}:
+        return np.concatenate([np.full(len(arr), np.nan) if vacio(arr) else arr.astype("float64") for arr in arrays])
+
+    # Tipos incompatibles (fechas con números, booleanos con huecos...): object,
+    # con las fechas como Timestamp, los números como float y los nulos como
+    # None, igual que _to_array sobre la columna entera
+    def como_objeto(arr: np.ndarray) -> np.ndarray:
+        if arr.dtype.kind == "M":
+            return np.array([None if np.isnat(v) else pd.Timestamp(v) for v in arr], dtype=object)
+        if arr.dtype.kind in "if":
+            return np.array([None if np.isnan(v) else float(v) for v in arr.astype("float64")], dtype=object)
+        return arr.astype(object)
+
+    return np.concatenate([como_objeto(arr) for arr in arrays])
+
+
+# =============================================================================
+# LECTURA EN STREAMING
+# =============================================================================
+
+def iter_sheet_chunks(
+    file_path: str,
+    sheet_name: Optional[str] = None,
+    columns: Optional[Projection] = None,
+    header_row: int = 0,
+    chunk_size: int = 10_000,
+    dtypes: Optional[Dict[str, str]] = None,
+) -> Iterator[Dict[str, np.ndarray]]:
+    """
+    Recorre una hoja y entrega bloques de columnas tipadas.
+
+    Parámetros:
+    - file_path (str): Libro .xlsx
+    - sheet_name (Optional[str]): Hoja (None = primera)
+    - columns (Optional[Projection]): Proyección por nombre de cabecera
+      (se admite la cabecera con espacios/saltos de línea colapsados) o por
+      índice 0-based; como dict {columna: nombre de salida} renombra al leer;
+      como función recibe la cabecera y devuelve la proyección (puede lanzar
+      su propio error si falta algo). None = todas las columnas
+    - header_row (int): Fila (0-based) de cabecera; las anteriores se ignoran
+    - chunk_size (int): Filas por bloque
+    - dtypes (Optional[Dict[str, str]]): Tipo forzado por columna:
+      'str' (texto exacto del XML, útil para códigos), 'float', 'int', 'datetime'
+
+    Retorna:
+    - Iterator[Dict[str, np.ndarray]]: Bloques {columna: array}; las columnas
+      mantienen el orden de la proyección (o de la hoja si no hay proyección)
+
+    Excepciones:
+    - KeyError: La hoja no existe o falta alguna columna proyectada por nombre
+
+    Notas:
+    - Las filas completamente vacías (dentro de la proyección) se omiten
+    - Las cadenas vacías se tratan como nulos, igual que pd.read_excel
+    - Las fórmulas devuelven su último valor calculado
+    - Sin tipo forzado, cada bloque se infiere por separado y una columna puede
+      cambiar de tipo entre bloques; read_sheet fija uno para la hoja entera
+    """
+    dtypes = dtypes or {}
+    with zipfile.ZipFile(file_path) as zf:
+        member = sheet_member(zf, sheet_name)
+        shared = _load_shared_strings(zf)
+        date_styles, date1904 = _load_date_styles(zf)
+        epoch = np.datetime64("1904-01-01", "ns") if date1904 else np.datetime64("1899-12-30", "ns")
+
+        selected: Optional[Dict[int, str]] = None   # índice → nombre de salida
+        text_cols = True                             # la cabecera se lee como texto
+        buffers: Dict[int, List] = {}
+        rows_in_chunk = 0
+
+        def _flush() -> Dict[str, np.ndarray]:
+            chunk = {selected[i]: _to_array(buffers[i], dtypes.get(selected[i]), epoch) for i in selected}
+            for i in buffers:
+                buffers[i] = []
+            return chunk
+
+        with zf.open(member) as handle:
+            sheet_data = None
+            for event, elem in ET.iterparse(handle, events=("start", "end")):
+                if event == "start":
+                    if elem.tag == _TAG_SHEETDATA:
+                        sheet_data = elem
+                    continue
+                if elem.tag != _TAG_ROW:
+                    continue
+
+                row_idx = int(elem.get("r", "0")) - 1 if elem.get("r") else None
+                cells = _parse_row(elem, shared, date_styles, selected, text_cols)
+                if sheet_data is not None:
+                    sheet_data.clear()
+
+                if row_idx is not None and row_idx < header_row:
+                    continue
+
+                if selected is None:
+                    selected = _select_columns(cells, columns)
+                    text_cols = {i for i, name in selected.items() if dtypes.get(name) == "str"}
+                    buffers = {i: [] for i in selected}
+                    continue
+
+                if not any(cells.get(i) is not None for i in selected):
+                    continue
+                for i in selected:
+                    buffers[i].append(cells.get(i))
+                rows_in_chunk += 1
+                if rows_in_chunk >= chunk_size:
+                    yield _flush()
+                    rows_in_chunk = 0
+
+        if selected is None:
+            return
+        if rows_in_chunk:
+            yield _flush()
+
+
+def _parse_row(row, shared: List[str], date_styles: set, selected: Optional[Dict[int, str]], text_cols) -> Dict[int, object]:
+    """
+    Extrae los valores de una fila <row>.
+
+    Parámetros:
+    - row (Element): Elemento <row>
+    - shared (List[str]): Cadenas compartidas
+    - date_styles (set): Índices de estilo con formato fecha
+    - selected (Optional[Dict[int, str]]): Columnas a extraer (None = todas)
+    - text_cols (set | bool): Columnas cuyos números se conservan como el texto
+      exacto del XML (True = todas); evita pasar por float los códigos largos
+
+    Retorna:
+    - Dict[int, valor]: índice de columna → float | str | bool | _Date
+    """
+    values = {}
+    next_col = 0
+    for c in row:
+        if c.tag != _TAG_C:
+            continue
+        ref = c.get("r")
+        col = column_letter_to_index(_CELL_REF_RE.match(ref).group(1)) if ref else next_col
+        next_col = col + 1
+        if selected is not None and col not in selected:
+            continue
+
+        t = c.get("t", "n")
+        if t == "inlineStr":
+            is_elem = c.find(_TAG_IS)
+            text = "".join(x.text or "" for x in is_elem.iter(_TAG_T)) if is_elem is not None else ""
+            value = text if text.strip() != "" else None
+        else:
+            v = c.find(_TAG_V)
+            if v is None or v.text is None:
+                continue
+            raw = v.text
+            if t == "s":
+                text = shared[int(raw)]
+                value = text if text.strip() != "" else None
+            elif t in ("str", "inlineStr"):
+                value = raw if raw.strip() != "" else None
+            elif t == "b":
+                value = raw == "1"
+            elif t == "e":
+                value = None
+            else:
+                if text_cols is True or col in text_cols:
+                    value = raw
+                elif c.get("s") is not None and int(c.get("s")) in date_styles:
+                    value = _Date(raw)
+                else:
+                    value = float(raw)
+        if value is not None:
+            values[col] = value
+    return values
+
+
+def _select_columns(header_cells: Dict[int, object], columns: Optional[Projection]) -> Dict[int, str]:
+    """Resuelve la proyección pedida contra la fila de cabecera."""
+    raw_names = {i: str(v) for i, v in header_cells.items()}
+    width = max(raw_names) + 1 if raw_names else 0
+    names = _mangle_headers(raw_names, width)
+
+    if callable(columns):
+        columns = columns(names)
+    if columns is None:
+        return {i: names[i] for i in range(width)}
+    renames = dict(columns) if isinstance(columns, Mapping) else {}
+
+    by_name: Dict[str, int] = {}
+    by_norm: Dict[str, int] = {}
+    for i, name in enumerate(names):
+        by_name.setdefault(name, i)
+        if i in raw_names:
+            by_norm.setdefault(_norm_header(raw_names[i]), i)
+
+    selected: Dict[int, str] = {}
+    missing = []
+    for spec in columns:
+        if isinstance(spec, int):
+            selected[spec] = renames.get(spec) or (names[spec] if spec < width else f"Unnamed: {spec}")
+            continue
+        idx = by_name.get(spec, by_norm.get(_norm_header(spec)))
+        if idx is None:
+            missing.append(spec)
+        else:
+            selected[idx] = renames.get(spec, spec)
+    if missing:
+        raise KeyError(f"Columnas no encontradas en la cabecera: {missing}")
+    return selected
+
+
+def read_sheet(
+    file_path: str,
+    sheet_name: Optional[str] = None,
+    columns: Optional[Projection] = None,
+    header_row: int = 0,
+    chunk_size: int = 10_000,
+    dtypes: Optional[Dict[str, str]] = None,
+) -> pd.DataFrame:
+    """
+    Lee una hoja completa a DataFrame usando iter_sheet_chunks.
+
+    Parámetros: ver iter_sheet_chunks
+
+    Retorna:
+    - pd.DataFrame: Columnas proyectadas (DataFrame vacío si la hoja no tiene cabecera)
+
+    El tipo de cada columna se decide con la hoja entera (_settle_column), no
+    bloque a bloque: no depende de chunk_size ni de dónde caen los huecos.
+    """
+    chunks = list(iter_sheet_chunks(
+        file_path, sheet_name, columns=columns, header_row=header_row,
+        chunk_size=chunk_size, dtypes=dtypes,
+    ))
+    if not chunks:
+        return pd.DataFrame()
+    if len(chunks) == 1:
+        return pd.DataFrame(chunks[0])
+    return pd.DataFrame({name: _settle_column([chunk[name] for chunk in chunks]) for name in chunks[0]})